@@ -0,0 +1,83 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from .dag import DagRun, check_outputs, component_error
+
+SHARED_EXECUTOR_WORKERS = 64
+
+_shared_executor: Optional[Executor] = None
+_shared_executor_lock = threading.Lock()
+
+
+def shared_executor() -> Executor:
+    """
+    Executor the components without `run_async` are run in by async pipelines, created on first use
+    with `SHARED_EXECUTOR_WORKERS` threads and shared by every pipeline of the process.
+    """
+    global _shared_executor
+    with _shared_executor_lock:
+        if _shared_executor is None:
+            _shared_executor = ThreadPoolExecutor(max_workers=SHARED_EXECUTOR_WORKERS,
+                                                  thread_name_prefix="pipeline-component")
+        return _shared_executor
+
+
+def set_shared_executor(executor: Executor):
+    """
+    Replace the shared executor, for example by a larger pool when many runs wait on synchronous generators.
+    The previous executor is not shut down.
+    """
+    global _shared_executor
+    with _shared_executor_lock:
+        _shared_executor = executor
+
+
+async def run_component_async(instance, **inputs) -> Dict[str, Any]:
+    """
+    Run a component without blocking the event loop: natively when it has a `run_async` coroutine method,
+    otherwise by calling `run` in the shared executor.
+    """
+    run_async = getattr(instance, "run_async", None)
+    if run_async is not None:
+        return await run_async(**inputs)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(shared_executor(), functools.partial(instance.run, **inputs))
+
+
+async def run_pipeline_async(pipeline, data: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Await a run of `pipeline`, taking the same `data` and returning the same outputs as `pipeline.run`.
+
+    Every component runs with `run_component_async` as soon as the components it depends on have finished,
+    so independent branches overlap and thousands of runs can wait on async generators in a single event
+    loop. See `DagRun` for the components that are skipped. Pipelines with loops are not supported.
+    """
+    run = DagRun(pipeline, data)
+    pipeline.warm_up()
+    running: Dict[asyncio.Future, str] = {}
+
+    def start(names):
+        for name in names:
+            running[asyncio.ensure_future(_run_node(name, run.instance(name), run.inputs(name)))] = name
+
+    start(run.start())
+    try:
+        while running:
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                start(run.finish(running.pop(task), task.result()))
+    finally:
+        for task in running:
+            task.cancel()
+    return run.outputs
+
+
+async def _run_node(name: str, instance, inputs: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        outputs = await run_component_async(instance, **inputs)
+    except Exception as e:
+        raise component_error(name, e, inputs) from e
+    return check_outputs(name, outputs)
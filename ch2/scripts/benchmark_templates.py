@@ -0,0 +1,52 @@
+"""
+Compares the ways of building prompts from a template, run with `python -m ch2.scripts.benchmark_templates`.
+
+- `PromptBuilder`: a builder created per pipeline, compiling its template, then one run per prompt.
+- `CachedPromptBuilder`: the same with the template taken from the process-wide cache.
+- `render_batch`: every prompt rendered in one call.
+"""
+import argparse
+import timeit
+
+from haystack.preview.components.builders.prompt_builder import PromptBuilder
+
+from .templates import CachedPromptBuilder, render_batch
+
+TEMPLATE = """
+Given the following context, answer the question.
+{% for document in documents %}
+    {{ loop.index }}. {{ document }}
+{% endfor %}
+Question: {{ question }}
+Answer:
+"""
+
+
+def benchmark(prompts: int, pipelines: int, repeat: int):
+    variables = [{"documents": [f"Document {i}.{j}" for j in range(5)], "question": f"Question {i}?"}
+                 for i in range(prompts)]
+
+    def builders(cls):
+        for _ in range(pipelines):
+            builder = cls(template=TEMPLATE)
+            for item in variables:
+                builder.run(**item)
+
+    def batch():
+        for _ in range(pipelines):
+            render_batch(TEMPLATE, variables)
+
+    for name, func in [("PromptBuilder", lambda: builders(PromptBuilder)),
+                       ("CachedPromptBuilder", lambda: builders(CachedPromptBuilder)),
+                       ("render_batch", batch)]:
+        best = min(timeit.repeat(func, number=1, repeat=repeat))
+        print(f"{name:<20} {best * 1000:8.2f} ms  ({best / (prompts * pipelines) * 1e6:6.1f} us per prompt)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prompts", type=int, default=10, help="Prompts rendered per pipeline.")
+    parser.add_argument("--pipelines", type=int, default=100, help="Pipelines built from the template.")
+    parser.add_argument("--repeat", type=int, default=5, help="Measures taken, the best one is shown.")
+    args = parser.parse_args()
+    benchmark(args.prompts, args.pipelines, args.repeat)
@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Union
+
+
+def make_cache_key(api_url: Union[str, List[str]], prompt: str, parameters: Optional[dict]) -> str:
+    """
+    Build the cache key of a query. Parameters are canonicalised (sorted keys, compact separators)
+    so that equivalent dictionaries always map to the same entry.
+    """
+    canonical = json.dumps([api_url, prompt, parameters or {}], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def is_deterministic(parameters: Optional[dict], max_temperature: float = 0.1) -> bool:
+    """
+    Whether the generation parameters produce (almost) the same output for the same prompt.
+    Sampling with `do_sample` or a temperature above `max_temperature` is only considered
+    deterministic when a fixed `seed` is given.
+    """
+    parameters = parameters or {}
+    if parameters.get("seed") is not None:
+        return True
+    if parameters.get("do_sample"):
+        return False
+    temperature = parameters.get("temperature")
+    return temperature is None or temperature <= max_temperature
+
+
+class SQLiteCacheBackend:
+    """
+    On-disk cache backend stored in a SQLite file, so cached replies survive restarts.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+        )
+        self._connection.commit()
+
+    def get(self, key: str) -> Optional[List[str]]:
+        with self._lock:
+            row = self._connection.execute("SELECT value, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at <= time.time():
+                self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._connection.commit()
+                return None
+            return json.loads(value)
+
+    def set(self, key: str, value: List[str], ttl: Optional[float] = None):
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+            self._connection.commit()
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM responses")
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class ResponseCache:
+    """
+    Thread-safe cache of endpoint replies.
+
+    Entries are kept in memory in least-recently-used order and evicted when `max_entries` or
+    `max_bytes` is exceeded, or once they are older than `ttl` seconds. When a `backend` such as
+    `SQLiteCacheBackend` is given, entries are also written to it and memory misses fall back to it.
+
+    Any object with the same `is_cacheable`, `get` and `set` methods can be handed to the
+    endpoint components instead.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: Optional[int] = 64 * 1024 * 1024,
+                 ttl: Optional[float] = None, backend: Optional[SQLiteCacheBackend] = None,
+                 max_temperature: float = 0.1):
+        """
+        :param max_entries: Maximum number of entries kept in memory.
+        :param max_bytes: Maximum total size in bytes of the replies kept in memory, None for no limit.
+        :param ttl: Seconds after which an entry expires, None to keep entries until they are evicted.
+        :param backend: Optional persistent backend, for example `SQLiteCacheBackend`.
+        :param max_temperature: Highest temperature still treated as deterministic, see `is_deterministic`.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.backend = backend
+        self.max_temperature = max_temperature
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def is_cacheable(self, parameters: Optional[dict]) -> bool:
+        return is_deterministic(parameters, max_temperature=self.max_temperature)
+
+    @staticmethod
+    def _size(key: str, value: List[str]) -> int:
+        return len(key) + sum(len(reply.encode("utf-8")) for reply in value)
+
+    def _remove(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def _store(self, key: str, value: List[str], expires_at: Optional[float]):
+        if key in self._entries:
+            self._remove(key)
+        size = self._size(key, value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        self._entries[key] = (value, expires_at, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or (self.max_bytes is not None and self._bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def get(self, key: str) -> Optional[List[str]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at, _ = entry
+                if expires_at is None or expires_at > time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    # callers get their own list, changing it must not change the cached replies
+                    return list(value)
+                self._remove(key)
+                self.evictions += 1
+
+        value = self.backend.get(key) if self.backend is not None else None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            # promote entries found on disk; their remaining lifetime is not tracked in memory
+            self._store(key, value, time.time() + self.ttl if self.ttl is not None else None)
+            self.hits += 1
+            return list(value)
+
+    def set(self, key: str, value: List[str]):
+        value = list(value)
+        with self._lock:
+            self._store(key, value, time.time() + self.ttl if self.ttl is not None else None)
+        if self.backend is not None:
+            self.backend.set(key, value, ttl=self.ttl)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.backend is not None:
+            self.backend.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
@@ -0,0 +1,191 @@
+import time
+import logging
+import threading
+from collections import deque
+from typing import Any, Dict, Optional
+
+from haystack.preview import component
+
+from .asyncpipeline import run_component_async
+from .errors import EndpointError
+from .metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(EndpointError):
+    """
+    Raised without contacting the endpoint while its circuit is open. It is not retried.
+    """
+
+
+class _Circuit:
+    def __init__(self, window: int):
+        self.state = CLOSED
+        self.outcomes: deque = deque(maxlen=window)
+        self.opened_at = 0.0
+        self.probes = 0
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to an endpoint URL that keeps failing, one circuit per URL.
+
+    A circuit is closed while requests go through. Once at least `min_calls` of the last `window` requests
+    to a URL are known and `failure_rate` of them failed (connection errors, timeouts, 5xx), the circuit
+    opens: requests to the URL fail at once with `CircuitOpenError` for `open_duration` seconds. The circuit
+    is then half-open and lets `half_open_calls` probe requests through. It closes again if they succeed
+    and opens for another `open_duration` if one fails. Share one breaker between the components
+    querying the same endpoints.
+    """
+
+    def __init__(self, failure_rate: float = 0.5, window: int = 20, min_calls: int = 10,
+                 open_duration: float = 30.0, half_open_calls: int = 1, registry: Optional[MetricsRegistry] = None):
+        """
+        :param failure_rate: Fraction of failed requests in the window that opens the circuit.
+        :param window: Number of recent requests the failure rate is computed over.
+        :param min_calls: Number of requests to know of before the failure rate is trusted.
+        :param open_duration: Seconds the circuit stays open before probe requests are let through.
+        :param half_open_calls: Number of probe requests let through at once while half-open.
+        :param registry: Optional `MetricsRegistry` where the state of every circuit is exposed
+            (0 closed, 1 half-open, 2 open).
+        """
+        self.failure_rate = failure_rate
+        self.window = window
+        self.min_calls = min_calls
+        self.open_duration = open_duration
+        self.half_open_calls = half_open_calls
+        self._circuits: Dict[str, _Circuit] = {}
+        self._lock = threading.Lock()
+        self._state_gauge = None
+        if registry is not None:
+            self._state_gauge = registry.gauge("llm_endpoint_circuit_state",
+                                               "State of the circuit of an endpoint: 0 closed, 1 half-open, 2 open.",
+                                               ("endpoint",))
+
+    def _circuit(self, url: str) -> _Circuit:
+        # called with the lock held
+        circuit = self._circuits.get(url)
+        if circuit is None:
+            circuit = self._circuits[url] = _Circuit(self.window)
+        if circuit.state == OPEN and time.monotonic() - circuit.opened_at >= self.open_duration:
+            self._set_state(url, circuit, HALF_OPEN)
+        return circuit
+
+    def _set_state(self, url: str, circuit: _Circuit, state: str):
+        if circuit.state != state:
+            logger.warning("Circuit of %s is now %s", url, state)
+        circuit.state = state
+        if state == OPEN:
+            circuit.opened_at = time.monotonic()
+        if state != HALF_OPEN:
+            circuit.outcomes.clear()
+            circuit.probes = 0
+        if self._state_gauge is not None:
+            self._state_gauge.set(_STATE_VALUES[state], endpoint=url)
+
+    def state(self, url: str) -> str:
+        with self._lock:
+            return self._circuit(url).state
+
+    def is_open(self, url: str) -> bool:
+        """
+        Whether a request to `url` would be refused right now.
+        """
+        with self._lock:
+            circuit = self._circuit(url)
+            return circuit.state == OPEN or (circuit.state == HALF_OPEN and circuit.probes >= self.half_open_calls)
+
+    def allow(self, url: str):
+        """
+        Let a request to `url` through, or raise `CircuitOpenError`. Must be paired with `record`.
+        """
+        with self._lock:
+            circuit = self._circuit(url)
+            if circuit.state == CLOSED:
+                return
+            if circuit.state == HALF_OPEN and circuit.probes < self.half_open_calls:
+                circuit.probes += 1
+                return
+            retry_in = max(0.0, self.open_duration - (time.monotonic() - circuit.opened_at))
+        raise CircuitOpenError(f"Circuit of {url} is open, not sending the query (next probe in {retry_in:.1f}s)")
+
+    def record(self, url: str, success: Optional[bool]):
+        """
+        Record the outcome of a request let through by `allow`.
+
+        :param success: Whether the endpoint answered properly, None when the request ended without telling
+            (cancelled, out of time...).
+        """
+        with self._lock:
+            circuit = self._circuit(url)
+            if circuit.state == HALF_OPEN:
+                circuit.probes = max(0, circuit.probes - 1)
+                if success is not None:
+                    self._set_state(url, circuit, CLOSED if success else OPEN)
+                return
+            if success is None or circuit.state == OPEN:
+                return
+            circuit.outcomes.append(success)
+            failures = circuit.outcomes.count(False)
+            if len(circuit.outcomes) >= self.min_calls and failures >= self.failure_rate * len(circuit.outcomes):
+                self._set_state(url, circuit, OPEN)
+
+
+@component
+class FallbackGenerator:
+    """
+    Answers with `fallback` while the circuit of the `primary` generator's endpoint is open.
+
+    It has the same inputs and outputs as the primary generator. The fallback, for example a smaller
+    local model, only receives the inputs it accepts.
+    """
+
+    def __init__(self, primary, fallback):
+        """
+        :param primary: The generator normally used, whose `CircuitBreaker` raises `CircuitOpenError`.
+        :param fallback: The generator taking over while the circuit is open.
+        """
+        self.primary = primary
+        self.fallback = fallback
+        self.fallbacks = 0
+        self.__canals_input__ = dict(getattr(primary, "__canals_input__", {}))
+        self.__canals_output__ = dict(getattr(primary, "__canals_output__", {}))
+
+    def warm_up(self):
+        for generator in (self.primary, self.fallback):
+            if hasattr(generator, "warm_up"):
+                generator.warm_up()
+
+    def close(self):
+        for generator in (self.primary, self.fallback):
+            if hasattr(generator, "close"):
+                generator.close()
+
+    def run(self, **kwargs) -> Dict[str, Any]:
+        try:
+            return self.primary.run(**kwargs)
+        except CircuitOpenError as e:
+            logger.info("Using the fallback generator: %s", e)
+            self.fallbacks += 1
+        return self.fallback.run(**self._fallback_inputs(kwargs))
+
+    async def run_async(self, **kwargs) -> Dict[str, Any]:
+        try:
+            return await run_component_async(self.primary, **kwargs)
+        except CircuitOpenError as e:
+            logger.info("Using the fallback generator: %s", e)
+            self.fallbacks += 1
+        return await run_component_async(self.fallback, **self._fallback_inputs(kwargs))
+
+    def _fallback_inputs(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        accepted = getattr(self.fallback, "__canals_input__", None)
+        if accepted is None:
+            return kwargs
+        return {name: value for name, value in kwargs.items() if name in accepted}
@@ -0,0 +1,86 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls sharing the same key into a single call.
+
+    The first caller of a key runs the function; callers arriving while it runs wait for it and get the
+    same result, or the same exception. Nothing is kept once the call completes, so the next caller
+    runs the function again: this is not a cache. Works across threads with `do` and on asyncio event
+    loops with `do_async`.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._tasks: Dict[Tuple[int, Hashable], "asyncio.Future"] = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key: Hashable, func: Callable[[], T], timeout: Optional[float] = None) -> T:
+        """
+        Run `func`, unless a call with the same key is already running, in which case wait for its outcome.
+
+        :param timeout: Seconds to wait for a call started by someone else before raising `TimeoutError`.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if not call.done.wait(timeout):
+                raise TimeoutError("Timed out waiting for the coalesced call")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def do_async(self, key: Hashable, func: Callable[[], Awaitable[T]], timeout: Optional[float] = None) -> T:
+        """
+        Await `func()`, unless a call with the same key is already running on this event loop,
+        in which case await its outcome.
+
+        :param timeout: Seconds to wait before raising `asyncio.TimeoutError`; the shared call keeps running.
+        """
+        task_key = (id(asyncio.get_running_loop()), key)
+        with self._lock:
+            task = self._tasks.get(task_key)
+            if task is None:
+                task = self._tasks[task_key] = asyncio.ensure_future(func())
+                task.add_done_callback(lambda done: self._forget(task_key, done))
+            else:
+                self.coalesced += 1
+        # a caller giving up must not cancel the call the others are waiting for
+        return await asyncio.wait_for(asyncio.shield(task), timeout)
+
+    def _forget(self, task_key: Tuple[int, Hashable], task: "asyncio.Future"):
+        with self._lock:
+            self._tasks.pop(task_key, None)
+        if not task.cancelled():
+            # mark the exception as retrieved, the callers that are still waiting get it from the shield
+            task.exception()
@@ -0,0 +1,158 @@
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Any, Dict, Optional
+
+from .errors import DeadlineExceededError
+from .metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Limits the number of requests in flight to an endpoint, adapting the limit to how the endpoint copes.
+
+    The limit grows additively, by about one per round trip, while latency stays close to its long-term
+    average and the limit is actually in use. It is cut multiplicatively when the endpoint is overloaded
+    (429, 503, timeouts...) or when the recent latency exceeds `latency_tolerance` times the long-term
+    average, at most once per round trip, as TCP does with its congestion window. Callers over the limit
+    wait in line, first come, first served.
+    """
+
+    def __init__(self, initial_limit: float = 8, min_limit: float = 1, max_limit: float = 256,
+                 backoff: float = 0.5, latency_tolerance: float = 2.0, registry: Optional[MetricsRegistry] = None,
+                 name: str = "default"):
+        """
+        :param initial_limit: Number of requests allowed in flight at first.
+        :param min_limit: The limit never goes below this.
+        :param max_limit: The limit never goes above this.
+        :param backoff: Factor the limit is multiplied by when the endpoint is overloaded.
+        :param latency_tolerance: How many times the long-term average latency the recent latency may reach
+            before it counts as overload.
+        :param registry: Optional `MetricsRegistry` where the current limit and the requests in flight are exposed.
+        :param name: Value of the `limiter` label of those metrics.
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.name = name
+        self.in_flight = 0
+        self.backoffs = 0
+        # exponential moving averages of the latency, over the last few requests and over a long period
+        self._short_latency: Optional[float] = None
+        self._long_latency: Optional[float] = None
+        self._last_backoff = 0.0
+        self._waiters: deque = deque()
+        self._lock = threading.Lock()
+        self._limit_gauge = None
+        self._in_flight_gauge = None
+        if registry is not None:
+            self._limit_gauge = registry.gauge("llm_endpoint_concurrency_limit",
+                                               "Requests allowed in flight by the adaptive limiter.", ("limiter",))
+            self._in_flight_gauge = registry.gauge("llm_endpoint_concurrency_in_flight",
+                                                   "Requests in flight through the adaptive limiter.", ("limiter",))
+            self._publish()
+
+    def _publish(self):
+        if self._limit_gauge is not None:
+            self._limit_gauge.set(self.limit, limiter=self.name)
+            self._in_flight_gauge.set(self.in_flight, limiter=self.name)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"limit": self.limit, "in_flight": self.in_flight, "waiting": len(self._waiters),
+                    "backoffs": self.backoffs, "latency": self._long_latency}
+
+    def _has_room(self) -> bool:
+        return self.in_flight < max(1, int(self.limit))
+
+    def _wake_waiters(self):
+        # hand the free slots over to the callers waiting the longest, called with the lock held
+        while self._waiters and self._has_room():
+            self.in_flight += 1
+            self._waiters.popleft()()
+
+    def acquire(self, deadline: Optional[float] = None):
+        """
+        Block until a request may be sent. Must be paired with `release`.
+
+        :param deadline: Absolute `time.time()` after which `DeadlineExceededError` is raised instead of waiting.
+        """
+        with self._lock:
+            if not self._waiters and self._has_room():
+                self.in_flight += 1
+                self._publish()
+                return
+            ready = threading.Event()
+            self._waiters.append(ready.set)
+        timeout = None if deadline is None else max(0.0, deadline - time.time())
+        if ready.wait(timeout):
+            return
+        with self._lock:
+            if ready.set in self._waiters:
+                self._waiters.remove(ready.set)
+                raise DeadlineExceededError("Deadline exceeded while waiting for a concurrency slot")
+        # a slot was handed over just as the wait timed out, keep it
+
+    async def acquire_async(self, deadline: Optional[float] = None):
+        """
+        Wait, without blocking the event loop, until a request may be sent. See `acquire`.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if not self._waiters and self._has_room():
+                self.in_flight += 1
+                self._publish()
+                return
+            ready = loop.create_future()
+            wake = lambda: loop.call_soon_threadsafe(lambda: ready.done() or ready.set_result(None))
+            self._waiters.append(wake)
+        timeout = None if deadline is None else max(0.0, deadline - time.time())
+        try:
+            await asyncio.wait_for(asyncio.shield(ready), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                handed_over = wake not in self._waiters
+                if not handed_over:
+                    self._waiters.remove(wake)
+            if handed_over:
+                self.release()
+            if isinstance(e, asyncio.TimeoutError):
+                raise DeadlineExceededError("Deadline exceeded while waiting for a concurrency slot") from e
+            raise
+
+    def release(self, latency: Optional[float] = None, overloaded: bool = False):
+        """
+        Free the slot of a finished request and adapt the limit to its outcome.
+
+        :param latency: Seconds the endpoint took to answer, None when it didn't or the time isn't comparable.
+        :param overloaded: Whether the endpoint signalled it is overloaded (429, 503, timeout...).
+        """
+        with self._lock:
+            # the limit only grows when it is what holds requests back
+            saturated = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+            now = time.monotonic()
+            if latency is not None:
+                self._short_latency = latency if self._short_latency is None else (
+                    self._short_latency + 0.3 * (latency - self._short_latency))
+                self._long_latency = latency if self._long_latency is None else (
+                    self._long_latency + 0.02 * (latency - self._long_latency))
+                if self._short_latency > self.latency_tolerance * self._long_latency:
+                    overloaded = True
+            if overloaded:
+                # back off at most once per round trip, the failures of one burst count once
+                if now - self._last_backoff > (self._short_latency or 0.0):
+                    self._last_backoff = now
+                    self.backoffs += 1
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    logger.debug("Endpoint overloaded, concurrency limit lowered to %.1f", self.limit)
+            elif latency is not None and saturated:
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._wake_waiters()
+            self._publish()
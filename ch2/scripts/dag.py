@@ -0,0 +1,109 @@
+from collections import deque
+from typing import Any, Dict, List
+
+import networkx
+from canals.errors import PipelineError, PipelineRuntimeError
+from canals.pipeline.validation import validate_pipeline_input
+
+
+class DagRun:
+    """
+    Book-keeping of one run of a pipeline without loops, for runners starting its components concurrently.
+
+    A component can start once every component it is connected from has finished. It runs if it then has all
+    its mandatory inputs; otherwise, for example downstream of a branch that produced nothing, it is skipped.
+    `start` and `finish` return the components that can start, to be run with the arguments of `inputs`.
+    The outputs nothing is connected to are gathered in `outputs`, as `Pipeline.run` returns them.
+    """
+
+    def __init__(self, pipeline, data: Dict[str, Dict[str, Any]]):
+        """
+        :param pipeline: The pipeline to run, left untouched.
+        :param data: The inputs of the run, as given to `Pipeline.run`.
+        """
+        graph = pipeline.graph
+        if not networkx.is_directed_acyclic_graph(graph):
+            raise PipelineError("Pipelines with loops can only be run with Pipeline.run.")
+        data = validate_pipeline_input(graph, input_values=data)
+        self.graph = graph
+        self.outputs: Dict[str, Dict[str, Any]] = {}
+        self._received: Dict[str, Dict[str, Any]] = {}
+        for name, inputs in data.items():
+            sockets = graph.nodes[name]["input_sockets"]
+            self._received[name] = {socket_name: [value] if sockets[socket_name].is_variadic else value
+                                    for socket_name, value in inputs.items()}
+        # number of components each component still waits for
+        self._waiting = {name: len(set(graph.predecessors(name))) for name in graph.nodes}
+
+    def instance(self, name: str):
+        return self.graph.nodes[name]["instance"]
+
+    def inputs(self, name: str) -> Dict[str, Any]:
+        return dict(self._received.get(name, {}))
+
+    def start(self) -> List[str]:
+        """
+        The components that can start right away.
+        """
+        return self._runnable([name for name, waiting in self._waiting.items() if waiting == 0])
+
+    def finish(self, name: str, outputs: Dict[str, Any]) -> List[str]:
+        """
+        Hand the outputs of a component to the components it is connected to.
+
+        :return: The components that can start now.
+        """
+        for socket_name, value in outputs.items():
+            targets = [(receiver, edge["to_socket"]) for _, receiver, edge in self.graph.out_edges(name, data=True)
+                       if edge["from_socket"].name == socket_name]
+            if not targets:
+                self.outputs.setdefault(name, {})[socket_name] = value
+            for receiver, socket in targets:
+                if socket.is_variadic:
+                    self._received.setdefault(receiver, {}).setdefault(socket.name, []).append(value)
+                else:
+                    self._received.setdefault(receiver, {})[socket.name] = value
+        return self._runnable(self._done(name))
+
+    def _done(self, name: str) -> List[str]:
+        released = []
+        for successor in set(self.graph.successors(name)):
+            self._waiting[successor] -= 1
+            if self._waiting[successor] == 0:
+                released.append(successor)
+        return released
+
+    def _runnable(self, names: List[str]) -> List[str]:
+        # skipping a component may release the components after it
+        runnable = []
+        queue = deque(names)
+        while queue:
+            name = queue.popleft()
+            inputs = self._received.get(name)
+            sockets = self.graph.nodes[name]["input_sockets"].values()
+            if inputs is not None and all(socket.name in inputs for socket in sockets
+                                          if socket.is_mandatory and not socket.is_variadic):
+                runnable.append(name)
+            else:
+                queue.extend(self._done(name))
+        return runnable
+
+
+def check_outputs(name: str, outputs: Any) -> Dict[str, Any]:
+    if not isinstance(outputs, dict):
+        raise PipelineRuntimeError(f"Component '{name}' returned a value of type '{type(outputs).__name__}' "
+                                   "instead of a dict.")
+    return outputs
+
+
+def component_error(name: str, error: Exception, inputs: Dict[str, Any]) -> PipelineRuntimeError:
+    # errors are wrapped as in Pipeline.run, so callers handle every kind of run the same way
+    return PipelineRuntimeError(f"{name} raised '{error.__class__.__name__}: {error}' \nInputs: {inputs}")
+
+
+def run_component(name: str, instance, inputs: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        outputs = instance.run(**inputs)
+    except Exception as e:
+        raise component_error(name, e, inputs) from e
+    return check_outputs(name, outputs)
@@ -0,0 +1,40 @@
+import time
+from typing import Optional, Tuple
+
+from .errors import DeadlineExceededError
+
+
+def deadline_after(seconds: float) -> float:
+    """
+    Deadline `seconds` from now. Deadlines are absolute `time.time()` timestamps, so that they keep their
+    meaning as they are handed from the pipeline inputs down to the components and their threads.
+    """
+    return time.time() + seconds
+
+
+def remaining(deadline: Optional[float]) -> Optional[float]:
+    """
+    Seconds left before `deadline`, None when there is no deadline.
+    """
+    return None if deadline is None else deadline - time.time()
+
+
+def check_deadline(deadline: Optional[float]):
+    """
+    Raise `DeadlineExceededError` if `deadline` has already passed.
+    """
+    if deadline is not None and time.time() >= deadline:
+        raise DeadlineExceededError("Deadline exceeded before the query could be sent")
+
+
+def bounded_timeout(connect_timeout: Optional[float], read_timeout: Optional[float],
+                    deadline: Optional[float]) -> Tuple[Optional[float], Optional[float]]:
+    """
+    `(connect, read)` timeouts for `requests`, shortened to the time left before `deadline`.
+    """
+    check_deadline(deadline)
+    left = remaining(deadline)
+    if left is None:
+        return connect_timeout, read_timeout
+    return (min(connect_timeout, left) if connect_timeout is not None else left,
+            min(read_timeout, left) if read_timeout is not None else left)
@@ -0,0 +1,85 @@
+import json
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+
+class EndpointError(Exception):
+    """
+    Raised when an inference endpoint query fails.
+
+    :param message: Description of the failure.
+    :param status_code: HTTP status code of the response, None if no response was received.
+    :param body: Body of the response, if any.
+    """
+
+    def __init__(self, message: str, status_code: Optional[int] = None, body: Optional[str] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.body = body
+
+
+class TransientEndpointError(EndpointError):
+    """
+    Failure that may go away on its own, such as throttling (429), a model that is still loading (503),
+    other server errors or a dropped connection. Retrying later can succeed.
+
+    :param retry_after: Seconds the endpoint asked us to wait before retrying, if it said so.
+    """
+
+    def __init__(self, message: str, status_code: Optional[int] = None, body: Optional[str] = None,
+                 retry_after: Optional[float] = None):
+        super().__init__(message, status_code=status_code, body=body)
+        self.retry_after = retry_after
+
+
+class PermanentEndpointError(EndpointError):
+    """
+    Failure that will happen again for the same query, such as an invalid request or a wrong token.
+    """
+
+
+class ResponseTooLargeError(PermanentEndpointError):
+    """
+    Raised when the endpoint answers with a body larger than the component accepts.
+    """
+
+
+class DeadlineExceededError(EndpointError):
+    """
+    Raised when the deadline of a query passes before it could be answered. Queries already past their
+    deadline are not sent at all.
+    """
+
+
+# Status codes worth retrying: timeouts, throttling, model loading and other server-side failures
+RETRYABLE_STATUS_CODES = (408, 425, 429, 500, 502, 503, 504)
+
+
+def _retry_after(headers, body: Optional[str]) -> Optional[float]:
+    value = headers.get("Retry-After") if headers is not None else None
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+            except (TypeError, ValueError):
+                pass
+    # Hugging Face endpoints answer 503 with the time left until the model is loaded
+    try:
+        estimated_time = json.loads(body).get("estimated_time")
+        return float(estimated_time) if estimated_time is not None else None
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+def error_from_response(status_code: int, body: str, headers=None) -> EndpointError:
+    """
+    Turn a failed endpoint response into a transient or permanent `EndpointError`.
+    """
+    message = f"Query failed with status code {status_code}: {body}"
+    if status_code in RETRYABLE_STATUS_CODES:
+        return TransientEndpointError(message, status_code=status_code, body=body,
+                                      retry_after=_retry_after(headers, body))
+    return PermanentEndpointError(message, status_code=status_code, body=body)
@@ -0,0 +1,225 @@
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """
+    Keeps the latencies of the most recent requests to compute percentiles over them.
+    """
+
+    def __init__(self, window: int = 200):
+        self._samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._samples)
+
+    def record(self, latency: float):
+        with self._lock:
+            self._samples.append(latency)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        """
+        Latency below which `percentile` percent of the recent requests answered, None without samples.
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(percentile / 100.0 * (len(samples) - 1))))
+        return samples[index]
+
+
+class HedgingPolicy:
+    """
+    Sends a duplicate of a request that takes longer than usual, and keeps whichever answers first.
+
+    Once `min_samples` latencies are known, a request that hasn't answered after the `percentile`
+    latency of the recent requests is sent a second time (the endpoint components send it to another
+    replica). The first successful answer wins and the other attempt is cancelled. Asyncio tasks are
+    cancelled right away. A blocking HTTP call can't be interrupted, so its answer is simply dropped.
+
+    Hedges are sent for at most `max_hedge_ratio` of the requests, and blocking hedges only while one of the
+    `max_workers` threads is free, so hedging never adds load to an endpoint that is slow for everyone.
+    `fired` counts the hedges sent, `won` the ones that answered first and `skipped` the ones held back.
+    """
+
+    def __init__(self, percentile: float = 95.0, min_samples: int = 20, window: int = 200, max_workers: int = 32,
+                 max_hedge_ratio: float = 0.1):
+        """
+        :param percentile: Percentile of the recent latencies after which a hedge is sent.
+        :param min_samples: Number of latencies to collect before hedging starts.
+        :param window: Number of recent latencies the percentile is computed over.
+        :param max_workers: Threads running blocking hedges. The first attempts don't use them.
+        :param max_hedge_ratio: Maximum fraction of the requests that are hedged.
+        """
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_workers = max_workers
+        self.max_hedge_ratio = max_hedge_ratio
+        self.latencies = LatencyTracker(window)
+        self.requests = 0
+        self.fired = 0
+        self.won = 0
+        self.skipped = 0
+        self._hedges_in_flight = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def delay(self) -> Optional[float]:
+        """
+        Seconds to wait for an answer before sending a hedge, None while there are too few samples.
+        """
+        if len(self.latencies) < self.min_samples:
+            return None
+        return self.latencies.percentile(self.percentile)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"requests": self.requests, "fired": self.fired, "won": self.won, "skipped": self.skipped,
+                    "delay": self.delay()}
+
+    def _count(self, won: int = 0):
+        with self._lock:
+            self.won += won
+
+    def _can_hedge(self, pooled: bool) -> bool:
+        # called with the lock held
+        if pooled and self._hedges_in_flight >= self.max_workers:
+            return False
+        return self.fired + 1 <= self.max_hedge_ratio * self.requests
+
+    def _reserve_hedge(self, pooled: bool) -> bool:
+        with self._lock:
+            if not self._can_hedge(pooled):
+                self.skipped += 1
+                return False
+            self.fired += 1
+            if pooled:
+                self._hedges_in_flight += 1
+            return True
+
+    def _hedge_done(self, _future: Future):
+        with self._lock:
+            self._hedges_in_flight -= 1
+
+    def _start(self, func: Callable[[List[Any]], T], tried: List[Any]) -> "Future[T]":
+        # the first attempt gets a thread of its own, started at once: it never waits behind other requests,
+        # and the calling thread stays free to return the answer of a hedge while it blocks
+        future: "Future[T]" = Future()
+
+        def attempt():
+            future.set_running_or_notify_cancel()
+            try:
+                future.set_result(self._timed(func, tried))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=attempt, name="hedging-attempt", daemon=True).start()
+        return future
+
+    def _timed(self, func: Callable[[List[Any]], T], tried: List[Any]) -> T:
+        started = time.monotonic()
+        result = func(tried)
+        self.latencies.record(time.monotonic() - started)
+        return result
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="hedging")
+            return self._executor
+
+    def call(self, func: Callable[[List[Any]], T]) -> T:
+        """
+        Call `func`, hedging it if it is slow.
+
+        :param func: Sends one attempt. It receives a list shared by all attempts of the request, where it
+            records the replica it used, so that the hedge can avoid it.
+        """
+        with self._lock:
+            self.requests += 1
+            may_hedge = self._can_hedge(pooled=True)
+        tried: List[Any] = []
+        delay = self.delay()
+        if delay is None or not may_hedge:
+            # no hedge possible: the attempt runs on the calling thread
+            return self._timed(func, tried)
+
+        primary = self._start(func, tried)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+        if not self._reserve_hedge(pooled=True):
+            return primary.result()
+
+        logger.debug("No answer after %.3f seconds, sending a hedged request", delay)
+        hedge = self._get_executor().submit(self._timed, func, tried)
+        hedge.add_done_callback(self._hedge_done)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self._count(won=1)
+                    for other in pending:
+                        other.cancel()
+                    return future.result()
+                error = error or future.exception()
+        raise error
+
+    async def _timed_async(self, func: Callable[[List[Any]], Awaitable[T]], tried: List[Any]) -> T:
+        started = time.monotonic()
+        result = await func(tried)
+        self.latencies.record(time.monotonic() - started)
+        return result
+
+    async def call_async(self, func: Callable[[List[Any]], Awaitable[T]]) -> T:
+        """
+        Await `func`, hedging it if it is slow. See `call`.
+        """
+        with self._lock:
+            self.requests += 1
+        tried: List[Any] = []
+        delay = self.delay()
+        if delay is None:
+            return await self._timed_async(func, tried)
+
+        primary = asyncio.ensure_future(self._timed_async(func, tried))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return primary.result()
+
+            if not self._reserve_hedge(pooled=False):
+                return await primary
+            logger.debug("No answer after %.3f seconds, sending a hedged request", delay)
+            hedge = asyncio.ensure_future(self._timed_async(func, tried))
+            tasks.append(hedge)
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self._count(won=1)
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
@@ -1,45 +1,791 @@
 import os
+import gzip
+import time
+import zlib
+import asyncio
+import functools
+import threading
 import requests
-import json
+from contextlib import nullcontext
+from requests.adapters import HTTPAdapter
 from haystack.preview import component
-from typing import Any, Dict, List
+from haystack.preview.dataclasses import StreamingChunk
+from haystack.preview.lazy_imports import LazyImport
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
+from .cache import ResponseCache, make_cache_key
+from .errors import (DeadlineExceededError, EndpointError, ResponseTooLargeError, TransientEndpointError,
+                     error_from_response)
+from .jsoncodec import dumps, loads
+from .deadline import bounded_timeout, check_deadline, remaining
+from .retry import RetryPolicy
+from .ratelimit import RateLimiter, estimate_tokens
+from .loadbalancer import Replica, ReplicaPool
+from .hedging import HedgingPolicy
+from .coalescing import SingleFlight
+from .microbatch import MicroBatcher
+from .metrics import EndpointMetrics
+from .concurrency import AdaptiveConcurrencyLimiter
+from .scheduler import PriorityScheduler
+from .circuitbreaker import CircuitBreaker, CircuitOpenError
+from .tokenbudget import TokenBudget
+from .asyncpipeline import shared_executor
+
+with LazyImport("Run 'pip install aiohttp'") as aiohttp_import:
+    import aiohttp
+
+# only the start of an error page is kept for the error message
+MAX_ERROR_BODY_BYTES = 64 * 1024
+
+# a middle ground between speed and size, prompts compress well at any level
+COMPRESSION_LEVEL = 5
 
 @component
 class InferenceEndpointAPI:
-    
-    def __init__(self, api_url:str,  api_key: str, parameters:dict):
+
+    # routes of the endpoint, relative to the URL of each replica
+    generate_path = ""
+    stream_path = "/generate_stream"
+    # generation parameter bounding the number of new tokens, lowered by the token budget when needed
+    max_new_tokens_parameter = "max_new_tokens"
+
+    def __init__(self, api_url: Union[str, List[str]],  api_key: str, parameters:dict,
+                 pool_connections: int = 10, pool_maxsize: int = 10, keep_alive_timeout: Optional[float] = 60.0,
+                 batch_size: int = 8, streaming_callback: Optional[Callable[[StreamingChunk], None]] = None,
+                 cache: Optional[ResponseCache] = None, retry_policy: Optional[RetryPolicy] = None,
+                 rate_limiter: Optional[RateLimiter] = None, load_balancing: str = "least_outstanding",
+                 replica_cooldown: float = 30.0, health_check_path: Optional[str] = None,
+                 hedging: Optional[HedgingPolicy] = None, coalescer: Optional[SingleFlight] = None,
+                 micro_batch_size: Optional[int] = None, micro_batch_wait: float = 0.005,
+                 connect_timeout: Optional[float] = 10.0, read_timeout: Optional[float] = 120.0,
+                 max_response_bytes: Optional[int] = 64 * 1024 * 1024, metrics: Optional[EndpointMetrics] = None,
+                 concurrency_limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+                 scheduler: Optional[PriorityScheduler] = None, circuit_breaker: Optional[CircuitBreaker] = None,
+                 request_compression: Optional[str] = None, compression_threshold: int = 16 * 1024,
+                 accept_compressed: bool = True, token_budget: Optional[TokenBudget] = None):
+        """
+        :param api_url: URL of the inference endpoint, or list of URLs of its replicas.
+        :param api_key: Token sent as a Bearer token to the endpoint.
+        :param parameters: Generation parameters sent along with every prompt.
+        :param pool_connections: Number of per-host connection pools kept by the shared HTTP session.
+        :param pool_maxsize: Maximum number of connections kept alive per host.
+        :param keep_alive_timeout: Seconds a pooled connection may stay idle before the pool is recycled.
+            Most endpoints close idle sockets on their side, so reusing them after a long pause only fails.
+            Use None to never recycle.
+        :param batch_size: Maximum number of prompts sent in a single request by `run_batch`.
+        :param streaming_callback: When given, `run` streams tokens from the TGI `generate_stream` route
+            and calls this function with a `StreamingChunk` for every token as soon as it arrives.
+        :param cache: Optional `ResponseCache` (or compatible object) consulted before querying the endpoint.
+            Queries whose parameters make the output non-deterministic always bypass it.
+        :param retry_policy: Optional `RetryPolicy` used to retry transient failures (429, 503, dropped
+            connections...). Without it, failures are raised right away. Either way a failed query raises
+            `TransientEndpointError` or `PermanentEndpointError`.
+        :param rate_limiter: Optional `RateLimiter`, usually shared by every component using the same account.
+            Every attempt, retries included, waits for its turn before being sent.
+        :param load_balancing: How requests are spread over replicas, `least_outstanding` or `latency`.
+            See `ReplicaPool`.
+        :param replica_cooldown: Seconds a replica failing repeatedly is left out of rotation.
+        :param health_check_path: Path, such as `/health`, queried on an ejected replica before re-admitting it.
+        :param hedging: Optional `HedgingPolicy`. Slow requests are then sent again to another replica and
+            the first answer is kept. Streaming requests are never hedged.
+        :param coalescer: Optional `SingleFlight`, possibly shared between components. Concurrent queries with
+            the same request body and route are then sent once and every caller gets the reply.
+            Streaming queries are never coalesced.
+        :param micro_batch_size: When given, prompts sent by concurrent `run` calls are merged into batched
+            requests of up to this many prompts, see `MicroBatcher`. Streaming queries are sent on their own.
+        :param micro_batch_wait: Seconds a micro-batch waits for more prompts after its first one.
+        :param connect_timeout: Seconds to wait for a connection to the endpoint, None to wait forever.
+        :param read_timeout: Seconds to wait for the endpoint to send data, None to wait forever.
+            Both are shortened to the time left when a query has a `deadline`.
+        :param max_response_bytes: Largest (decompressed) response body accepted, None for no limit. Larger
+            answers raise `ResponseTooLargeError` as soon as the limit is reached, without buffering the rest.
+        :param metrics: Optional `EndpointMetrics`, possibly shared between components, recording the latency,
+            status, size and retries of every request sent.
+        :param concurrency_limiter: Optional `AdaptiveConcurrencyLimiter`, usually shared by every component
+            querying the same endpoint. Requests then wait for a slot, and the number of slots follows how
+            fast and how reliably the endpoint answers.
+        :param scheduler: Optional `PriorityScheduler`, usually shared by every component querying the same
+            endpoint. Queries then wait for a slot of their `priority` class, cache hits excepted.
+        :param circuit_breaker: Optional `CircuitBreaker`, usually shared by every component querying the same
+            endpoint. Replicas whose circuit is open are skipped, and queries fail at once with
+            `CircuitOpenError` when all of them are. See `FallbackGenerator` to answer them anyway.
+        :param request_compression: `gzip` or `deflate` to compress request bodies, None to send them as is.
+            The endpoint, or the proxy in front of it, must accept compressed bodies.
+        :param compression_threshold: Request bodies smaller than this many bytes are never compressed.
+        :param accept_compressed: Ask the endpoint for gzip or deflate compressed responses, which are
+            decompressed on the fly. `max_response_bytes` applies to the decompressed size.
+        :param token_budget: Optional `TokenBudget` checking prompts against the context window of the model.
+            Prompts that are too long are rejected with `PromptTooLongError` before being queued, or truncated,
+            and the number of tokens to generate is lowered to fit.
+        """
         self.api_url = api_url
         self.headers = {
             "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"}
+            "Content-Type": "application/json",
+            "Accept-Encoding": "gzip, deflate" if accept_compressed else "identity"}
         self.parameters = parameters
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.keep_alive_timeout = keep_alive_timeout
+        self.batch_size = batch_size
+        self.streaming_callback = streaming_callback
+        self.cache = cache
+        self.retry_policy = retry_policy
+        self.rate_limiter = rate_limiter
+        self.health_check_path = health_check_path
+        self.replicas = ReplicaPool(api_url, strategy=load_balancing, cooldown=replica_cooldown,
+                                    health_check=self._health_check if health_check_path else None)
+        self.hedging = hedging
+        self.coalescer = coalescer
+        self.micro_batch_size = micro_batch_size
+        self.micro_batch_wait = micro_batch_wait
+        self._micro_batcher: Optional[MicroBatcher] = None
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_response_bytes = max_response_bytes
+        self.metrics = metrics
+        self.concurrency_limiter = concurrency_limiter
+        self.scheduler = scheduler
+        self.circuit_breaker = circuit_breaker
+        if request_compression not in (None, "gzip", "deflate"):
+            raise ValueError(f"Unsupported request compression '{request_compression}', use 'gzip' or 'deflate'.")
+        self.request_compression = request_compression
+        self.compression_threshold = compression_threshold
+        self.token_budget = token_budget
+        # the session is created lazily so that __init__ stays cheap, as Haystack expects
+        self._session: Optional[requests.Session] = None
+        self._session_lock = threading.Lock()
+        self._last_used: Optional[float] = None
 
-    @component.output_types(replies=List[str])
-    def run(self, prompt:str) -> dict:
+    def warm_up(self):
         """
-        Query the model with a prompt and optional parameters.
+        Open the shared HTTP session before the first prompt is sent.
+        """
+        self._get_session()
 
-        :param prompt: A string containing the input prompt for the query.
-        :param parameters: Optional dictionary containing additional parameters for the query.
-        :return: A dictionary containing the model's response.
+    def close(self):
         """
-        
+        Close the shared HTTP session and every pooled connection it holds.
+        The component can still be used afterwards; a new session is opened on the next call.
+        """
+        with self._session_lock:
+            micro_batcher, self._micro_batcher = self._micro_batcher, None
+        if micro_batcher is not None:
+            micro_batcher.close()
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+            self._last_used = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _create_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _get_session(self) -> requests.Session:
+        with self._session_lock:
+            now = time.monotonic()
+            if self._session is None:
+                self._session = self._create_session()
+            elif (self.keep_alive_timeout is not None and self._last_used is not None
+                    and now - self._last_used > self.keep_alive_timeout):
+                # drop idle sockets; requests still in flight keep their connection until they finish
+                for adapter in self._session.adapters.values():
+                    adapter.poolmanager.clear()
+            self._last_used = now
+            return self._session
+
+    def _payload(self, prompt) -> dict:
+        parameters = self.parameters
+        if self.token_budget is not None:
+            prompt, parameters = self.token_budget.fit(prompt, parameters, self.max_new_tokens_parameter)
         data = {
             "inputs": prompt  # directly using the string prompt
         }
-        
-        data['parameters'] = self.parameters
-            
-        response = requests.post(self.api_url, headers=self.headers, json=data)
-        response_json = response.json()
-        
-        if response.status_code == 200:
-            if isinstance(response_json, list) and isinstance(response_json[0], dict) and 'generated_text' in response_json[0]:
+
+        data['parameters'] = parameters
+        return data
+
+    def _preflight(self, prompt: str):
+        # reject prompts that are too long before they wait in any queue, truncation happens in _payload
+        if self.token_budget is not None and self.token_budget.policy == "reject":
+            self.token_budget.fit_prompt(prompt, self.parameters)
+
+    def _estimate_tokens(self, data: dict) -> int:
+        return estimate_tokens(data["inputs"], self.parameters)
+
+    @staticmethod
+    def _replies(response_json) -> List[str]:
+        if isinstance(response_json, list):
+            try:
                 # if the response is as expected
-                generated_text = [item['generated_text'] for item in response_json]
-                return {"replies": generated_text}
+                return [item['generated_text'] for item in response_json]
+            except (TypeError, KeyError):
+                pass
+        elif isinstance(response_json, dict):
+            if 'generated_text' in response_json:
+                return [response_json['generated_text']]
+            if 'error' in response_json:
+                raise EndpointError(f"Query failed: {response_json['error']}")
+        # if the response is not as expected, just return the raw response
+        return [str(response_json)]
+
+    @staticmethod
+    def _decode(body: bytes):
+        try:
+            return loads(body)
+        except ValueError as e:
+            raise EndpointError(f"The endpoint did not answer with JSON: {body[:200]!r}") from e
+
+    @staticmethod
+    def _read_body(response: requests.Response, limit: Optional[int], truncate: bool = False) -> bytes:
+        # read the body chunk by chunk, giving up (or cutting it short) once it outgrows the limit
+        with response:
+            length = response.headers.get("Content-Length")
+            if not truncate and limit is not None and length is not None and int(length) > limit:
+                raise ResponseTooLargeError(f"Response of {length} bytes is over the limit of {limit} bytes")
+            chunks = []
+            size = 0
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                size += len(chunk)
+                if limit is not None and size > limit:
+                    if truncate:
+                        chunks.append(chunk[:len(chunk) - (size - limit)])
+                        break
+                    raise ResponseTooLargeError(f"Response is over the limit of {limit} bytes")
+                chunks.append(chunk)
+            return b"".join(chunks)
+
+    def _batch_replies(self, response_json, expected: int) -> List[List[str]]:
+        # endpoints answer a list of inputs with one generation, or one list of generations, per input
+        if not isinstance(response_json, list) or len(response_json) != expected:
+            raise EndpointError(f"Expected {expected} generations in the batched response, got: {response_json}")
+        return [self._replies(item if isinstance(item, list) else [item]) for item in response_json]
+
+    @staticmethod
+    def _replica_url(replica: Replica, path: str) -> str:
+        return replica.url.rstrip("/") + path if path else replica.url
+
+    def _health_check(self, url: str) -> bool:
+        health_url = url.rstrip("/") + self.health_check_path
+        return self._get_session().get(health_url, headers=self.headers, timeout=5).status_code == 200
+
+    def _begin(self, replica: Replica, payload: bytes):
+        if self.metrics is not None:
+            self.metrics.in_flight.inc(endpoint=replica.url)
+            self.metrics.request_bytes.inc(len(payload), endpoint=replica.url)
+
+    def _release(self, replica: Replica, started: float, status: Union[int, str], received: int = 0,
+                 failed: bool = False, answered: bool = True, streamed: bool = False):
+        # every request acquired from the pool ends here, answered or not
+        latency = time.monotonic() - started
+        self.replicas.release(replica, latency=latency if answered else None, failed=failed)
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.record(replica.url, not failed if answered or failed else None)
+        if self.concurrency_limiter is not None:
+            # the length of a stream depends on the generation, not on how loaded the endpoint is
+            self.concurrency_limiter.release(latency=latency if status == 200 and not streamed else None,
+                                             overloaded=status in (429, 503, 504, "error"))
+        if self.metrics is not None:
+            self.metrics.in_flight.dec(endpoint=replica.url)
+            self.metrics.requests.inc(endpoint=replica.url, status=str(status))
+            if answered:
+                self.metrics.latency.observe(latency, endpoint=replica.url)
+            if received:
+                self.metrics.response_bytes.inc(received, endpoint=replica.url)
+
+    def _on_retry(self, error: TransientEndpointError):
+        if self.metrics is not None:
+            self.metrics.retries.inc()
+
+    def _encode(self, data: dict) -> tuple:
+        # returns the request body and the headers it needs on top of the usual ones
+        payload = dumps(data)
+        if self.request_compression is None or len(payload) < self.compression_threshold:
+            return payload, {}
+        if self.request_compression == "gzip":
+            payload = gzip.compress(payload, compresslevel=COMPRESSION_LEVEL)
+        else:
+            payload = zlib.compress(payload, COMPRESSION_LEVEL)
+        return payload, {"Content-Encoding": self.request_compression}
+
+    def _check_circuits(self):
+        if self.circuit_breaker is not None and all(
+                self.circuit_breaker.is_open(replica.url) for replica in self.replicas.replicas):
+            raise CircuitOpenError(f"Circuits of {self.api_url} are open, not sending the query")
+
+    def _acquire_replica(self, tried: Optional[List[Replica]]) -> Replica:
+        # hedged attempts of the same request avoid the replicas already tried, and all attempts avoid open circuits
+        exclude = list(tried or [])
+        if self.circuit_breaker is not None:
+            exclude += [replica for replica in self.replicas.replicas if self.circuit_breaker.is_open(replica.url)]
+        replica = self.replicas.acquire(exclude=exclude)
+        if self.circuit_breaker is not None:
+            try:
+                self.circuit_breaker.allow(replica.url)
+            except CircuitOpenError:
+                self.replicas.release(replica)
+                if self.concurrency_limiter is not None:
+                    self.concurrency_limiter.release()
+                raise
+        if tried is not None:
+            tried.append(replica)
+        return replica
+
+    def _send(self, path: str, data: dict, headers: Optional[dict] = None, stream: bool = False,
+              tried: Optional[List[Replica]] = None, deadline: Optional[float] = None) -> requests.Response:
+        check_deadline(deadline)
+        self._check_circuits()
+        # encoding can fail on parameters that don't serialize, before any slot or replica is taken
+        payload, encoding_headers = self._encode(data)
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(self._estimate_tokens(data), deadline=deadline)
+        if self.concurrency_limiter is not None:
+            self.concurrency_limiter.acquire(deadline)
+        try:
+            timeout = bounded_timeout(self.connect_timeout, self.read_timeout, deadline)
+        except DeadlineExceededError:
+            if self.concurrency_limiter is not None:
+                self.concurrency_limiter.release()
+            raise
+        replica = self._acquire_replica(tried)
+        started = time.monotonic()
+        # how the request ended, for the single _release below; a stream handed over to _stream is released there
+        status, received, failed, answered, handed_over = "error", 0, False, False, False
+        try:
+            self._begin(replica, payload)
+            try:
+                # the body is only read once the status is known, and never past max_response_bytes
+                response = self._get_session().post(self._replica_url(replica, path),
+                                                    headers={**(headers or self.headers), **encoding_headers},
+                                                    data=payload, stream=True, timeout=timeout)
+                if response.status_code != 200:
+                    body = self._read_body(response, MAX_ERROR_BODY_BYTES, truncate=True)
+                elif not stream:
+                    body = self._read_body(response, self.max_response_bytes)
+            except requests.RequestException as e:
+                # connection errors, timeouts, but also bodies that fail to decompress
+                if deadline is not None and time.time() >= deadline:
+                    # our own deadline cut the request short, that says nothing about the replica's health
+                    status = "deadline"
+                    raise DeadlineExceededError(f"Deadline exceeded while waiting for the endpoint: {e}") from e
+                failed = True
+                raise TransientEndpointError(f"Query failed: {e}") from e
+            except ResponseTooLargeError:
+                status, answered = "too_large", True
+                raise
+
+            status, answered = response.status_code, True
+            if response.status_code != 200:
+                received, failed = len(body), response.status_code >= 500
+                raise error_from_response(response.status_code, body.decode("utf-8", errors="replace"),
+                                          response.headers)
+            if stream:
+                # the replica stays busy until the whole stream is read, _stream releases it
+                response.replica = replica
+                response.started = started
+                handed_over = True
             else:
-                # if the response is not as expected, just return the raw response
-                return {"replies": [str(response_json)]}
+                received = len(body)
+                # requests keeps a body it has read in _content, so `response.content` returns it as usual
+                response._content = body
+            return response
+        finally:
+            if not handed_over:
+                self._release(replica, started, status, received=received, failed=failed, answered=answered)
+
+    def _with_retries(self, func, deadline: Optional[float] = None):
+        if self.retry_policy is None:
+            return func()
+        return self.retry_policy.call(func, deadline=deadline, on_retry=self._on_retry)
+
+    def _post(self, data: dict, deadline: Optional[float] = None):
+        if self.hedging is None:
+            send = lambda: self._send(self.generate_path, data, deadline=deadline)
         else:
-            raise Exception(f"Query failed with status code {response.status_code}: {response.text}")
\ No newline at end of file
+            send = lambda: self.hedging.call(
+                lambda tried: self._send(self.generate_path, data, tried=tried, deadline=deadline))
+        return self._decode(self._with_retries(send, deadline=deadline).content)
+
+    @classmethod
+    def _sse_events(cls, response) -> Iterator[dict]:
+        # decode server-sent events as their lines arrive, one JSON document per event
+        data_lines = []
+        for line in response.iter_lines(chunk_size=None):
+            if line:
+                if line.startswith(b"data:"):
+                    data = line[5:]
+                    data_lines.append(data[1:] if data.startswith(b" ") else data)
+                continue
+            if data_lines:
+                data = b"\n".join(data_lines)
+                data_lines = []
+                if data != b"[DONE]":
+                    yield cls._sse_data(data)
+        if data_lines and data_lines != [b"[DONE]"]:
+            yield cls._sse_data(b"\n".join(data_lines))
+
+    @staticmethod
+    def _sse_data(data: bytes) -> dict:
+        # an event cut short by a dropped connection is as transient as the connection itself
+        try:
+            return loads(data)
+        except ValueError as e:
+            raise TransientEndpointError(f"Malformed streaming event: {data[:200]!r}") from e
+
+    def _stream(self, prompt: str, deadline: Optional[float] = None) -> List[str]:
+        headers = {**self.headers, "Accept": "text/event-stream"}
+        data = self._payload(prompt)
+        # only opening the stream is retried, tokens already handed to the callback can't be taken back
+        response = self._with_retries(
+            lambda: self._send(self.stream_path, data, headers=headers, stream=True, deadline=deadline),
+            deadline=deadline)
+        tokens = []
+        generated_text = None
+        first_token = None
+        # a stream broken partway, or ended by an error event, counts as a failure of the replica
+        failed = False
+        try:
+            with response:
+                for event in self._sse_events(response):
+                    if "error" in event:
+                        raise EndpointError(f"Streaming query failed: {event['error']}")
+                    token = event.get("token") or {}
+                    if not token.get("special", False):
+                        first_token = first_token or time.monotonic()
+                        tokens.append(token.get("text", ""))
+                        metadata = {"token": token, "details": event.get("details")}
+                        self.streaming_callback(StreamingChunk(content=tokens[-1], metadata=metadata))
+                    if event.get("generated_text") is not None:
+                        generated_text = event["generated_text"]
+        except requests.RequestException as e:
+            failed = True
+            raise TransientEndpointError(f"Streaming query failed: {e}") from e
+        except EndpointError:
+            failed = True
+            raise
+        finally:
+            self._release_stream(response, first_token, len(tokens), failed)
+
+        # the last event carries the full text; fall back to the streamed tokens if it doesn't
+        return [generated_text if generated_text is not None else "".join(tokens)]
+
+    def _release_stream(self, response: requests.Response, first_token: Optional[float], tokens: int,
+                        failed: bool = False):
+        status = "error" if failed else response.status_code
+        self._release(response.replica, response.started, status, failed=failed, answered=not failed, streamed=True)
+        if self.metrics is not None:
+            self.metrics.observe_stream(response.replica.url, response.started, first_token, time.monotonic(), tokens)
+
+    def _send_batch(self, prompts: List[str], deadline: Optional[float] = None) -> List[List[str]]:
+        return self._batch_replies(self._post(self._payload(prompts), deadline=deadline), len(prompts))
+
+    def _send_micro_batch(self, items: List[tuple]) -> List[List[str]]:
+        # the batch is given as long as its most patient caller allows, the others stop waiting on their own
+        deadlines = [deadline for _, deadline in items]
+        deadline = None if None in deadlines else max(deadlines)
+        return self._send_batch([prompt for prompt, _ in items], deadline=deadline)
+
+    def _get_micro_batcher(self) -> MicroBatcher:
+        with self._session_lock:
+            if self._micro_batcher is None:
+                self._micro_batcher = MicroBatcher(self._send_micro_batch, max_batch_size=self.micro_batch_size,
+                                                   max_wait=self.micro_batch_wait)
+            return self._micro_batcher
+
+    def _fetch(self, prompt: str, deadline: Optional[float] = None) -> List[str]:
+        if self.micro_batch_size is None:
+            return self._replies(self._post(self._payload(prompt), deadline=deadline))
+        check_deadline(deadline)
+        try:
+            return self._get_micro_batcher().submit((prompt, deadline)).result(timeout=remaining(deadline))
+        except FutureTimeoutError as e:
+            raise DeadlineExceededError("Deadline exceeded while waiting for the micro-batch") from e
+
+    def _query(self, prompt: str, deadline: Optional[float] = None) -> List[str]:
+        if self.coalescer is None:
+            return self._fetch(prompt, deadline)
+        key = self._request_key(prompt)
+        try:
+            replies = self.coalescer.do(key, lambda: self._fetch(prompt, deadline), timeout=remaining(deadline))
+        except TimeoutError as e:
+            raise DeadlineExceededError("Deadline exceeded while waiting for the coalesced query") from e
+        # every caller gets its own list, the coalesced ones share the reply strings only
+        return list(replies)
+
+    def _request_key(self, prompt: str) -> str:
+        # built from the request actually sent, so generators sending different bodies never share replies
+        return make_cache_key([self.api_url, self.generate_path], prompt, self._payload(prompt))
+
+    def _cache_key(self, prompt: str) -> Optional[str]:
+        if self.cache is None or not self.cache.is_cacheable(self.parameters):
+            return None
+        return self._request_key(prompt)
+
+    def _cached_replies(self, key: Optional[str]) -> Optional[List[str]]:
+        if key is None:
+            return None
+        replies = self.cache.get(key)
+        if replies is not None and self.streaming_callback is not None:
+            # nothing to stream token by token, hand the whole reply over at once
+            for reply in replies:
+                self.streaming_callback(StreamingChunk(content=reply, metadata={"cached": True}))
+        return replies
+
+    def _scheduled(self, priority: Optional[str], cost: float, deadline: Optional[float]):
+        if self.scheduler is None:
+            return nullcontext()
+        return self.scheduler.slot(priority, cost=cost, deadline=deadline)
+
+    @component.output_types(replies=List[str])
+    def run(self, prompt:str, deadline: Optional[float] = None, priority: Optional[str] = None) -> dict:
+        """
+        Query the model with a prompt and optional parameters.
+
+        :param prompt: A string containing the input prompt for the query.
+        :param deadline: Optional absolute `time.time()` by which the answer is needed. It can be passed
+            in the `Pipeline.run` inputs, see `run_with_deadline`. Queries past their deadline are not sent
+            and raise `DeadlineExceededError`.
+        :param priority: Class of the query for the `scheduler`, such as `interactive` or `batch`.
+            Defaults to the default class of the scheduler.
+        :return: A dictionary containing the model's response.
+        """
+        key = self._cache_key(prompt)
+        replies = self._cached_replies(key)
+        if replies is not None:
+            return {"replies": replies}
+        self._preflight(prompt)
+
+        with self._scheduled(priority, 1, deadline):
+            if self.streaming_callback is not None:
+                replies = self._stream(prompt, deadline)
+            else:
+                replies = self._query(prompt, deadline)
+        if key is not None:
+            self.cache.set(key, replies)
+        return {"replies": replies}
+
+    def run_batch(self, prompts: List[str], batch_size: Optional[int] = None, deadline: Optional[float] = None,
+                  priority: Optional[str] = None) -> dict:
+        """
+        Query the model with many prompts, sending them in batches of list-valued `inputs`
+        so that the endpoint can generate them together.
+
+        :param prompts: The input prompts.
+        :param batch_size: Overrides the batch size given at init time.
+        :param deadline: Optional absolute `time.time()` by which all the answers are needed.
+        :param priority: Class of the batches for the `scheduler`, each one costing its number of prompts.
+        :return: A dictionary whose `replies` holds the list of replies of each prompt, in input order.
+        """
+        batch_size = batch_size or self.batch_size
+        keys = [self._cache_key(prompt) for prompt in prompts]
+        replies = [self.cache.get(key) if key is not None else None for key in keys]
+        # only the prompts missing from the cache are sent
+        missing = [index for index, reply in enumerate(replies) if reply is None]
+        for index in missing:
+            self._preflight(prompts[index])
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            batch_prompts = [prompts[index] for index in batch]
+            with self._scheduled(priority, len(batch_prompts), deadline):
+                batch_replies = self._send_batch(batch_prompts, deadline)
+            for index, reply in zip(batch, batch_replies):
+                replies[index] = reply
+                if keys[index] is not None:
+                    self.cache.set(keys[index], reply)
+        return {"replies": replies}
+
+
+@component
+class AsyncInferenceEndpointAPI(InferenceEndpointAPI):
+    """
+    InferenceEndpointAPI that can also be awaited with `run_async`.
+
+    Prompts sent through `run_async` share one aiohttp session and at most `max_concurrency`
+    of them are in flight at the same time, so a single event loop can keep many requests
+    open against the endpoint. With a `streaming_callback`, `run_async` streams through `run` in the
+    shared executor of async pipelines, so the callback is called from one of its threads.
+    `run` keeps working synchronously, so the component can still be added to a regular Pipeline.
+    """
+
+    def __init__(self, api_url: Union[str, List[str]], api_key: str, parameters:dict, max_concurrency: int = 100,
+                 **kwargs):
+        """
+        :param max_concurrency: Maximum number of `run_async` requests in flight at once.
+        :param kwargs: Other settings, see `InferenceEndpointAPI`.
+        """
+        aiohttp_import.check()
+        # @component rebuilds the class, so the zero-argument form of super() can't be used here
+        InferenceEndpointAPI.__init__(self, api_url=api_url, api_key=api_key, parameters=parameters, **kwargs)
+        self.max_concurrency = max_concurrency
+        # aiohttp sessions and asyncio semaphores belong to the loop that created them
+        self._client_session: Optional["aiohttp.ClientSession"] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def _get_client_session(self) -> "aiohttp.ClientSession":
+        loop = asyncio.get_running_loop()
+        if self._client_session is None or self._client_session.closed or self._loop is not loop:
+            if self._client_session is not None and not self._client_session.closed:
+                await self._close_stale_session(self._client_session, self._loop)
+            connector = aiohttp.TCPConnector(
+                limit=self.max_concurrency,
+                limit_per_host=self.max_concurrency,
+                keepalive_timeout=self.keep_alive_timeout,
+            )
+            self._client_session = aiohttp.ClientSession(headers=self.headers, connector=connector)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._client_session
+
+    @staticmethod
+    async def _close_stale_session(session: "aiohttp.ClientSession", loop: asyncio.AbstractEventLoop):
+        # the session of another loop is closed on that loop while it still runs, in another thread,
+        # otherwise its connections are dropped here, as that loop won't serve them anymore
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+        else:
+            await session.close()
+
+    async def aclose(self):
+        """
+        Close the aiohttp session. Await it on the event loop that sent the requests.
+        """
+        if self._client_session is not None:
+            await self._client_session.close()
+            self._client_session = None
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    @staticmethod
+    async def _read_body_async(response: "aiohttp.ClientResponse", limit: Optional[int],
+                               truncate: bool = False) -> bytes:
+        length = response.content_length
+        if not truncate and limit is not None and length is not None and length > limit:
+            raise ResponseTooLargeError(f"Response of {length} bytes is over the limit of {limit} bytes")
+        chunks = []
+        size = 0
+        async for chunk in response.content.iter_chunked(64 * 1024):
+            size += len(chunk)
+            if limit is not None and size > limit:
+                if truncate:
+                    chunks.append(chunk[:len(chunk) - (size - limit)])
+                    break
+                raise ResponseTooLargeError(f"Response is over the limit of {limit} bytes")
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    async def _send_async(self, data: dict, tried: Optional[List[Replica]] = None,
+                          deadline: Optional[float] = None) -> bytes:
+        check_deadline(deadline)
+        self._check_circuits()
+        payload, encoding_headers = self._encode(data)
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire_async(self._estimate_tokens(data), deadline=deadline)
+        session = await self._get_client_session()
+        async with self._semaphore:
+            check_deadline(deadline)
+            if self.concurrency_limiter is not None:
+                await self.concurrency_limiter.acquire_async(deadline)
+            timeout = aiohttp.ClientTimeout(total=remaining(deadline), sock_connect=self.connect_timeout,
+                                            sock_read=self.read_timeout)
+            replica = self._acquire_replica(tried)
+            started = time.monotonic()
+            status, received, failed, answered = "error", 0, False, False
+            try:
+                self._begin(replica, payload)
+                async with session.post(self._replica_url(replica, self.generate_path), data=payload,
+                                        headers=encoding_headers, timeout=timeout) as response:
+                    if response.status != 200:
+                        body = await self._read_body_async(response, MAX_ERROR_BODY_BYTES, truncate=True)
+                    else:
+                        body = await self._read_body_async(response, self.max_response_bytes)
+                status, received, failed, answered = response.status, len(body), response.status >= 500, True
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if deadline is not None and time.time() >= deadline:
+                    status = "deadline"
+                    raise DeadlineExceededError(f"Deadline exceeded while waiting for the endpoint: {e}") from e
+                failed = True
+                raise TransientEndpointError(f"Query failed: {e}") from e
+            except asyncio.CancelledError:
+                # the losing attempt of a hedged request
+                status = "cancelled"
+                raise
+            except ResponseTooLargeError:
+                status, answered = "too_large", True
+                raise
+            finally:
+                self._release(replica, started, status, received=received, failed=failed, answered=answered)
+
+        if response.status != 200:
+            raise error_from_response(response.status, body.decode("utf-8", errors="replace"), response.headers)
+        return body
+
+    async def _query_async(self, prompt: str, deadline: Optional[float] = None) -> List[str]:
+        data = self._payload(prompt)
+        if self.hedging is None:
+            send = lambda: self._send_async(data, deadline=deadline)
+        else:
+            send = lambda: self.hedging.call_async(lambda tried: self._send_async(data, tried=tried, deadline=deadline))
+        if self.retry_policy is None:
+            body = await send()
+        else:
+            body = await self.retry_policy.call_async(send, deadline=deadline, on_retry=self._on_retry)
+        return self._replies(self._decode(body))
+
+    async def _run_query_async(self, prompt: str, deadline: Optional[float]) -> List[str]:
+        if self.coalescer is None:
+            return await self._query_async(prompt, deadline)
+        flight_key = self._request_key(prompt)
+        try:
+            replies = await self.coalescer.do_async(flight_key, lambda: self._query_async(prompt, deadline),
+                                                    timeout=remaining(deadline))
+        except asyncio.TimeoutError as e:
+            raise DeadlineExceededError("Deadline exceeded while waiting for the coalesced query") from e
+        return list(replies)
+
+    async def run_async(self, prompt:str, deadline: Optional[float] = None, priority: Optional[str] = None) -> dict:
+        """
+        Query the model with a prompt without blocking the event loop.
+
+        :param prompt: A string containing the input prompt for the query.
+        :param deadline: Optional absolute `time.time()` by which the answer is needed, see `run`.
+        :param priority: Class of the query for the `scheduler`, see `run`.
+        :return: A dictionary containing the model's response.
+        """
+        if self.streaming_callback is not None:
+            # tokens are streamed by `run`, in the shared executor so the event loop isn't blocked
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(shared_executor(),
+                                              functools.partial(self.run, prompt, deadline=deadline, priority=priority))
+        key = self._cache_key(prompt)
+        if key is not None:
+            replies = self.cache.get(key)
+            if replies is not None:
+                return {"replies": replies}
+        self._preflight(prompt)
+
+        if self.scheduler is not None:
+            await self.scheduler.acquire_async(priority, deadline=deadline)
+        try:
+            replies = await self._run_query_async(prompt, deadline)
+        finally:
+            if self.scheduler is not None:
+                self.scheduler.release(priority)
+        if key is not None:
+            self.cache.set(key, replies)
+        return {"replies": replies}
@@ -0,0 +1,33 @@
+import json
+from typing import Any
+
+from haystack.preview.lazy_imports import LazyImport
+
+with LazyImport("Run 'pip install orjson'") as orjson_import:
+    import orjson
+
+
+def has_fast_json() -> bool:
+    """
+    Whether orjson is installed and used to encode requests and decode responses.
+    """
+    return orjson_import.is_successful()
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    Encode `obj` as compact UTF-8 JSON, with orjson when it is installed.
+    """
+    if has_fast_json():
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data: bytes) -> Any:
+    """
+    Decode a JSON document, with orjson when it is installed. Raises `ValueError` on invalid JSON,
+    whichever library decodes it.
+    """
+    if has_fast_json():
+        return orjson.loads(data)
+    return json.loads(data)
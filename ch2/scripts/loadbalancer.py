@@ -0,0 +1,144 @@
+import time
+import random
+import logging
+import threading
+from typing import Callable, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+
+class Replica:
+    """
+    Book-keeping of one replica of an endpoint.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.in_flight = 0
+        # moving average of the latency in seconds, None until the first answer
+        self.latency: Optional[float] = None
+        self.consecutive_failures = 0
+        self.ejected_until: Optional[float] = None
+
+    def is_available(self, now: float) -> bool:
+        return self.ejected_until is None or self.ejected_until <= now
+
+    def __repr__(self):
+        return f"Replica({self.url!r}, in_flight={self.in_flight}, latency={self.latency})"
+
+
+class ReplicaPool:
+    """
+    Spreads requests over the replicas of an endpoint.
+
+    Each request goes to the available replica with the fewest requests in flight (`least_outstanding`),
+    or with the lowest moving-average latency weighted by its requests in flight (`latency`).
+    A replica failing `failure_threshold` times in a row is ejected for `cooldown` seconds. After that
+    it is re-admitted if `health_check` says it is healthy, otherwise it stays out for another cooldown.
+    If every replica is ejected, the one coming back first is used anyway rather than failing outright.
+    """
+
+    STRATEGIES = ("least_outstanding", "latency")
+
+    def __init__(self, urls: Union[str, List[str]], strategy: str = "least_outstanding", failure_threshold: int = 3,
+                 cooldown: float = 30.0, latency_smoothing: float = 0.2,
+                 health_check: Optional[Callable[[str], bool]] = None):
+        """
+        :param urls: URL, or list of URLs, of the replicas.
+        :param strategy: `least_outstanding` or `latency`.
+        :param failure_threshold: Number of consecutive failures after which a replica is ejected.
+        :param cooldown: Seconds an ejected replica stays out of rotation.
+        :param latency_smoothing: Weight of the newest sample in the moving-average latency.
+        :param health_check: Function called with the URL of an ejected replica once its cooldown is over,
+            returning whether it may be re-admitted. Without it, replicas come back as soon as the cooldown ends.
+        """
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown load balancing strategy '{strategy}', use one of {self.STRATEGIES}.")
+        urls = [urls] if isinstance(urls, str) else list(urls)
+        if not urls:
+            raise ValueError("At least one replica URL must be provided.")
+        self.replicas = [Replica(url) for url in urls]
+        self.strategy = strategy
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.latency_smoothing = latency_smoothing
+        self.health_check = health_check
+        self._lock = threading.Lock()
+
+    def _load(self, replica: Replica) -> tuple:
+        if self.strategy == "latency":
+            # replicas without a measurement yet are tried first
+            return ((replica.latency or 0.0) * (replica.in_flight + 1), replica.in_flight, random.random())
+        return (replica.in_flight, replica.latency or 0.0, random.random())
+
+    def _readmit(self, now: float):
+        # the replicas due for a health check are claimed under the lock by pushing their cooldown back,
+        # so only the first caller probes them while the others keep using the available replicas
+        with self._lock:
+            due = [replica for replica in self.replicas
+                   if replica.ejected_until is not None and replica.ejected_until <= now]
+            for replica in due:
+                if self.health_check is None:
+                    self._readmit_replica(replica)
+                else:
+                    replica.ejected_until = now + self.cooldown
+        if self.health_check is None:
+            return
+        # health checks do network calls, they run without the lock held
+        for replica in due:
+            if self._is_healthy(replica):
+                with self._lock:
+                    self._readmit_replica(replica)
+
+    def _readmit_replica(self, replica: Replica):
+        logger.info("Re-admitting replica %s", replica.url)
+        replica.ejected_until = None
+        replica.consecutive_failures = 0
+
+    def _is_healthy(self, replica: Replica) -> bool:
+        try:
+            return bool(self.health_check(replica.url))
+        except Exception:
+            return False
+
+    def acquire(self, exclude: Optional[List[Replica]] = None) -> Replica:
+        """
+        Pick the replica for the next request and count it as in flight. Must be paired with `release`.
+
+        :param exclude: Replicas to avoid if any other one is available.
+        """
+        now = time.monotonic()
+        if any(replica.ejected_until is not None and replica.ejected_until <= now for replica in self.replicas):
+            self._readmit(now)
+        with self._lock:
+            candidates = [replica for replica in self.replicas if replica.is_available(now)]
+            if exclude:
+                candidates = [replica for replica in candidates if replica not in exclude] or candidates
+            if candidates:
+                replica = min(candidates, key=self._load)
+            else:
+                replica = min(self.replicas, key=lambda replica: replica.ejected_until)
+            replica.in_flight += 1
+            return replica
+
+    def release(self, replica: Replica, latency: Optional[float] = None, failed: bool = False):
+        """
+        Record the outcome of a request sent to `replica`.
+
+        :param latency: Seconds the replica took to answer, if it answered.
+        :param failed: Whether the replica looked unhealthy (connection error, server error).
+        """
+        with self._lock:
+            replica.in_flight -= 1
+            if latency is not None:
+                if replica.latency is None:
+                    replica.latency = latency
+                else:
+                    replica.latency += self.latency_smoothing * (latency - replica.latency)
+            if not failed:
+                replica.consecutive_failures = 0
+                return
+            replica.consecutive_failures += 1
+            if replica.consecutive_failures >= self.failure_threshold and replica.ejected_until is None:
+                logger.warning("Ejecting replica %s for %s seconds", replica.url, self.cooldown)
+                replica.ejected_until = time.monotonic() + self.cooldown
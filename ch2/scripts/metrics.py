@@ -0,0 +1,305 @@
+import math
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from haystack.preview import component
+
+from .asyncpipeline import run_component_async
+
+# latency buckets in seconds, stretched beyond the Prometheus defaults since generations take a while
+DEFAULT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+RATE_BUCKETS = (1.0, 5.0, 10.0, 25.0, 50.0, 100.0, 250.0, 500.0, 1000.0)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metric {self.name} takes the labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> Iterator[Tuple[str, Sequence[str], Sequence[str], float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for name, labelnames, labelvalues, value in self._samples():
+            lines.append(f"{name}{_format_labels(labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """
+    Value that only goes up, such as a number of requests.
+    """
+
+    type = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield self.name, self.labelnames, key, value
+
+
+class Gauge(Counter):
+    """
+    Value that goes up and down, such as a number of requests in flight.
+    """
+
+    type = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values, counted in cumulative buckets as Prometheus expects.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][index] += 1
+                    break
+            state["sum"] += value
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return sum(state["counts"]) if state else 0
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((key, list(state["counts"]), state["sum"]) for key, state in self._values.items())
+        bucket_labels = self.labelnames + ("le",)
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield f"{self.name}_bucket", bucket_labels, key + (_format_value(bound),), cumulative
+            yield f"{self.name}_sum", self.labelnames, key, total
+            yield f"{self.name}_count", self.labelnames, key, cumulative
+
+
+class MetricsRegistry:
+    """
+    Holds metrics by name and renders them in the Prometheus text exposition format.
+
+    Metrics are created on first use and returned as is afterwards, so that components sharing a
+    registry share their metrics. Anything with a `render() -> str` method can stand in for it,
+    for example an adapter around `prometheus_client`.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, documentation: str, labelnames: Sequence[str], **kwargs) -> _Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif type(metric) is not cls or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} is already registered as a different {metric.type}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = [line for metric in metrics for line in metric.render()]
+        return "\n".join(lines) + "\n"
+
+
+class EndpointMetrics:
+    """
+    The metrics recorded by the endpoint components, labelled by replica URL (`endpoint`).
+
+    Request latency, status codes (`error` when no answer came back), bytes sent and received,
+    retries and requests in flight are recorded for every request. Time to first token and
+    tokens per second are recorded for streamed generations.
+    """
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None, prefix: str = "llm_endpoint"):
+        """
+        :param registry: Registry the metrics are added to, a new one by default.
+        :param prefix: Prefix of the metric names.
+        """
+        self.registry = registry if registry is not None else MetricsRegistry()
+        labels = ("endpoint",)
+        self.requests = self.registry.counter(f"{prefix}_requests_total", "Requests sent, by status code.",
+                                              labels + ("status",))
+        self.latency = self.registry.histogram(f"{prefix}_request_duration_seconds",
+                                               "Time until the whole answer was received.", labels)
+        self.time_to_first_token = self.registry.histogram(f"{prefix}_time_to_first_token_seconds",
+                                                           "Time until the first streamed token.", labels)
+        self.tokens_per_second = self.registry.histogram(f"{prefix}_tokens_per_second",
+                                                         "Streamed tokens per second of generation.", labels,
+                                                         buckets=RATE_BUCKETS)
+        self.request_bytes = self.registry.counter(f"{prefix}_request_bytes_total", "Bytes of request bodies sent.",
+                                                   labels)
+        self.response_bytes = self.registry.counter(f"{prefix}_response_bytes_total",
+                                                    "Bytes of response bodies received.", labels)
+        # a retry may go to another replica than the failed attempt, so retries aren't labelled
+        self.retries = self.registry.counter(f"{prefix}_retries_total", "Attempts retried after a transient failure.")
+        self.in_flight = self.registry.gauge(f"{prefix}_in_flight_requests", "Requests waiting for an answer.", labels)
+
+    def observe_stream(self, endpoint: str, started: float, first_token: Optional[float], finished: float,
+                       tokens: int):
+        """
+        Record the time to first token and the generation speed of a streamed answer, from `time.monotonic()` times.
+        """
+        if first_token is None:
+            return
+        self.time_to_first_token.observe(first_token - started, endpoint=endpoint)
+        if tokens > 1 and finished > first_token:
+            # the first token mostly measures the prompt processing, the speed is measured after it
+            self.tokens_per_second.observe((tokens - 1) / (finished - first_token), endpoint=endpoint)
+
+
+@component
+class InstrumentedGenerator:
+    """
+    Wraps any generator component, for example `GPTGenerator`, to record how long its runs take, how many
+    are in progress and how many fail, labelled by component name. It has the same inputs and outputs as
+    the generator it wraps.
+    """
+
+    def __init__(self, generator, registry: MetricsRegistry, name: str, prefix: str = "llm_generator"):
+        """
+        :param generator: The generator component to wrap.
+        :param registry: Registry the metrics are added to, usually shared by every component.
+        :param name: Value of the `component` label, usually the name of the component in the pipeline.
+        :param prefix: Prefix of the metric names.
+        """
+        self.generator = generator
+        self.name = name
+        labels = ("component",)
+        self.runs = registry.counter(f"{prefix}_runs_total", "Generator runs, by outcome.", labels + ("outcome",))
+        self.latency = registry.histogram(f"{prefix}_run_duration_seconds", "Time taken by generator runs.", labels)
+        self.in_flight = registry.gauge(f"{prefix}_in_flight_runs", "Generator runs in progress.", labels)
+        self.__canals_input__ = dict(getattr(generator, "__canals_input__", {}))
+        self.__canals_output__ = dict(getattr(generator, "__canals_output__", {}))
+
+    def warm_up(self):
+        if hasattr(self.generator, "warm_up"):
+            self.generator.warm_up()
+
+    def close(self):
+        if hasattr(self.generator, "close"):
+            self.generator.close()
+
+    def run(self, **kwargs) -> Dict[str, Any]:
+        self.in_flight.inc(component=self.name)
+        started = time.monotonic()
+        outcome = "error"
+        try:
+            result = self.generator.run(**kwargs)
+            outcome = "ok"
+            return result
+        finally:
+            self._record(started, outcome)
+
+    async def run_async(self, **kwargs) -> Dict[str, Any]:
+        self.in_flight.inc(component=self.name)
+        started = time.monotonic()
+        outcome = "error"
+        try:
+            result = await run_component_async(self.generator, **kwargs)
+            outcome = "ok"
+            return result
+        finally:
+            self._record(started, outcome)
+
+    def _record(self, started: float, outcome: str):
+        self.in_flight.dec(component=self.name)
+        self.latency.observe(time.monotonic() - started, component=self.name)
+        self.runs.inc(component=self.name, outcome=outcome)
+
+
+def start_metrics_server(registry, host: str = "127.0.0.1", port: int = 9100) -> ThreadingHTTPServer:
+    """
+    Serve `registry.render()` at `/metrics` from a background thread, for Prometheus to scrape.
+    Call `shutdown()` on the returned server to stop it; port 0 picks a free port.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
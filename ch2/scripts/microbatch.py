@@ -0,0 +1,119 @@
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """
+    Merges prompts submitted concurrently from many threads into batched requests.
+
+    A collector thread waits for the first prompt, then keeps collecting until `max_batch_size` prompts
+    are queued or `max_wait` seconds have passed, and hands the batch to `send_batch`. Up to
+    `max_concurrent_batches` batches are in flight at once; while they are, new prompts keep piling up
+    into the next batch. Each caller gets the replies of its own prompt, or the error of its batch.
+    """
+
+    def __init__(self, send_batch: Callable[[List[Any]], List[Any]], max_batch_size: int = 8,
+                 max_wait: float = 0.005, max_concurrent_batches: int = 4):
+        """
+        :param send_batch: Sends a list of prompts and returns their results, in the same order.
+        :param max_batch_size: Maximum number of prompts per batch.
+        :param max_wait: Seconds to wait for more prompts after the first one of a batch.
+        :param max_concurrent_batches: Maximum number of batches in flight at once.
+        """
+        self.send_batch = send_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_concurrent_batches = max_concurrent_batches
+        self.batches = 0
+        self.prompts = 0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._slots = threading.Semaphore(max_concurrent_batches)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent_batches,
+                                                    thread_name_prefix="micro-batch")
+                self._thread = threading.Thread(target=self._collect, args=(self._executor,),
+                                                name="micro-batch-collector", daemon=True)
+                self._thread.start()
+
+    def submit(self, prompt: Any) -> Future:
+        """
+        Queue a prompt, returning a future resolved with its result.
+        """
+        self._start()
+        future: Future = Future()
+        self._queue.put((prompt, future))
+        return future
+
+    def __call__(self, prompt: Any) -> Any:
+        """
+        Queue a prompt and block until its result is available.
+        """
+        return self.submit(prompt).result()
+
+    def close(self):
+        """
+        Stop the collector thread once the prompts already queued have been sent.
+        """
+        with self._lock:
+            thread, executor = self._thread, self._executor
+            self._thread = self._executor = None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+            executor.shutdown(wait=True)
+
+    def _collect(self, executor: ThreadPoolExecutor):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            # wait for a free slot; meanwhile the next prompts keep queueing up
+            self._slots.acquire()
+            executor.submit(self._send, batch)
+
+    def _send(self, batch: List[tuple]):
+        try:
+            with self._lock:
+                self.batches += 1
+                self.prompts += len(batch)
+            prompts = [prompt for prompt, _ in batch]
+            try:
+                results = self.send_batch(prompts)
+                if len(results) != len(batch):
+                    raise ValueError(f"Expected {len(batch)} results for the batch, got {len(results)}")
+            except Exception as e:
+                logger.debug("Micro-batch of %s prompts failed: %s", len(batch), e)
+                for _, future in batch:
+                    future.set_exception(e)
+                return
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+        finally:
+            self._slots.release()
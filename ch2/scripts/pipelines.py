@@ -1,20 +1,322 @@
-from haystack.preview import Pipeline
-from haystack.preview.components.builders.prompt_builder import PromptBuilder
+import copy
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Executor, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Union
 
-def initialize_simple_pipeline(llm_generator, llm_generator_name, prompt_template):
+from canals.errors import PipelineMaxLoops
+from haystack.preview import Pipeline, component
+from .ratelimit import RateLimitedGenerator
+from .metrics import InstrumentedGenerator
+from .circuitbreaker import FallbackGenerator
+from .deadline import deadline_after
+from .asyncpipeline import run_component_async, run_pipeline_async, shared_executor
+from .dag import DagRun, run_component
+from .templates import CachedPromptBuilder
+from .errors import PermanentEndpointError
+
+logger = logging.getLogger(__name__)
+
+
+class ThreadSafePipeline(Pipeline):
+    """
+    Pipeline that several threads can run at the same time.
+
+    `Pipeline` counts the visits of its components in the graph, shared by all the runs: concurrent runs
+    reset each other's counts and can exceed the maximum number of loops together. Here every thread counts
+    the visits of its own run. The components must still be safe to call concurrently.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._local = threading.local()
+
+    def _clear_visits_count(self):
+        self._local.visits = dict.fromkeys(self.graph.nodes, 0)
+
+    def _check_max_loops(self, component_name: str):
+        if self._local.visits[component_name] > self.max_loops_allowed:
+            raise PipelineMaxLoops(
+                f"Maximum loops count ({self.max_loops_allowed}) exceeded for component '{component_name}'."
+            )
+
+    def _run_component(self, name: str, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        # Pipeline still counts the visit in the graph, that count is not read anymore
+        self._local.visits[name] += 1
+        return super()._run_component(name, inputs)
+
+    async def run_async(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Await a run of the pipeline without blocking the event loop, see `run_pipeline_async`.
+        """
+        return await run_pipeline_async(self, data)
+
+    def run_parallel(self, data: Dict[str, Any], executor: Optional[Executor] = None) -> Dict[str, Any]:
+        """
+        Run the pipeline starting independent components at the same time, see `run_parallel`.
+        """
+        return run_parallel(self, data, executor)
+
+
+@component
+class SharedGenerator:
+    """
+    Lets a generator take part in several pipelines.
+
+    Pipelines record their connections on the sockets of the component instances, so a component can only be
+    connected in one pipeline. This wrapper has its own copies of the sockets of the generator it wraps.
+    """
+
+    def __init__(self, generator):
+        """
+        :param generator: The generator component to wrap.
+        """
+        self.generator = generator
+        self.__canals_input__ = {name: self._unconnected(socket, senders=[])
+                                 for name, socket in getattr(generator, "__canals_input__", {}).items()}
+        self.__canals_output__ = {name: self._unconnected(socket, receivers=[])
+                                  for name, socket in getattr(generator, "__canals_output__", {}).items()}
+
+    @staticmethod
+    def _unconnected(socket, **connections):
+        socket = copy.copy(socket)
+        for name, value in connections.items():
+            setattr(socket, name, value)
+        return socket
+
+    def warm_up(self):
+        if hasattr(self.generator, "warm_up"):
+            self.generator.warm_up()
+
+    def close(self):
+        if hasattr(self.generator, "close"):
+            self.generator.close()
+
+    def run(self, **kwargs) -> Dict[str, Any]:
+        return self.generator.run(**kwargs)
+
+    async def run_async(self, **kwargs) -> Dict[str, Any]:
+        return await run_component_async(self.generator, **kwargs)
+
+
+def initialize_simple_pipeline(llm_generator, llm_generator_name, prompt_template, rate_limiter=None,
+                               metrics_registry=None, fallback_generator=None, shared_generator=False):
     # Creating a pipeline
-    pipeline = Pipeline()
+    pipeline = ThreadSafePipeline()
 
-    # Adding a PromptBuilder
-    prompt_builder = PromptBuilder(template=prompt_template)
+    # Adding a PromptBuilder, whose template is compiled once per process
+    prompt_builder = CachedPromptBuilder(template=prompt_template)
     pipeline.add_component(instance=prompt_builder, name="prompt_builder")
 
     # Adding a GPT-based Generator
     # Ensure that you have the OPENAI_API_KEY environment variable set
     gpt_generator = llm_generator # GPTGenerator(api_key=os.environ.get("OPENAI_API_KEY"))
+    if rate_limiter is not None:
+        # Pipelines sharing a RateLimiter share its quota
+        gpt_generator = RateLimitedGenerator(gpt_generator, rate_limiter)
+    if fallback_generator is not None:
+        # Answers with the fallback, which has its own quota, while the circuit breaker of the generator is open
+        gpt_generator = FallbackGenerator(gpt_generator, fallback_generator)
+    if metrics_registry is not None:
+        # Records the runs of the generator, throttling included, under its component name
+        gpt_generator = InstrumentedGenerator(gpt_generator, metrics_registry, llm_generator_name)
+    if shared_generator:
+        # The wrappers above share the sockets of the generator, the generator can be in other pipelines too
+        gpt_generator = SharedGenerator(gpt_generator)
     pipeline.add_component(instance=gpt_generator, name=llm_generator_name) #"gpt_generator")
 
     # Connecting the components
     pipeline.connect("prompt_builder",llm_generator_name)
 
-    return pipeline
\ No newline at end of file
+    return pipeline
+
+
+def close_pipeline(pipeline):
+    # Releases resources held by the pipeline components, such as pooled HTTP connections
+    for name in pipeline.graph.nodes:
+        instance = pipeline.get_component(name)
+        if hasattr(instance, "close"):
+            instance.close()
+
+
+def run_with_deadline(pipeline, data, timeout):
+    # Runs the pipeline giving up after `timeout` seconds: every component taking a `deadline` input
+    # gets the same absolute deadline, so the time spent in earlier components counts against later ones
+    deadline = deadline_after(timeout)
+    data = {name: dict(inputs) for name, inputs in data.items()}
+    for name, sockets in pipeline.inputs().items():
+        if "deadline" in sockets:
+            data.setdefault(name, {})["deadline"] = deadline
+    return pipeline.run(data)
+
+
+def run_parallel(pipeline, data: Dict[str, Dict[str, Any]], executor: Optional[Executor] = None) -> Dict[str, Any]:
+    # Runs a pipeline without loops like pipeline.run, but starts every component in `executor` (the thread pool
+    # shared with the async runs by default) as soon as the components it depends on have finished: independent
+    # branches, such as a retriever and a query embedder feeding a joiner, overlap and a run takes about as long
+    # as its slowest path. Don't call it from a thread of the same executor, it could wait for itself
+    run = DagRun(pipeline, data)
+    pipeline.warm_up()
+    executor = executor or shared_executor()
+    running = {}
+
+    def start(names):
+        for name in names:
+            running[executor.submit(run_component, name, run.instance(name), run.inputs(name))] = name
+
+    start(run.start())
+    try:
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                start(run.finish(running.pop(future), future.result()))
+    finally:
+        # components not started yet are dropped when one fails
+        for future in running:
+            future.cancel()
+    return run.outputs
+
+
+def run_many(pipeline, inputs: List[Dict[str, Any]], max_workers: int = 8,
+             batch_size: Optional[int] = None) -> List[Union[Dict[str, Any], Exception]]:
+    # Runs a pipeline made by initialize_simple_pipeline once per item of `inputs`, the variables of its prompt
+    # template. Results are in input order, an item that failed holds its exception instead of the pipeline
+    # output, as with asyncio.gather(return_exceptions=True). Generators with a run_batch method get the prompts
+    # in batches of `batch_size`; others, the rate-limiting and instrumenting wrappers included, run one prompt
+    # at a time. Either way at most `max_workers` calls are made at once. A batch rejected with a permanent
+    # error is sent again one prompt at a time, any other error is the result of all its prompts.
+    builder = pipeline.get_component("prompt_builder")
+    name = next(node for node in pipeline.graph.nodes if node != "prompt_builder")
+    generator = pipeline.get_component(name)
+    if isinstance(generator, SharedGenerator):
+        generator = generator.generator
+    pipeline.warm_up()
+
+    results: List[Any] = [None] * len(inputs)
+    prompts = {}
+    mandatory = [socket.name for socket in builder.__canals_input__.values() if socket.is_mandatory]
+    for index, variables in enumerate(inputs):
+        missing = [variable for variable in mandatory if variable not in variables]
+        try:
+            if missing:
+                raise ValueError(f"Missing template variables: {', '.join(missing)}")
+            prompts[index] = builder.run(**variables)["prompt"]
+        except Exception as e:
+            results[index] = e
+
+    def run_one(index):
+        try:
+            results[index] = {name: generator.run(prompt=prompts[index])}
+        except Exception as e:
+            results[index] = e
+
+    def run_chunk(indices):
+        try:
+            replies = generator.run_batch([prompts[index] for index in indices])["replies"]
+        except PermanentEndpointError as e:
+            # one bad prompt fails its whole batch, send them one by one to find out which
+            logger.warning("Batch of %s prompts failed (%s), sending them one by one", len(indices), e)
+            for index in indices:
+                run_one(index)
+            return
+        except Exception as e:
+            # the endpoint is down or out of time: sending the prompts again would only add load
+            for index in indices:
+                results[index] = e
+            return
+        for index, reply in zip(indices, replies):
+            results[index] = {name: {"replies": reply}}
+
+    pending = list(prompts)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        if hasattr(generator, "run_batch"):
+            size = batch_size or getattr(generator, "batch_size", None) or 32
+            list(executor.map(run_chunk, [pending[start:start + size] for start in range(0, len(pending), size)]))
+        else:
+            list(executor.map(run_one, pending))
+    return results
+
+
+class PipelineCache:
+    """
+    Thread-safe cache of the pipelines built by `initialize_simple_pipeline`, so request handlers reuse them
+    instead of rebuilding the prompt builder and the graph on every request.
+
+    Pipelines are keyed on their prompt template, the generator name and the identity of the generator,
+    rate limiter, metrics registry and fallback generator, and evicted in least-recently-used order beyond
+    `max_entries`. Share the generators between requests to benefit from the cache, they hold the connection
+    pools anyway: a generator can be part of several cached pipelines, see `SharedGenerator`. Evicted or
+    invalidated pipelines are dropped but not closed, their generators may be in use elsewhere.
+    """
+
+    def __init__(self, max_entries: int = 128):
+        """
+        :param max_entries: Maximum number of pipelines kept.
+        """
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[tuple, Pipeline]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(llm_generator, llm_generator_name, prompt_template, rate_limiter, metrics_registry,
+             fallback_generator) -> tuple:
+        # the cached pipeline references the objects, so their ids can't be reused while the entry exists
+        return (prompt_template, llm_generator_name, id(llm_generator), id(rate_limiter), id(metrics_registry),
+                id(fallback_generator))
+
+    def get(self, llm_generator, llm_generator_name, prompt_template, rate_limiter=None, metrics_registry=None,
+            fallback_generator=None) -> Pipeline:
+        """
+        Return the pipeline `initialize_simple_pipeline` builds with these arguments, building it on a miss.
+        """
+        key = self._key(llm_generator, llm_generator_name, prompt_template, rate_limiter, metrics_registry,
+                        fallback_generator)
+        with self._lock:
+            pipeline = self._entries.get(key)
+            if pipeline is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return pipeline
+            self.misses += 1
+
+        pipeline = initialize_simple_pipeline(llm_generator, llm_generator_name, prompt_template, rate_limiter,
+                                              metrics_registry, fallback_generator, shared_generator=True)
+        with self._lock:
+            # another thread may have built the same pipeline meanwhile, keep a single one
+            pipeline = self._entries.setdefault(key, pipeline)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return pipeline
+
+    def invalidate(self, prompt_template: Optional[str] = None, llm_generator=None) -> int:
+        """
+        Drop the pipelines built from `prompt_template` and/or around `llm_generator`, all of them when
+        neither is given.
+
+        :return: The number of pipelines dropped.
+        """
+        with self._lock:
+            keys = [key for key in self._entries
+                    if (prompt_template is None or key[0] == prompt_template)
+                    and (llm_generator is None or key[2] == id(llm_generator))]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def clear(self):
+        self.invalidate()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+            }
@@ -0,0 +1,172 @@
+import time
+import asyncio
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from haystack.preview import component
+
+from .asyncpipeline import run_component_async
+from .errors import DeadlineExceededError
+
+
+def estimate_tokens(prompt, parameters: Optional[dict] = None) -> int:
+    """
+    Rough number of tokens a query will use: about four characters per prompt token, plus the
+    maximum number of tokens the model may generate according to `parameters`.
+
+    :param prompt: A prompt or a list of prompts.
+    :param parameters: Generation parameters of the endpoint (`max_new_tokens`, `max_length` or `max_tokens`).
+    """
+    prompts = prompt if isinstance(prompt, list) else [prompt]
+    parameters = parameters or {}
+    max_generated = parameters.get("max_new_tokens") or parameters.get("max_tokens") or parameters.get("max_length") or 0
+    return sum(max(1, len(str(item)) // 4) + max_generated for item in prompts)
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at `rate` units per second and holding at most `capacity` units.
+
+    Callers reserve units up front, which may push the bucket below zero: the time it takes to refill
+    back to zero is how long they have to wait. This way waiting callers are served first come, first served.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        :param rate: Units added to the bucket per second.
+        :param capacity: Maximum number of units, i.e. the allowed burst. Defaults to one second worth of units.
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._level = self.capacity
+        self._updated = time.monotonic()
+
+    def reserve(self, amount: float, now: float) -> float:
+        """
+        Take `amount` units and return the number of seconds to wait before using them.
+        Not thread-safe on its own, see `RateLimiter`.
+        """
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+        self._level -= amount
+        return max(0.0, -self._level / self.rate)
+
+    def refund(self, amount: float):
+        """
+        Give back units reserved for a query that won't be sent.
+        """
+        self._level = min(self.capacity, self._level + amount)
+
+
+class RateLimiter:
+    """
+    Client-side rate limiter that can be shared by any number of components and threads.
+
+    Requests are limited per second and tokens per minute. Callers over the limit are queued, sleeping
+    until their turn, rather than being sent to the endpoint only to be throttled with a 429.
+    """
+
+    def __init__(self, requests_per_second: Optional[float] = None, tokens_per_minute: Optional[float] = None,
+                 request_burst: Optional[float] = None, token_burst: Optional[float] = None):
+        """
+        :param requests_per_second: Maximum sustained number of requests per second, None for no limit.
+        :param tokens_per_minute: Maximum sustained number of tokens per minute, None for no limit.
+        :param request_burst: Number of requests that can be sent at once after an idle period.
+        :param token_burst: Number of tokens that can be used at once after an idle period.
+        """
+        self.requests_per_second = requests_per_second
+        self.tokens_per_minute = tokens_per_minute
+        self._request_bucket = TokenBucket(requests_per_second, request_burst) if requests_per_second else None
+        self._token_bucket = (
+            TokenBucket(tokens_per_minute / 60.0, token_burst if token_burst is not None else tokens_per_minute)
+            if tokens_per_minute else None
+        )
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: int = 0) -> float:
+        """
+        Reserve one request and `tokens` tokens, returning the number of seconds to wait before sending it.
+        """
+        with self._lock:
+            now = time.monotonic()
+            delay = 0.0
+            if self._request_bucket is not None:
+                delay = max(delay, self._request_bucket.reserve(1, now))
+            if self._token_bucket is not None and tokens:
+                delay = max(delay, self._token_bucket.reserve(tokens, now))
+            return delay
+
+    def _refund(self, tokens: int):
+        with self._lock:
+            if self._request_bucket is not None:
+                self._request_bucket.refund(1)
+            if self._token_bucket is not None and tokens:
+                self._token_bucket.refund(tokens)
+
+    def _reserve_before(self, tokens: int, deadline: Optional[float]) -> float:
+        delay = self.reserve(tokens)
+        if deadline is not None and time.time() + delay > deadline:
+            self._refund(tokens)
+            raise DeadlineExceededError("Deadline exceeded while waiting for the rate limiter")
+        return delay
+
+    def acquire(self, tokens: int = 0, deadline: Optional[float] = None):
+        """
+        Block until one request using `tokens` tokens may be sent.
+
+        :param deadline: Absolute `time.time()` of the query deadline. If its turn comes later,
+            `DeadlineExceededError` is raised right away instead of waiting.
+        """
+        delay = self._reserve_before(tokens, deadline)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self, tokens: int = 0, deadline: Optional[float] = None):
+        """
+        Wait, without blocking the event loop, until one request using `tokens` tokens may be sent.
+        See `acquire`.
+        """
+        delay = self._reserve_before(tokens, deadline)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+@component
+class RateLimitedGenerator:
+    """
+    Wraps any generator component, for example `GPTGenerator`, so that its queries go through a shared
+    `RateLimiter`. It has the same inputs and outputs as the generator it wraps.
+    """
+
+    def __init__(self, generator, rate_limiter: RateLimiter,
+                 token_counter: Callable[[Any, Optional[dict]], int] = estimate_tokens):
+        """
+        :param generator: The generator component to wrap.
+        :param rate_limiter: The limiter shared with the other generators using the same quota.
+        :param token_counter: Function estimating the tokens of a query from its prompt and the generator parameters.
+        """
+        self.generator = generator
+        self.rate_limiter = rate_limiter
+        self.token_counter = token_counter
+        self.__canals_input__ = dict(getattr(generator, "__canals_input__", {}))
+        self.__canals_output__ = dict(getattr(generator, "__canals_output__", {}))
+
+    def warm_up(self):
+        if hasattr(self.generator, "warm_up"):
+            self.generator.warm_up()
+
+    def close(self):
+        if hasattr(self.generator, "close"):
+            self.generator.close()
+
+    def run(self, **kwargs) -> Dict[str, Any]:
+        parameters = getattr(self.generator, "parameters", None) or getattr(self.generator, "model_parameters", None)
+        tokens = self.token_counter(kwargs.get("prompt", ""), parameters)
+        self.rate_limiter.acquire(tokens, deadline=kwargs.get("deadline"))
+        return self.generator.run(**kwargs)
+
+    async def run_async(self, **kwargs) -> Dict[str, Any]:
+        parameters = getattr(self.generator, "parameters", None) or getattr(self.generator, "model_parameters", None)
+        tokens = self.token_counter(kwargs.get("prompt", ""), parameters)
+        await self.rate_limiter.acquire_async(tokens, deadline=kwargs.get("deadline"))
+        return await run_component_async(self.generator, **kwargs)
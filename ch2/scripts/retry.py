@@ -0,0 +1,96 @@
+import time
+import random
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from .errors import TransientEndpointError
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class RetryPolicy:
+    """
+    Retries transient endpoint failures with capped exponential backoff and full jitter.
+
+    The delay before retry `n` is drawn uniformly between 0 and `min(max_delay, base_delay * 2 ** n)`.
+    When the endpoint tells how long to wait (`Retry-After` header, or `estimated_time` while a model
+    is loading), we wait at least that long. Permanent failures are raised right away, and once
+    `max_attempts` or the `max_elapsed` time budget is reached the last transient failure is raised.
+    """
+
+    def __init__(self, max_attempts: int = 5, base_delay: float = 0.5, max_delay: float = 30.0,
+                 max_elapsed: Optional[float] = None):
+        """
+        :param max_attempts: Maximum number of attempts, including the first one.
+        :param base_delay: Backoff delay in seconds before the first retry, doubled on every attempt.
+        :param max_delay: Upper bound in seconds of the backoff delay.
+        :param max_elapsed: Time budget in seconds across all attempts, None for no limit. Unlike the `deadline`
+            of `call`, it is relative to the first attempt.
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_elapsed = max_elapsed
+
+    def compute_delay(self, attempt: int, error: TransientEndpointError) -> float:
+        """
+        Delay in seconds before the retry that follows the failed attempt number `attempt` (starting at 0).
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if error.retry_after is not None:
+            delay = max(delay, error.retry_after)
+        return delay
+
+    def _next_delay(self, attempt: int, error: TransientEndpointError, started: float,
+                    deadline: Optional[float]) -> float:
+        # raises the failure when there is no attempt or time left for another try
+        if attempt + 1 >= self.max_attempts:
+            raise error
+        delay = self.compute_delay(attempt, error)
+        if self.max_elapsed is not None and time.monotonic() + delay - started > self.max_elapsed:
+            raise error
+        if deadline is not None and time.time() + delay >= deadline:
+            raise error
+        logger.warning("Endpoint query failed (%s), retrying in %.2f seconds", error, delay)
+        return delay
+
+    def call(self, func: Callable[[], T], deadline: Optional[float] = None,
+             on_retry: Optional[Callable[[TransientEndpointError], None]] = None) -> T:
+        """
+        Call `func` until it succeeds, retrying on `TransientEndpointError`.
+
+        :param deadline: Absolute `time.time()` after which no retry is attempted, on top of `max_elapsed`.
+        :param on_retry: Called with the error of every failed attempt that is about to be retried.
+        """
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                return func()
+            except TransientEndpointError as error:
+                delay = self._next_delay(attempt, error, started, deadline)
+                if on_retry is not None:
+                    on_retry(error)
+                time.sleep(delay)
+            attempt += 1
+
+    async def call_async(self, func: Callable[[], Awaitable[T]], deadline: Optional[float] = None,
+                         on_retry: Optional[Callable[[TransientEndpointError], None]] = None) -> T:
+        """
+        Await `func()` until it succeeds, retrying on `TransientEndpointError` without blocking the event loop.
+        See `call`.
+        """
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            try:
+                return await func()
+            except TransientEndpointError as error:
+                delay = self._next_delay(attempt, error, started, deadline)
+                if on_retry is not None:
+                    on_retry(error)
+                await asyncio.sleep(delay)
+            attempt += 1
@@ -0,0 +1,174 @@
+import time
+import asyncio
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+from .errors import DeadlineExceededError
+
+
+class PriorityClass:
+    """
+    Settings and book-keeping of one class of traffic sharing a `PriorityScheduler`.
+    """
+
+    def __init__(self, weight: float = 1.0, max_concurrency: Optional[int] = None, tier: int = 0):
+        """
+        :param weight: Share of the capacity the class gets when classes of the same tier compete for it.
+        :param max_concurrency: Maximum number of requests of the class in flight, None for no cap.
+        :param tier: Classes of a lower tier are always served first, whatever their weight.
+        """
+        self.weight = weight
+        self.max_concurrency = max_concurrency
+        self.tier = tier
+        self.in_flight = 0
+        self.served = 0
+        self.last_tag = 0.0
+        self.waiters: deque = deque()
+
+    def is_capped(self) -> bool:
+        return self.max_concurrency is not None and self.in_flight >= self.max_concurrency
+
+
+class _Waiter:
+    def __init__(self, wake: Callable[[], None], tag: float):
+        self.wake = wake
+        self.tag = tag
+        self.admitted = False
+
+
+class PriorityScheduler:
+    """
+    Shares the capacity of generators between classes of traffic, such as interactive users and batch jobs.
+
+    At most `max_concurrency` requests are in flight. When a slot frees up it goes to the waiting class
+    of the lowest tier; classes of the same tier share slots in proportion to their weight (self-clocked
+    weighted fair queuing), each request costing its `cost` divided by the weight of its class. A class
+    at its own `max_concurrency` is skipped, so the others can use the idle capacity.
+
+    The default classes put `interactive` requests ahead of everything and let `batch` requests use
+    at most three quarters of the slots, so a burst of batch work leaves room for users arriving next.
+    """
+
+    def __init__(self, max_concurrency: int = 8, classes: Optional[Dict[str, PriorityClass]] = None,
+                 default_class: str = "interactive"):
+        """
+        :param max_concurrency: Maximum number of requests in flight, all classes together.
+        :param classes: The classes by name. Defaults to `interactive` (tier 0) and `batch` (tier 1).
+        :param default_class: Class of the requests that don't name one.
+        """
+        if classes is None:
+            classes = {
+                "interactive": PriorityClass(weight=1.0, tier=0),
+                "batch": PriorityClass(weight=1.0, tier=1, max_concurrency=max(1, max_concurrency * 3 // 4)),
+            }
+        if default_class not in classes:
+            raise ValueError(f"Unknown default class '{default_class}', use one of {list(classes)}.")
+        self.max_concurrency = max_concurrency
+        self.classes = classes
+        self.default_class = default_class
+        self.in_flight = 0
+        # virtual time: the tag of the request admitted last
+        self._virtual_time = 0.0
+        self._lock = threading.Lock()
+
+    def _class(self, name: Optional[str]) -> PriorityClass:
+        name = name or self.default_class
+        if name not in self.classes:
+            raise ValueError(f"Unknown priority class '{name}', use one of {list(self.classes)}.")
+        return self.classes[name]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {name: {"in_flight": cls.in_flight, "waiting": len(cls.waiters), "served": cls.served}
+                    for name, cls in self.classes.items()}
+
+    def _enqueue(self, cls: PriorityClass, cost: float, wake: Callable[[], None]) -> _Waiter:
+        # called with the lock held
+        cls.last_tag = max(self._virtual_time, cls.last_tag) + cost / cls.weight
+        waiter = _Waiter(wake, cls.last_tag)
+        cls.waiters.append(waiter)
+        self._dispatch()
+        return waiter
+
+    def _dispatch(self):
+        # admit waiting requests while there are free slots, called with the lock held
+        while self.in_flight < self.max_concurrency:
+            eligible = [cls for cls in self.classes.values() if cls.waiters and not cls.is_capped()]
+            if not eligible:
+                return
+            cls = min(eligible, key=lambda cls: (cls.tier, cls.waiters[0].tag))
+            waiter = cls.waiters.popleft()
+            self._virtual_time = max(self._virtual_time, waiter.tag)
+            cls.in_flight += 1
+            cls.served += 1
+            self.in_flight += 1
+            waiter.admitted = True
+            waiter.wake()
+
+    def _give_up(self, cls: PriorityClass, waiter: _Waiter) -> bool:
+        # returns whether the request had been admitted meanwhile, in which case it holds a slot
+        with self._lock:
+            if waiter.admitted:
+                return True
+            cls.waiters.remove(waiter)
+            return False
+
+    def acquire(self, priority: Optional[str] = None, cost: float = 1.0, deadline: Optional[float] = None):
+        """
+        Block until a request of class `priority` may run. Must be paired with `release`.
+
+        :param cost: Relative size of the request, such as its number of prompts.
+        :param deadline: Absolute `time.time()` after which `DeadlineExceededError` is raised instead of waiting.
+        """
+        cls = self._class(priority)
+        ready = threading.Event()
+        with self._lock:
+            waiter = self._enqueue(cls, cost, ready.set)
+        timeout = None if deadline is None else max(0.0, deadline - time.time())
+        if not ready.wait(timeout) and not self._give_up(cls, waiter):
+            raise DeadlineExceededError(f"Deadline exceeded while queued as '{priority or self.default_class}'")
+
+    async def acquire_async(self, priority: Optional[str] = None, cost: float = 1.0,
+                            deadline: Optional[float] = None):
+        """
+        Wait, without blocking the event loop, until a request of class `priority` may run. See `acquire`.
+        """
+        cls = self._class(priority)
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        wake = lambda: loop.call_soon_threadsafe(lambda: ready.done() or ready.set_result(None))
+        with self._lock:
+            waiter = self._enqueue(cls, cost, wake)
+        timeout = None if deadline is None else max(0.0, deadline - time.time())
+        try:
+            await asyncio.wait_for(asyncio.shield(ready), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if self._give_up(cls, waiter):
+                self.release(priority)
+            if isinstance(e, asyncio.TimeoutError):
+                raise DeadlineExceededError(
+                    f"Deadline exceeded while queued as '{priority or self.default_class}'") from e
+            raise
+
+    def release(self, priority: Optional[str] = None):
+        """
+        Free the slot of a finished request of class `priority`.
+        """
+        cls = self._class(priority)
+        with self._lock:
+            cls.in_flight -= 1
+            self.in_flight -= 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, priority: Optional[str] = None, cost: float = 1.0, deadline: Optional[float] = None):
+        """
+        Hold a slot of class `priority` for the duration of the `with` block.
+        """
+        self.acquire(priority, cost, deadline)
+        try:
+            yield
+        finally:
+            self.release(priority)
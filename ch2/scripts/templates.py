@@ -0,0 +1,97 @@
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from jinja2 import Template, meta
+
+from haystack.preview import component
+from haystack.preview.components.builders.prompt_builder import PromptBuilder
+from haystack.preview.dataclasses.chat_message import ChatMessage, ChatRole
+
+TEMPLATE_CACHE_SIZE = 512
+MESSAGE_TEMPLATE_CACHE_SIZE = 32
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def compile_template(source: str) -> Tuple[Template, FrozenSet[str]]:
+    """
+    Compile a Jinja template once per process, along with the variables it uses.
+
+    Compiled templates are kept in least-recently-used order, keyed on their source. `Template` objects
+    can be rendered from several threads at once.
+    """
+    template = Template(source)
+    variables = meta.find_undeclared_variables(template.environment.parse(source))
+    return template, frozenset(variables)
+
+
+@lru_cache(maxsize=MESSAGE_TEMPLATE_CACHE_SIZE)
+def _compile_message_template(source: str) -> Template:
+    # user messages are mostly one-off, they get their own small cache so they don't evict the
+    # templates of the builders from the one of compile_template
+    return Template(source)
+
+
+def render_batch(source: str, variables: List[Dict[str, Any]]) -> List[str]:
+    """
+    Render one template against many sets of variables, compiling it at most once.
+    """
+    template, _ = compile_template(source)
+    return [template.render(item) for item in variables]
+
+
+@component
+class CachedPromptBuilder(PromptBuilder):
+    """
+    `PromptBuilder` taking its template from the process-wide cache of `compile_template` instead of
+    compiling it for every builder. The last user messages are compiled through a separate, smaller cache.
+
+    It has the same inputs and outputs as `PromptBuilder`.
+    """
+
+    def __init__(self, template: Optional[str] = None, template_variables: Optional[List[str]] = None):
+        """
+        :param template: Template string to be rendered.
+        :param template_variables: List of template variables to be used as input types.
+        """
+        if template_variables and template:
+            raise ValueError("template and template_variables cannot be provided at the same time.")
+        if template_variables:
+            dynamic_input_slots = {var: Optional[Any] for var in template_variables}
+            self.template = None
+        else:
+            if not template:
+                raise ValueError("Either template or template_variables must be provided.")
+            self.template, static_template_variables = compile_template(template)
+            dynamic_input_slots = {var: Any for var in static_template_variables}
+
+        self.template_variables = template_variables
+        self._template_string = template
+
+        optional_input_slots = {"messages": Optional[List[ChatMessage]]}
+        component.set_input_types(self, **optional_input_slots, **dynamic_input_slots)
+
+    @component.output_types(prompt=str)
+    def run(self, messages: Optional[List[ChatMessage]] = None, **kwargs):
+        if messages:
+            last_message: ChatMessage = messages[-1]
+            if last_message.is_from(ChatRole.USER):
+                template = _compile_message_template(last_message.content)
+                return {"prompt": messages[:-1] + [ChatMessage.from_user(template.render(kwargs))]}
+            return {"prompt": messages}
+        if self.template is None:
+            raise ValueError(
+                "PromptBuilder was initialized with template_variables, but no ChatMessage(s) were provided."
+            )
+        return {"prompt": self.template.render(kwargs)}
+
+    async def run_async(self, messages: Optional[List[ChatMessage]] = None, **kwargs):
+        # rendering a compiled template takes microseconds, less than handing it over to a thread
+        return self.run(messages=messages, **kwargs)
+
+    def render_batch(self, variables: List[Dict[str, Any]]) -> List[str]:
+        """
+        Render the template against many sets of variables in one call, for example to feed `run_batch`.
+        """
+        if self.template is None:
+            raise ValueError("render_batch needs a PromptBuilder initialized with a template.")
+        return [self.template.render(item) for item in variables]
@@ -0,0 +1,166 @@
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, List, Optional, Tuple
+
+from haystack.preview.lazy_imports import LazyImport
+
+from .errors import PermanentEndpointError
+
+with LazyImport("Run 'pip install tiktoken'") as tiktoken_import:
+    import tiktoken
+
+with LazyImport("Run 'pip install tokenizers'") as tokenizers_import:
+    from tokenizers import Tokenizer
+
+
+class PromptTooLongError(PermanentEndpointError):
+    """
+    Raised before sending a prompt that doesn't fit in the context window of the model.
+    """
+
+
+class TiktokenTokenizer:
+    """
+    Counts tokens with a tiktoken encoding, as OpenAI models do.
+    """
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+
+    def encode(self, text: str) -> List[int]:
+        return self.encoding.encode(text, disallowed_special=())
+
+    def decode(self, ids: List[int]) -> str:
+        return self.encoding.decode(ids)
+
+
+class HFTokenizer:
+    """
+    Counts tokens with a Hugging Face `tokenizers.Tokenizer`, as the models served by TGI and vLLM do.
+    """
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+
+    def encode(self, text: str) -> List[int]:
+        return self.tokenizer.encode(text, add_special_tokens=False).ids
+
+    def decode(self, ids: List[int]) -> str:
+        return self.tokenizer.decode(ids)
+
+
+@lru_cache(maxsize=None)
+def load_tokenizer(name: str):
+    """
+    Load a tokenizer once per process: a tiktoken encoding (`cl100k_base`) or OpenAI model name
+    (`gpt-3.5-turbo`), otherwise a tokenizer from the Hugging Face Hub (`mistralai/Mistral-7B-v0.1`).
+    """
+    if tiktoken_import.is_successful():
+        try:
+            return TiktokenTokenizer(tiktoken.encoding_for_model(name))
+        except KeyError:
+            pass
+        try:
+            return TiktokenTokenizer(tiktoken.get_encoding(name))
+        except ValueError:
+            pass
+    tokenizers_import.check()
+    return HFTokenizer(Tokenizer.from_pretrained(name))
+
+
+class TokenBudget:
+    """
+    Checks prompts against the context window of the model before they are sent.
+
+    A prompt leaving fewer than `min_new_tokens` tokens of the window (or of `max_length` when the
+    parameters set one) is rejected with `PromptTooLongError`, or truncated when `policy` is `truncate`.
+    The number of tokens to generate is then lowered to what is left of the window, so the endpoint
+    doesn't refuse the query. Token counts of recent prompts are cached.
+    """
+
+    POLICIES = ("reject", "truncate")
+
+    def __init__(self, tokenizer: Any, context_window: int, policy: str = "reject", truncation_side: str = "left",
+                 min_new_tokens: int = 1, cache_size: int = 1024):
+        """
+        :param tokenizer: Name given to `load_tokenizer`, or any object with `encode(text) -> ids`
+            and `decode(ids) -> text` methods.
+        :param context_window: Number of tokens the model can attend to, prompt and generation together.
+        :param policy: `reject` or `truncate` prompts that are too long.
+        :param truncation_side: `left` drops the start of the prompt, keeping the question usually found at
+            the end of RAG prompts; `right` drops its end.
+        :param min_new_tokens: Number of tokens a prompt must leave for the generation.
+        :param cache_size: Number of prompts whose token count is remembered.
+        """
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown policy '{policy}', use one of {self.POLICIES}.")
+        if truncation_side not in ("left", "right"):
+            raise ValueError(f"Unknown truncation side '{truncation_side}', use 'left' or 'right'.")
+        self.tokenizer = load_tokenizer(tokenizer) if isinstance(tokenizer, str) else tokenizer
+        self.context_window = context_window
+        self.policy = policy
+        self.truncation_side = truncation_side
+        self.min_new_tokens = min_new_tokens
+        self.cache_size = cache_size
+        self._counts: "OrderedDict[str, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def count(self, text: str) -> int:
+        """
+        Number of tokens in `text`.
+        """
+        with self._lock:
+            count = self._counts.get(text)
+            if count is not None:
+                self._counts.move_to_end(text)
+                return count
+        count = len(self.tokenizer.encode(text))
+        with self._lock:
+            self._counts[text] = count
+            while len(self._counts) > self.cache_size:
+                self._counts.popitem(last=False)
+        return count
+
+    def _window(self, parameters: dict) -> int:
+        max_length = parameters.get("max_length")
+        return min(self.context_window, max_length) if max_length else self.context_window
+
+    def _truncate(self, prompt: str, tokens: int) -> str:
+        ids = self.tokenizer.encode(prompt)
+        kept = ids[len(ids) - tokens:] if self.truncation_side == "left" else ids[:tokens]
+        return self.tokenizer.decode(kept) if tokens > 0 else ""
+
+    def fit_prompt(self, prompt: str, parameters: Optional[dict]) -> Tuple[str, int]:
+        """
+        Return the prompt, truncated if needed and allowed, with the number of tokens left for the generation.
+        """
+        window = self._window(parameters or {})
+        tokens = self.count(prompt)
+        if window - tokens >= self.min_new_tokens:
+            return prompt, window - tokens
+        if self.policy == "reject":
+            raise PromptTooLongError(f"Prompt of {tokens} tokens leaves less than {self.min_new_tokens} tokens "
+                                     f"for the generation in a context window of {window} tokens")
+        prompt = self._truncate(prompt, window - self.min_new_tokens)
+        return prompt, window - self.count(prompt)
+
+    def fit(self, prompt, parameters: Optional[dict], max_new_tokens_parameter: str = "max_new_tokens"
+            ) -> Tuple[Any, dict]:
+        """
+        Fit a prompt, or a list of prompts sent together, and the generation parameters to the context window.
+
+        :return: The prompt(s), and the parameters with the number of tokens to generate lowered to what is left
+            for the longest prompt. The parameters are returned as is when they need no change.
+        """
+        parameters = parameters or {}
+        if isinstance(prompt, list):
+            fitted = [self.fit_prompt(item, parameters) for item in prompt]
+            prompt = [item for item, _ in fitted]
+            room = min((left for _, left in fitted), default=self._window(parameters))
+        else:
+            prompt, room = self.fit_prompt(prompt, parameters)
+        requested = parameters.get(max_new_tokens_parameter)
+        if requested is not None and requested > room:
+            parameters = {**parameters, max_new_tokens_parameter: room}
+        return prompt, parameters
@@ -0,0 +1,155 @@
+import time
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Union
+import requests
+from haystack.preview import component
+from haystack.preview.dataclasses import StreamingChunk
+from .errors import EndpointError, TransientEndpointError
+from .huggingfaceendpoints import InferenceEndpointAPI
+from .ratelimit import estimate_tokens
+
+
+@component
+class VLLMEndpointAPI(InferenceEndpointAPI):
+    """
+    Generator for the OpenAI-compatible server of vLLM, such as the one deployed by `mistral-7b-v1.0.yaml`.
+
+    Prompts go to `/v1/completions`, or to `/v1/chat/completions` as a user message when `chat` is set.
+    `run_batch` sends a list-valued `prompt` so that vLLM schedules the whole batch at once; chat
+    completions don't accept lists, so the prompts of a batch are sent as concurrent requests instead,
+    `batch_size` at most. With `n > 1` in the parameters every prompt gets `n` replies. The token usage
+    reported by the server is added up in `usage`.
+    Connection pooling, caching, retries, rate limiting, load balancing, hedging, coalescing, micro-batching
+    and deadlines work as in `InferenceEndpointAPI`.
+    """
+
+    max_new_tokens_parameter = "max_tokens"
+
+    def __init__(self, api_url: Union[str, List[str]], model: str, parameters: Optional[dict] = None,
+                 api_key: str = "EMPTY", chat: bool = False, system_prompt: Optional[str] = None, **kwargs):
+        """
+        :param api_url: Base URL of the vLLM server, such as `http://localhost:8000`, or list of URLs of its replicas.
+        :param model: Name of the model served, such as `mistralai/Mistral-7B-v0.1`.
+        :param parameters: OpenAI sampling parameters sent along with every prompt (`max_tokens`, `temperature`, `n`...).
+        :param api_key: Token sent as a Bearer token, only checked when the server was started with `--api-key`.
+        :param chat: Use `/v1/chat/completions`, so that the model's chat template is applied by the server.
+        :param system_prompt: System message sent before every prompt in chat mode.
+        :param kwargs: Other settings, see `InferenceEndpointAPI`.
+        """
+        # @component rebuilds the class, so the zero-argument form of super() can't be used here
+        InferenceEndpointAPI.__init__(self, api_url=api_url, api_key=api_key, parameters=parameters or {}, **kwargs)
+        self.model = model
+        self.chat = chat
+        self.system_prompt = system_prompt
+        self.generate_path = self.stream_path = "/v1/chat/completions" if chat else "/v1/completions"
+        self.usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        self._usage_lock = threading.Lock()
+
+    def _payload(self, prompt, stream: bool = False) -> dict:
+        parameters = self.parameters
+        if self.token_budget is not None:
+            prompt, parameters = self.token_budget.fit(prompt, parameters, self.max_new_tokens_parameter)
+        data: Dict[str, Any] = {"model": self.model, **parameters}
+        if self.chat:
+            messages = [{"role": "system", "content": self.system_prompt}] if self.system_prompt else []
+            data["messages"] = messages + [{"role": "user", "content": prompt}]
+        else:
+            data["prompt"] = prompt
+        if stream:
+            data["stream"] = True
+        return data
+
+    def _estimate_tokens(self, data: dict) -> int:
+        prompt = data.get("prompt")
+        if prompt is None:
+            prompt = " ".join(message["content"] for message in data["messages"])
+        return estimate_tokens(prompt, self.parameters) * self.parameters.get("n", 1)
+
+    def _cache_key(self, prompt: str) -> Optional[str]:
+        # unlike TGI, the OpenAI API samples with a temperature of 1 unless told otherwise
+        if self.cache is None or not self.cache.is_cacheable({"temperature": 1.0, **self.parameters}):
+            return None
+        return self._request_key(prompt)
+
+    def _record_usage(self, usage: Optional[dict]):
+        if not usage:
+            return
+        with self._usage_lock:
+            for name in self.usage:
+                self.usage[name] += usage.get(name) or 0
+
+    def _choice_text(self, choice: dict) -> str:
+        if self.chat:
+            return (choice.get("message") or {}).get("content") or ""
+        return choice.get("text") or ""
+
+    def _choices(self, response_json) -> List[dict]:
+        if not isinstance(response_json, dict) or "choices" not in response_json:
+            raise EndpointError(f"Unexpected response from the endpoint: {response_json}")
+        self._record_usage(response_json.get("usage"))
+        return sorted(response_json["choices"], key=lambda choice: choice.get("index", 0))
+
+    def _replies(self, response_json) -> List[str]:
+        return [self._choice_text(choice) for choice in self._choices(response_json)]
+
+    def _batch_replies(self, response_json, expected: int) -> List[List[str]]:
+        # the choices of a list-valued prompt are numbered prompt by prompt, `n` per prompt
+        n = self.parameters.get("n", 1)
+        choices = self._choices(response_json)
+        if len(choices) != expected * n:
+            raise EndpointError(f"Expected {expected * n} choices in the batched response, got {len(choices)}")
+        return [[self._choice_text(choice) for choice in choices[start:start + n]]
+                for start in range(0, len(choices), n)]
+
+    def _send_batch(self, prompts: List[str], deadline: Optional[float] = None) -> List[List[str]]:
+        if self.chat:
+            # chat completions take a single conversation, the prompts are sent as concurrent requests
+            # that vLLM batches on its side
+            send = lambda prompt: self._replies(self._post(self._payload(prompt), deadline=deadline))
+            if len(prompts) == 1:
+                return [send(prompts[0])]
+            with ThreadPoolExecutor(max_workers=len(prompts)) as executor:
+                return list(executor.map(send, prompts))
+        return InferenceEndpointAPI._send_batch(self, prompts, deadline)
+
+    def _stream(self, prompt: str, deadline: Optional[float] = None) -> List[str]:
+        headers = {**self.headers, "Accept": "text/event-stream"}
+        data = self._payload(prompt, stream=True)
+        # only opening the stream is retried, tokens already handed to the callback can't be taken back
+        response = self._with_retries(
+            lambda: self._send(self.stream_path, data, headers=headers, stream=True, deadline=deadline),
+            deadline=deadline)
+        texts: Dict[int, List[str]] = defaultdict(list)
+        first_token = None
+        # a stream broken partway, or ended by an error event, counts as a failure of the replica
+        failed = False
+        try:
+            with response:
+                for event in self._sse_events(response):
+                    if "error" in event:
+                        raise EndpointError(f"Streaming query failed: {event['error']}")
+                    # with `stream_options={"include_usage": True}` the last event reports the usage
+                    self._record_usage(event.get("usage"))
+                    for choice in event.get("choices") or []:
+                        index = choice.get("index", 0)
+                        if self.chat:
+                            content = (choice.get("delta") or {}).get("content") or ""
+                        else:
+                            content = choice.get("text") or ""
+                        first_token = first_token or time.monotonic()
+                        texts[index].append(content)
+                        metadata = {"index": index, "finish_reason": choice.get("finish_reason"),
+                                    "model": event.get("model")}
+                        self.streaming_callback(StreamingChunk(content=content, metadata=metadata))
+        except requests.RequestException as e:
+            failed = True
+            raise TransientEndpointError(f"Streaming query failed: {e}") from e
+        except EndpointError:
+            failed = True
+            raise
+        finally:
+            self._release_stream(response, first_token, sum(len(chunks) for chunks in texts.values()), failed)
+
+        return ["".join(texts[index]) for index in sorted(texts)]
@@ -0,0 +1,102 @@
+import sys
+import gzip
+import json
+import zlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def echo_responder(path, payload):
+    """Answer like a TGI endpoint, echoing every input back as its generated text."""
+    inputs = payload.get("inputs")
+    if isinstance(inputs, list):
+        return 200, [{"generated_text": f"echo: {item}"} for item in inputs]
+    return 200, [{"generated_text": f"echo: {inputs}"}]
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # clients giving up on a request, as the deadline tests do, are expected
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+
+class FakeEndpoint:
+    """
+    Local stand-in for an inference endpoint, served from a background thread.
+
+    The responder receives the request path and the decoded JSON payload and returns
+    `(status, body)` or `(status, body, headers)`. A `bytes` body is sent as is, an iterator
+    of `bytes` is streamed with chunked encoding as it is produced, and anything else is encoded
+    as JSON. Every request is recorded in `self.requests`, gzip or deflate request bodies are
+    decompressed before being decoded.
+    """
+
+    def __init__(self, responder=echo_responder):
+        self.responder = responder
+        self.requests = []
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                raw = self.rfile.read(length)
+                endpoint.requests.append(
+                    {"path": self.path, "headers": dict(self.headers), "raw": raw, "client_port": self.client_address[1]}
+                )
+                body = raw
+                if self.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(raw)
+                elif self.headers.get("Content-Encoding") == "deflate":
+                    body = zlib.decompress(raw)
+                payload = json.loads(body) if body else {}
+                result = endpoint.responder(self.path, payload)
+                status, body = result[0], result[1]
+                headers = result[2] if len(result) > 2 else {}
+                if hasattr(body, "__next__"):
+                    self._send_chunked(status, body, headers)
+                    return
+                if not isinstance(body, bytes):
+                    body = json.dumps(body).encode("utf-8")
+                    headers.setdefault("Content-Type", "application/json")
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_chunked(self, status, chunks, headers):
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for chunk in chunks:
+                    self.wfile.write(f"{len(chunk):x}\r\n".encode("ascii") + chunk + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = _Server(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
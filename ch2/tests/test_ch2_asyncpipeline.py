@@ -0,0 +1,71 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from canals.errors import PipelineRuntimeError
+from ..scripts import asyncpipeline
+from ..scripts.asyncpipeline import run_pipeline_async
+from ..scripts.huggingfaceendpoints import AsyncInferenceEndpointAPI
+from ..scripts.metrics import MetricsRegistry
+from ..scripts.pipelines import initialize_simple_pipeline
+from ..scripts.ratelimit import RateLimiter
+from .fake_endpoint import FakeEndpoint
+from .test_ch2_pipelines import PickyGenerator
+
+
+class CountingExecutor(ThreadPoolExecutor):
+    """Thread pool counting the calls handed over to it."""
+
+    def __init__(self):
+        super().__init__(max_workers=4)
+        self.submitted = 0
+
+    def submit(self, *args, **kwargs):
+        self.submitted += 1
+        return super().submit(*args, **kwargs)
+
+
+@pytest.fixture
+def executor():
+    previous = asyncpipeline.shared_executor()
+    executor = CountingExecutor()
+    asyncpipeline.set_shared_executor(executor)
+    yield executor
+    asyncpipeline.set_shared_executor(previous)
+    executor.shutdown()
+
+
+def test_async_generator_runs_in_the_event_loop(executor):
+    """Test that many runs of a pipeline around an async generator share the loop, without threads."""
+    registry = MetricsRegistry()
+    with FakeEndpoint() as endpoint:
+        llm = AsyncInferenceEndpointAPI(api_url=endpoint.url, api_key="key", parameters={}, max_concurrency=5)
+        pipeline = initialize_simple_pipeline(llm, "llm", "Say {{ word }}", rate_limiter=RateLimiter(),
+                                              metrics_registry=registry)
+
+        async def main():
+            async with llm:
+                return await asyncio.gather(*(pipeline.run_async({"prompt_builder": {"word": str(i)}})
+                                              for i in range(200)))
+
+        results = asyncio.run(main())
+    assert [result["llm"]["replies"] for result in results] == [[f"echo: Say {i}"] for i in range(200)]
+    assert executor.submitted == 0
+    assert 'llm_generator_runs_total{component="llm",outcome="ok"} 200' in registry.render()
+
+
+def test_sync_generator_runs_in_the_shared_executor(executor):
+    """Test that sync components are offloaded and give the same outputs as Pipeline.run."""
+    pipeline = initialize_simple_pipeline(PickyGenerator(), "picky", "Say {{ word }}")
+    data = {"prompt_builder": {"word": "hi"}}
+    assert asyncio.run(run_pipeline_async(pipeline, data)) == pipeline.run(data)
+    assert executor.submitted == 1
+
+
+def test_errors_are_wrapped_like_pipeline_run():
+    """Test that a failing component raises PipelineRuntimeError with the original error as cause."""
+    pipeline = initialize_simple_pipeline(PickyGenerator(), "picky", "Say {{ word }}")
+    with pytest.raises(PipelineRuntimeError) as error:
+        asyncio.run(pipeline.run_async({"prompt_builder": {"word": "boom"}}))
+    assert isinstance(error.value.__cause__, ValueError)
+    with pytest.raises(ValueError):
+        asyncio.run(pipeline.run_async({"prompt_builder": {}}))
@@ -0,0 +1,83 @@
+import time
+from ..scripts.cache import ResponseCache, SQLiteCacheBackend, make_cache_key, is_deterministic
+from ..scripts.huggingfaceendpoints import InferenceEndpointAPI
+from .fake_endpoint import FakeEndpoint
+
+
+def test_cache_key_ignores_parameter_order():
+    """Test that equivalent parameter dictionaries produce the same key."""
+    first = make_cache_key("http://endpoint", "prompt", {"temperature": 0.01, "max_length": 100})
+    second = make_cache_key("http://endpoint", "prompt", {"max_length": 100, "temperature": 0.01})
+    assert first == second
+    assert first != make_cache_key("http://other", "prompt", {"temperature": 0.01, "max_length": 100})
+
+
+def test_sampling_parameters_are_not_deterministic():
+    """Test which generation parameters may be cached."""
+    assert is_deterministic({"temperature": 0.01, "max_length": 100})
+    assert not is_deterministic({"temperature": 0.9})
+    assert not is_deterministic({"do_sample": True})
+    assert is_deterministic({"do_sample": True, "seed": 42})
+
+
+def test_lru_eviction_and_counters():
+    """Test that the least recently used entry is evicted first and counters are kept."""
+    cache = ResponseCache(max_entries=2)
+    cache.set("a", ["1"])
+    cache.set("b", ["2"])
+    assert cache.get("a") == ["1"]
+    cache.set("c", ["3"])
+
+    assert cache.get("b") is None
+    assert cache.get("c") == ["3"]
+    assert cache.stats() == {"hits": 2, "misses": 1, "evictions": 1, "entries": 2, "bytes": 4}
+
+
+def test_max_bytes_and_ttl():
+    """Test that entries are evicted by size and expire after their ttl."""
+    cache = ResponseCache(max_bytes=10, ttl=0.05)
+    cache.set("a", ["12345"])
+    cache.set("b", ["12345"])
+    assert cache.get("a") is None, "The oldest entry should be evicted to fit max_bytes."
+    assert cache.get("b") == ["12345"]
+    time.sleep(0.1)
+    assert cache.get("b") is None, "The entry should have expired."
+
+
+def test_disk_backend_survives_restart(tmp_path):
+    """Test that a new cache over the same file sees the entries of the previous one."""
+    path = str(tmp_path / "responses.sqlite")
+    ResponseCache(backend=SQLiteCacheBackend(path)).set("a", ["Paris"])
+
+    restarted = ResponseCache(backend=SQLiteCacheBackend(path))
+    assert restarted.get("a") == ["Paris"]
+
+
+def test_endpoint_uses_cache_for_deterministic_queries():
+    """Test that a repeated deterministic prompt is only sent once, while sampled ones bypass the cache."""
+    cache = ResponseCache()
+    with FakeEndpoint() as endpoint:
+        with InferenceEndpointAPI(api_url=endpoint.url, api_key="key", parameters={"temperature": 0.01},
+                                  cache=cache) as llm:
+            assert llm.run("ping") == llm.run("ping")
+            assert llm.run_batch(["ping", "pong"])["replies"] == [["echo: ping"], ["echo: pong"]]
+        assert len(endpoint.requests) == 2
+        assert endpoint.requests[1]["raw"].count(b"ping") == 0, "Cached prompts should not be resent in batches."
+
+        with InferenceEndpointAPI(api_url=endpoint.url, api_key="key", parameters={"temperature": 0.9},
+                                  cache=cache) as llm:
+            llm.run("ping")
+            llm.run("ping")
+        assert len(endpoint.requests) == 4
+
+
+def test_cached_replies_are_copies():
+    """Test that changing the replies a caller got leaves the cached ones untouched."""
+    with FakeEndpoint() as endpoint:
+        with InferenceEndpointAPI(api_url=endpoint.url, api_key="key", parameters={}, cache=ResponseCache()) as llm:
+            llm.run("x")["replies"].append("MUTATED")
+            llm.run("x")["replies"].append("MUTATED")
+            assert llm.run("x")["replies"] == ["echo: x"]
+            llm.run_batch(["x"])["replies"][0].append("MUTATED")
+            assert llm.run("x")["replies"] == ["echo: x"]
+    assert len(endpoint.requests) == 1
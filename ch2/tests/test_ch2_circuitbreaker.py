@@ -0,0 +1,106 @@
+import time
+import pytest
+from ..scripts.circuitbreaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from ..scripts.errors import EndpointError, TransientEndpointError
+from ..scripts.huggingfaceendpoints import InferenceEndpointAPI
+from ..scripts.pipelines import initialize_simple_pipeline
+from ..scripts.retry import RetryPolicy
+from .fake_endpoint import FakeEndpoint
+from .test_ch2_ratelimit import EchoGenerator
+
+
+def fail(breaker, url, count):
+    """Record `count` failed requests to `url`."""
+    for _ in range(count):
+        breaker.allow(url)
+        breaker.record(url, False)
+
+
+def test_circuit_opens_on_failure_rate():
+    """Test that the circuit opens once the failure rate over the window reaches the threshold."""
+    breaker = CircuitBreaker(failure_rate=0.5, window=10, min_calls=4)
+    for _ in range(3):
+        breaker.allow("a")
+        breaker.record("a", True)
+    fail(breaker, "a", 2)
+    assert breaker.state("a") == CLOSED
+    fail(breaker, "a", 1)
+    assert breaker.state("a") == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.allow("a")
+    assert breaker.state("b") == CLOSED, "Circuits are kept per URL"
+
+
+def test_half_open_probe_closes_or_reopens():
+    """Test that after the open duration a single probe decides whether the circuit closes."""
+    breaker = CircuitBreaker(min_calls=2, open_duration=0.05)
+    fail(breaker, "a", 2)
+    time.sleep(0.06)
+    assert breaker.state("a") == HALF_OPEN
+    breaker.allow("a")
+    with pytest.raises(CircuitOpenError):
+        breaker.allow("a")
+    breaker.record("a", False)
+    assert breaker.state("a") == OPEN
+
+    time.sleep(0.06)
+    breaker.allow("a")
+    breaker.record("a", True)
+    assert breaker.state("a") == CLOSED
+
+
+def test_open_circuit_fails_fast_without_retries():
+    """Test that queries to an endpoint whose circuit is open fail at once without reaching it."""
+    breaker = CircuitBreaker(min_calls=2)
+    with FakeEndpoint(lambda path, payload: (500, {"error": "down"})) as endpoint:
+        policy = RetryPolicy(max_attempts=5, base_delay=0.01)
+        with InferenceEndpointAPI(endpoint.url, "key", {}, retry_policy=policy, circuit_breaker=breaker) as llm:
+            with pytest.raises(CircuitOpenError):
+                llm.run("ping")
+            assert len(endpoint.requests) == 2, "Retries should stop once the circuit opens"
+            with pytest.raises(CircuitOpenError):
+                llm.run("ping")
+    assert len(endpoint.requests) == 2
+
+
+def test_broken_streams_count_as_failures():
+    """Test that a stream ending in an error partway through is recorded as a failure, not a success."""
+    def responder(path, payload):
+        def events():
+            yield b'data: {"token": {"text": "Hel", "special": false}}\n\n'
+            yield b'data: {"error": "model crashed"}\n\n'
+        return 200, events(), {"Content-Type": "text/event-stream"}
+
+    breaker = CircuitBreaker(min_calls=4)
+    with FakeEndpoint(responder) as endpoint:
+        with InferenceEndpointAPI(endpoint.url, "key", {}, circuit_breaker=breaker,
+                                  streaming_callback=lambda chunk: None) as llm:
+            for _ in range(4):
+                with pytest.raises(EndpointError, match="model crashed"):
+                    llm.run("ping")
+    assert breaker.state(endpoint.url) == OPEN
+
+
+def test_open_replica_is_skipped():
+    """Test that a replica whose circuit is open is left out while the others take the traffic."""
+    breaker = CircuitBreaker(min_calls=1)
+    with FakeEndpoint() as healthy, FakeEndpoint(lambda path, payload: (503, {"error": "down"})) as down:
+        with InferenceEndpointAPI([down.url, healthy.url], "key", {}, circuit_breaker=breaker) as llm:
+            for _ in range(6):
+                try:
+                    llm.run("ping")
+                except TransientEndpointError:
+                    pass
+    assert len(down.requests) == 1
+    assert len(healthy.requests) >= 5
+
+
+def test_fallback_generator_takes_over():
+    """Test that the pipeline answers with the fallback generator while the circuit is open."""
+    breaker = CircuitBreaker(min_calls=1)
+    breaker.allow("http://127.0.0.1:9")
+    breaker.record("http://127.0.0.1:9", False)
+    llm = InferenceEndpointAPI("http://127.0.0.1:9", "key", {}, circuit_breaker=breaker)
+    pipeline = initialize_simple_pipeline(llm, "llm", "Say {{ word }}", fallback_generator=EchoGenerator())
+    result = pipeline.run({"prompt_builder": {"word": "hi"}})
+    assert result["llm"]["replies"] == ["Say hi"]
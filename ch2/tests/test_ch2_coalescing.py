@@ -0,0 +1,95 @@
+import asyncio
+import threading
+import time
+from ..scripts.coalescing import SingleFlight
+from ..scripts.huggingfaceendpoints import InferenceEndpointAPI, AsyncInferenceEndpointAPI
+from .fake_endpoint import FakeEndpoint, echo_responder
+
+
+def slow_responder(path, payload):
+    time.sleep(0.2)
+    return echo_responder(path, payload)
+
+
+def test_concurrent_calls_share_one_execution():
+    """Test that threads calling with the same key while a call is running share its result."""
+    flight = SingleFlight()
+    calls = []
+
+    def work():
+        calls.append(1)
+        time.sleep(0.2)
+        return "result"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("key", work))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["result"] * 5
+    assert len(calls) == 1
+    assert flight.coalesced == 4
+    assert flight.do("key", lambda: "again") == "again", "Results must not be kept after completion."
+
+
+def test_errors_are_shared():
+    """Test that waiting callers get the exception of the shared call."""
+    flight = SingleFlight()
+    started = threading.Event()
+
+    def fail():
+        started.set()
+        time.sleep(0.1)
+        raise ValueError("boom")
+
+    errors = []
+
+    def call():
+        try:
+            flight.do("key", fail)
+        except ValueError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait()
+    follower = threading.Thread(target=call)
+    follower.start()
+    leader.join()
+    follower.join()
+    assert len(errors) == 2
+
+
+def test_endpoint_coalesces_identical_prompts_across_threads():
+    """Test that identical concurrent prompts are sent once, different prompts are not coalesced."""
+    with FakeEndpoint(slow_responder) as endpoint:
+        llm = InferenceEndpointAPI(api_url=endpoint.url, api_key="key", parameters={}, coalescer=SingleFlight(),
+                                   pool_maxsize=20)
+        results = []
+        prompts = ["same"] * 8 + ["other"]
+        threads = [threading.Thread(target=lambda p=p: results.append(llm.run(p))) for p in prompts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        llm.close()
+
+    assert len(endpoint.requests) == 2
+    assert sorted(result["replies"][0] for result in results) == ["echo: other"] + ["echo: same"] * 8
+
+
+def test_endpoint_coalesces_on_asyncio():
+    """Test that identical concurrent run_async calls share one upstream request."""
+    async def ask_all(llm):
+        async with llm:
+            return await asyncio.gather(*(llm.run_async("same") for _ in range(10)))
+
+    with FakeEndpoint(slow_responder) as endpoint:
+        llm = AsyncInferenceEndpointAPI(api_url=endpoint.url, api_key="key", parameters={}, coalescer=SingleFlight())
+        results = asyncio.run(ask_all(llm))
+
+    assert len(endpoint.requests) == 1
+    assert all(result == {"replies": ["echo: same"]} for result in results)
+    assert not llm.coalescer._tasks, "Nothing should be kept once the request completed."
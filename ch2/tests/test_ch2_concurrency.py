@@ -0,0 +1,131 @@
+import time
+import asyncio
+import threading
+import pytest
+from ..scripts.concurrency import AdaptiveConcurrencyLimiter
+from ..scripts.errors import DeadlineExceededError, TransientEndpointError
+from ..scripts.huggingfaceendpoints import InferenceEndpointAPI
+from ..scripts.metrics import MetricsRegistry
+from .fake_endpoint import FakeEndpoint
+
+
+def run_requests(limiter, count, latency, overloaded=False):
+    """Send `count` requests through the limiter, keeping it saturated."""
+    for _ in range(count):
+        for _ in range(int(limiter.limit)):
+            limiter.acquire()
+        for _ in range(int(limiter.limit) - 1):
+            limiter.release(latency=latency)
+        limiter.release(latency=latency, overloaded=overloaded)
+
+
+def test_limit_grows_while_latency_is_flat():
+    """Test the additive increase of a saturated limiter."""
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=2)
+    run_requests(limiter, 20, latency=0.1)
+    assert limiter.limit > 4
+    assert limiter.in_flight == 0
+
+
+def test_limit_does_not_grow_when_unused():
+    """Test that the limit stays put while fewer requests than allowed are in flight."""
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=4)
+    for _ in range(50):
+        limiter.acquire()
+        limiter.release(latency=0.1)
+    assert limiter.limit == 4
+
+
+def test_overload_backs_off_once_per_round_trip():
+    """Test the multiplicative decrease on 429/503, counted once for a burst of failures."""
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=16)
+    limiter.acquire()
+    limiter.release(latency=1.0)
+    limit = limiter.limit
+    for _ in range(3):
+        limiter.acquire()
+    for _ in range(3):
+        limiter.release(overloaded=True)
+    assert limiter.limit == limit / 2
+    assert limiter.backoffs == 1
+
+
+def test_latency_spike_backs_off():
+    """Test that latency well above its long-term average lowers the limit."""
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=16)
+    for _ in range(20):
+        limiter.acquire()
+        limiter.release(latency=0.01)
+    for _ in range(5):
+        limiter.acquire()
+        limiter.release(latency=0.5)
+    assert limiter.limit < 16
+
+
+def test_waiters_are_served_in_order_and_honor_deadlines():
+    """Test that callers over the limit wait for a slot, or give up at their deadline."""
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1)
+    limiter.acquire()
+    with pytest.raises(DeadlineExceededError):
+        limiter.acquire(deadline=time.time() + 0.05)
+
+    order = []
+
+    def worker(index):
+        limiter.acquire()
+        order.append(index)
+        limiter.release()
+
+    threads = []
+    for index in range(3):
+        threads.append(threading.Thread(target=worker, args=(index,)))
+        threads[-1].start()
+        time.sleep(0.02)
+    limiter.release()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert order == [0, 1, 2]
+    assert limiter.in_flight == 0
+
+
+def test_acquire_async_waits_for_a_slot():
+    """Test that async callers are woken up when a slot frees up."""
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1)
+
+    async def main():
+        limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire_async())
+        await asyncio.sleep(0.02)
+        assert not waiter.done()
+        limiter.release()
+        await asyncio.wait_for(waiter, 1)
+        limiter.release()
+
+    asyncio.run(main())
+    assert limiter.in_flight == 0
+
+
+def test_endpoint_overload_lowers_exposed_limit():
+    """Test that 503 answers from the endpoint lower the limit shown in the metrics."""
+    registry = MetricsRegistry()
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=8, registry=registry, name="tgi")
+    with FakeEndpoint(lambda path, payload: (503, {"error": "overloaded"})) as endpoint:
+        with InferenceEndpointAPI(endpoint.url, "key", {}, concurrency_limiter=limiter) as llm:
+            with pytest.raises(TransientEndpointError):
+                llm.run("ping")
+    assert limiter.limit == 4
+    assert limiter.in_flight == 0
+    assert 'llm_endpoint_concurrency_limit{limiter="tgi"} 4.0' in registry.render()
+
+
+def test_unserializable_query_keeps_no_slot():
+    """Test that a query failing to encode doesn't hold a slot or a replica."""
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1)
+    with FakeEndpoint() as endpoint:
+        with InferenceEndpointAPI(endpoint.url, "key", {"stop": object()}, concurrency_limiter=limiter) as llm:
+            for _ in range(2):
+                with pytest.raises(TypeError):
+                    llm.run("ping")
+            assert llm.replicas.replicas[0].in_flight == 0
+    assert limiter.in_flight == 0
+    assert not endpoint.requests
@@ -0,0 +1,98 @@
+import time
+import asyncio
+from typing import List
+import pytest
+from canals.errors import PipelineRuntimeError
+from haystack.preview import Pipeline, component
+from ..scripts.asyncpipeline import run_pipeline_async
+from ..scripts.pipelines import initialize_simple_pipeline, run_parallel
+
+
+@component
+class SleepyGenerator:
+    """Generator answering every prompt with itself after `delay` seconds."""
+
+    def __init__(self, delay: float, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+
+    @component.output_types(replies=List[str])
+    def run(self, prompt: str):
+        time.sleep(self.delay)
+        if self.fail:
+            raise ValueError("failed")
+        return {"replies": [prompt]}
+
+
+@component
+class Joiner:
+    """Concatenates the replies of two generators."""
+
+    @component.output_types(replies=List[str])
+    def run(self, first: List[str], second: List[str]):
+        return {"replies": first + second}
+
+
+@component
+class Router:
+    """Sends a number to `even` or `odd`, leaving the other output empty."""
+
+    @component.output_types(even=int, odd=int)
+    def run(self, number: int):
+        return {"even": number} if number % 2 == 0 else {"odd": number}
+
+
+@component
+class Double:
+    """Doubles a number."""
+
+    @component.output_types(number=int)
+    def run(self, number: int):
+        return {"number": number * 2}
+
+
+def branching_pipeline(delay: float, fail: bool = False):
+    """A simple pipeline whose prompt also goes to a second generator, both feeding a joiner."""
+    pipeline = initialize_simple_pipeline(SleepyGenerator(delay), "llm", "Say {{ word }}")
+    pipeline.add_component(instance=SleepyGenerator(delay, fail), name="other")
+    pipeline.add_component(instance=Joiner(), name="joiner")
+    pipeline.connect("prompt_builder", "other")
+    pipeline.connect("llm.replies", "joiner.first")
+    pipeline.connect("other.replies", "joiner.second")
+    return pipeline
+
+
+def test_independent_branches_overlap():
+    """Test that run_parallel and run_async take about as long as the slowest branch."""
+    pipeline = branching_pipeline(0.2)
+    data = {"prompt_builder": {"word": "hi"}}
+    expected = {"joiner": {"replies": ["Say hi", "Say hi"]}}
+    assert pipeline.run(data) == expected
+
+    start = time.monotonic()
+    assert pipeline.run_parallel(data) == expected
+    assert time.monotonic() - start < 0.35
+
+    start = time.monotonic()
+    assert asyncio.run(pipeline.run_async(data)) == expected
+    assert time.monotonic() - start < 0.35
+
+
+def test_branch_without_input_is_skipped():
+    """Test that components downstream of an empty output don't run, as with Pipeline.run."""
+    pipeline = Pipeline()
+    pipeline.add_component(instance=Router(), name="router")
+    pipeline.add_component(instance=Double(), name="double")
+    pipeline.connect("router.even", "double.number")
+    for number in (2, 3):
+        data = {"router": {"number": number}}
+        assert run_parallel(pipeline, data) == pipeline.run(data)
+        assert asyncio.run(run_pipeline_async(pipeline, data)) == pipeline.run(data)
+
+
+def test_failing_branch_raises():
+    """Test that an error in one branch stops the run with PipelineRuntimeError."""
+    pipeline = branching_pipeline(0.01, fail=True)
+    with pytest.raises(PipelineRuntimeError) as error:
+        run_parallel(pipeline, {"prompt_builder": {"word": "hi"}})
+    assert isinstance(error.value.__cause__, ValueError)
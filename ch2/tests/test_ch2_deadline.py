@@ -0,0 +1,63 @@
+import time
+import pytest
+from canals.errors import PipelineRuntimeError
+from ..scripts.deadline import bounded_timeout, deadline_after
+from ..scripts.errors import DeadlineExceededError, TransientEndpointError
+from ..scripts.huggingfaceendpoints import InferenceEndpointAPI
+from ..scripts.pipelines import initialize_simple_pipeline, run_with_deadline
+from ..scripts.retry import RetryPolicy
+from .fake_endpoint import FakeEndpoint, echo_responder
+
+
+def slow_responder(path, payload):
+    """Answer like `echo_responder`, half a second late."""
+    time.sleep(0.5)
+    return echo_responder(path, payload)
+
+
+def test_bounded_timeout():
+    """Test that the connect and read timeouts are shortened to the time left."""
+    assert bounded_timeout(10.0, 120.0, None) == (10.0, 120.0)
+    connect, read = bounded_timeout(10.0, None, deadline_after(1.0))
+    assert connect <= 1.0 and read <= 1.0, "Timeouts should not outlast the deadline"
+
+
+def test_past_deadline_is_not_sent():
+    """Test that a query whose deadline has passed fails without reaching the endpoint."""
+    with FakeEndpoint() as endpoint:
+        with InferenceEndpointAPI(endpoint.url, "key", {}) as llm:
+            with pytest.raises(DeadlineExceededError):
+                llm.run("Hello", deadline=time.time() - 1)
+        assert not endpoint.requests, "Nothing should have been sent"
+
+
+def test_deadline_cuts_slow_request_short():
+    """Test that a slow endpoint fails at the deadline instead of the read timeout, without retries."""
+    with FakeEndpoint(slow_responder) as endpoint:
+        with InferenceEndpointAPI(endpoint.url, "key", {}, retry_policy=RetryPolicy(base_delay=0.01)) as llm:
+            start = time.monotonic()
+            with pytest.raises(DeadlineExceededError):
+                llm.run("Hello", deadline=deadline_after(0.1))
+            assert time.monotonic() - start < 0.4, "The call should give up at the deadline"
+            assert len(endpoint.requests) == 1, "A query past its deadline should not be retried"
+
+
+def test_read_timeout_is_transient():
+    """Test that hitting the read timeout without a deadline is a retryable error."""
+    with FakeEndpoint(slow_responder) as endpoint:
+        with InferenceEndpointAPI(endpoint.url, "key", {}, read_timeout=0.1) as llm:
+            with pytest.raises(TransientEndpointError):
+                llm.run("Hello")
+
+
+def test_run_with_deadline_reaches_generator():
+    """Test that the pipeline deadline is passed to the generator."""
+    with FakeEndpoint(slow_responder) as endpoint:
+        llm = InferenceEndpointAPI(endpoint.url, "key", {})
+        pipeline = initialize_simple_pipeline(llm, "llm", "Say {{ word }}")
+        with pytest.raises(PipelineRuntimeError) as error:
+            run_with_deadline(pipeline, {"prompt_builder": {"word": "hi"}}, timeout=0.1)
+        assert isinstance(error.value.__cause__, DeadlineExceededError)
+        result = run_with_deadline(pipeline, {"prompt_builder": {"word": "hi"}}, timeout=5)
+        assert result["llm"]["replies"] == ["echo: Say hi"]
+        llm.close()
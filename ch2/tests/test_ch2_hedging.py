@@ -0,0 +1,123 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from ..scripts.hedging import HedgingPolicy, LatencyTracker
+from ..scripts.huggingfaceendpoints import InferenceEndpointAPI, AsyncInferenceEndpointAPI
+from .fake_endpoint import FakeEndpoint, echo_responder
+
+
+def warmed_up_policy(latency=0.02):
+    """Hedging policy that already saw a few fast requests, allowed to hedge any request."""
+    policy = HedgingPolicy(percentile=90, min_samples=5, max_hedge_ratio=1.0)
+    for _ in range(5):
+        policy.latencies.record(latency)
+    return policy
+
+
+def slow_responder(path, payload):
+    time.sleep(1.0)
+    return echo_responder(path, payload)
+
+
+def test_latency_percentile():
+    """Test the percentile of the recent latencies."""
+    tracker = LatencyTracker(window=100)
+    assert tracker.percentile(95) is None
+    for latency in range(1, 101):
+        tracker.record(latency / 100)
+    assert tracker.percentile(50) == 0.51
+    assert tracker.percentile(95) == 0.95
+
+
+def test_no_hedging_until_enough_samples():
+    """Test that requests are not hedged before min_samples latencies are known."""
+    policy = HedgingPolicy(min_samples=5)
+    assert policy.call(lambda tried: "done") == "done"
+    assert policy.delay() is None
+    assert policy.stats()["fired"] == 0
+
+
+def test_slow_attempt_is_hedged_and_hedge_wins():
+    """Test that a slow first attempt triggers a hedge whose answer is returned."""
+    policy = warmed_up_policy()
+
+    def attempt(tried):
+        tried.append(len(tried))
+        if len(tried) == 1:
+            time.sleep(1.0)
+            return "primary"
+        return "hedge"
+
+    start = time.monotonic()
+    assert policy.call(attempt) == "hedge"
+    assert time.monotonic() - start < 0.5
+    assert policy.stats()["fired"] == 1 and policy.stats()["won"] == 1
+
+
+def test_endpoint_hedges_to_another_replica():
+    """Test that the hedge goes to the other replica and its answer is used."""
+    with FakeEndpoint(slow_responder) as slow, FakeEndpoint() as fast:
+        llm = InferenceEndpointAPI(api_url=[slow.url, fast.url], api_key="key", parameters={},
+                                   hedging=warmed_up_policy())
+        # make the slow replica look like the better one so that it gets the first attempt
+        llm.replicas.replicas[1].in_flight = 1
+        start = time.monotonic()
+        assert llm.run("ping") == {"replies": ["echo: ping"]}
+        elapsed = time.monotonic() - start
+        llm.close()
+
+    assert elapsed < 0.5
+    assert len(slow.requests) == 1 and len(fast.requests) == 1
+    assert llm.hedging.stats()["won"] == 1
+
+
+def test_async_hedge_cancels_the_loser():
+    """Test that on the asyncio path the losing attempt is cancelled and its replica released."""
+    async def ask(llm):
+        async with llm:
+            return await llm.run_async("ping")
+
+    with FakeEndpoint(slow_responder) as slow, FakeEndpoint() as fast:
+        llm = AsyncInferenceEndpointAPI(api_url=[slow.url, fast.url], api_key="key", parameters={},
+                                        hedging=warmed_up_policy())
+        llm.replicas.replicas[1].in_flight = 1
+        start = time.monotonic()
+        assert asyncio.run(ask(llm)) == {"replies": ["echo: ping"]}
+        elapsed = time.monotonic() - start
+
+    assert elapsed < 0.5
+    assert llm.replicas.replicas[0].in_flight == 0
+    assert llm.hedging.stats()["fired"] == 1 and llm.hedging.stats()["won"] == 1
+
+
+def test_hedges_stay_within_budget_under_load():
+    """Test that more callers than hedging threads neither queue nor hedge beyond the budget."""
+    policy = HedgingPolicy(percentile=95, min_samples=5, max_workers=8, max_hedge_ratio=0.1)
+    for _ in range(5):
+        policy.latencies.record(0.05)
+
+    def attempt(tried):
+        tried.append(len(tried))
+        time.sleep(0.05)
+        return "done"
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=32) as callers:
+        results = list(callers.map(lambda _: policy.call(attempt), range(32)))
+    assert results == ["done"] * 32
+    assert time.monotonic() - start < 0.2
+    assert policy.stats()["fired"] <= 3
+
+
+def test_slow_attempt_is_not_hedged_without_budget():
+    """Test that no hedge is sent once the hedge budget is spent."""
+    policy = warmed_up_policy()
+    policy.max_hedge_ratio = 0.0
+
+    def attempt(tried):
+        tried.append(len(tried))
+        time.sleep(0.1)
+        return len(tried)
+
+    assert policy.call(attempt) == 1
+    assert policy.stats()["fired"] == 0
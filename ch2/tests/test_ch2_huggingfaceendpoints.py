@@ -0,0 +1,258 @@
+import asyncio
+import gzip
+import json
+import threading
+import time
+import pytest
+from ..scripts.cache import ResponseCache
+from ..scripts.circuitbreaker import CircuitBreaker
+from ..scripts.concurrency import AdaptiveConcurrencyLimiter
+from ..scripts.errors import EndpointError, PermanentEndpointError, ResponseTooLargeError, TransientEndpointError
+from ..scripts.huggingfaceendpoints import InferenceEndpointAPI, AsyncInferenceEndpointAPI
+from .fake_endpoint import FakeEndpoint, echo_responder
+
+
+def test_run_returns_generated_text():
+    """Test that a TGI-style response is turned into replies."""
+    with FakeEndpoint() as endpoint:
+        with InferenceEndpointAPI(api_url=endpoint.url, api_key="key", parameters={"temperature": 0.01}) as llm:
+            result = llm.run("What is the capital of France?")
+
+    assert result == {"replies": ["echo: What is the capital of France?"]}
+    assert endpoint.requests[0]["headers"]["Authorization"] == "Bearer key"
+
+
+def test_connections_are_reused_across_runs():
+    """Test that consecutive runs share one pooled keep-alive connection."""
+    with FakeEndpoint() as endpoint:
+        with InferenceEndpointAPI(api_url=endpoint.url, api_key="key", parameters={}) as llm:
+            for _ in range(3):
+                llm.run("ping")
+
+    ports = {request["client_port"] for request in endpoint.requests}
+    assert len(ports) == 1, "All runs should go through the same connection."
+
+
+def test_close_releases_session():
+    """Test that closing the component drops the session and a new one is opened on demand."""
+    with FakeEndpoint() as endpoint:
+        llm = InferenceEndpointAPI(api_url=endpoint.url, api_key="key", parameters={})
+        llm.run("ping")
+        llm.close()
+        assert llm._session is None
+        llm.run("ping")
+        llm.close()
+
+    assert len({request["client_port"] for request in endpoint.requests}) == 2
+
+
+def test_failed_query_raises():
+    """Test that a non-200 answer raises."""
+    with FakeEndpoint(lambda path, payload: (400, {"error": "bad request"})) as endpoint:
+        with InferenceEndpointAPI(api_url=endpoint.url, api_key="key", parameters={}) as llm:
+            with pytest.raises(Exception, match="400"):
+                llm.run("ping")
+
+
+def test_html_error_page_is_not_decoded():
+    """Test that an error page is reported by its status, without trying to decode it as JSON."""
+    page = b"<html><body>" + b"x" * 200000 + b"</body></html>"
+    with FakeEndpoint(lambda path, payload: (404, page, {"Content-Type": "text/html"})) as endpoint:
+        with InferenceEndpointAPI(api_url=endpoint.url, api_key="key", parameters={}) as llm:
+            with pytest.raises(PermanentEndpointError, match="404") as error:
+                llm.run("ping")
+    assert len(error.value.body) < len(page), "Only the start of the error page should be kept"
+
+
+def test_invalid_json_raises():
+    """Test that a 200 answer that isn't JSON raises an EndpointError."""
+    with FakeEndpoint(lambda path, payload: (200, b"not json")) as endpoint:
+        with InferenceEndpointAPI(api_url=endpoint.url, api_key="key", parameters={}) as llm:
+            with pytest.raises(EndpointError, match="JSON"):
+                llm.run("ping")
+
+
+def test_response_size_limit():
+    """Test that answers over max_response_bytes are refused, in both sync and async modes."""
+    big = [{"generated_text": "x" * 10000}]
+    with FakeEndpoint(lambda path, payload: (200, big)) as endpoint:
+        with InferenceEndpointAPI(api_url=endpoint.url, api_key="key", parameters={}, max_response_bytes=1000) as llm:
+            with pytest.raises(ResponseTooLargeError):
+                llm.run("ping")
+
+        async def query(llm):
+            async with llm:
+                return await llm.run_async("ping")
+
+        llm = AsyncInferenceEndpointAPI(api_url=endpoint.url, api_key="key", parameters={}, max_response_bytes=1000)
+        with pytest.raises(ResponseTooLargeError):
+            asyncio.run(query(llm))
+
+
+def test_session_of_previous_loop_is_closed():
+    """Test that the aiohttp session of a finished event loop is closed when another loop takes over."""
+    with FakeEndpoint() as endpoint:
+        llm = AsyncInferenceEndpointAPI(api_url=endpoint.url, api_key="key", parameters={})
+        assert asyncio.run(llm.run_async("ping")) == {"replies": ["echo: ping"]}
+        first = llm._client_session
+
+        async def query_and_close():
+            async with llm:
+                return await llm.run_async("pong")
+
+        assert asyncio.run(query_and_close()) == {"replies": ["echo: pong"]}
+    assert first.closed
+
+
+def test_long_prompts_are_compressed():
+    """Test that request bodies over the threshold are gzipped and smaller ones are sent as is."""
+    long_prompt = "context " * 5000
+    with FakeEndpoint() as endpoint:
+        with InferenceEndpointAPI(api_url=endpoint.url, api_key="key", parameters={}, request_compression="gzip",
+                                  compression_threshold=1024) as llm:
+            assert llm.run(long_prompt)["replies"] == [f"echo: {long_prompt}"]
+            llm.run("short")
+
+    compressed, plain = endpoint.requests
+    assert compressed["headers"]["Content-Encoding"] == "gzip"
+    assert len(compressed["raw"]) < len(long_prompt) / 10
+    assert "Content-Encoding" not in plain["headers"]
+
+
+def test_compressed_responses_are_decoded():
+    """Test that compressed responses are asked for and decompressed."""
+    body = gzip.compress(json.dumps([{"generated_text": "Paris"}]).encode("utf-8"))
+    with FakeEndpoint(lambda path, payload: (200, body, {"Content-Encoding": "gzip"})) as endpoint:
+        with InferenceEndpointAPI(api_url=endpoint.url, api_key="key", parameters={}) as llm:
+            assert llm.run("capital?")["replies"] == ["Paris"]
+    assert "gzip" in endpoint.requests[0]["headers"]["Accept-Encoding"]
+
+
+def test_corrupt_compressed_response_is_transient_and_released():
+    """Test that a body failing to decompress raises TransientEndpointError and frees its slot and replica."""
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=2)
+    breaker = CircuitBreaker(min_calls=100)
+    with FakeEndpoint(lambda path, payload: (200, b"not gzip at all", {"Content-Encoding": "gzip"})) as endpoint:
+        with InferenceEndpointAPI(api_url=endpoint.url, api_key="key", parameters={}, concurrency_limiter=limiter,
+                                  circuit_breaker=breaker) as llm:
+            for _ in range(3):
+                with pytest.raises(TransientEndpointError):
+                    llm.run("capital?")
+            assert llm.replicas.replicas[0].in_flight == 0
+    assert limiter.in_flight == 0
+
+
+def test_run_batch_splits_prompts_and_keeps_order():
+    """Test that run_batch sends list-valued inputs in batches and returns replies in input order."""
+    prompts = [f"question {i}" for i in range(7)]
+    with FakeEndpoint() as endpoint:
+        with InferenceEndpointAPI(api_url=endpoint.url, api_key="key", parameters={}, batch_size=3) as llm:
+            result = llm.run_batch(prompts)
+
+    assert result["replies"] == [[f"echo: {prompt}"] for prompt in prompts]
+    assert len(endpoint.requests) == 3
+
+
+def test_run_batch_accepts_nested_generations():
+    """Test that one list of generations per input is also understood."""
+    def nested_responder(path, payload):
+        return 200, [[{"generated_text": item.upper()}] for item in payload["inputs"]]
+
+    with FakeEndpoint(nested_responder) as endpoint:
+        with InferenceEndpointAPI(api_url=endpoint.url, api_key="key", parameters={}) as llm:
+            result = llm.run_batch(["a", "b"])
+
+    assert result["replies"] == [["A"], ["B"]]
+
+
+def test_streaming_calls_back_with_chunks_as_they_arrive():
+    """Test that streaming mode decodes SSE events incrementally and returns the usual replies."""
+    first_chunk_seen = threading.Event()
+
+    def sse_responder(path, payload):
+        def events():
+            for i, text in enumerate(["Par", "is", "</s>"]):
+                token = {"id": i, "text": text, "logprob": -0.1, "special": text == "</s>"}
+                generated_text = "Paris" if text == "</s>" else None
+                yield f"data: {json.dumps({'token': token, 'generated_text': generated_text, 'details': None})}\n\n".encode()
+                # hold the stream open until the client has handled the first token
+                first_chunk_seen.wait(timeout=5)
+        return 200, events(), {"Content-Type": "text/event-stream"}
+
+    chunks = []
+
+    def callback(chunk):
+        chunks.append(chunk)
+        first_chunk_seen.set()
+
+    with FakeEndpoint(sse_responder) as endpoint:
+        with InferenceEndpointAPI(api_url=endpoint.url, api_key="key", parameters={}, streaming_callback=callback) as llm:
+            result = llm.run("What is the capital of France?")
+
+    assert result == {"replies": ["Paris"]}
+    assert [chunk.content for chunk in chunks] == ["Par", "is"]
+    assert endpoint.requests[0]["path"] == "/generate_stream"
+
+
+def test_truncated_stream_event_is_transient():
+    """Test that a stream cut off in the middle of an event raises TransientEndpointError."""
+    def responder(path, payload):
+        body = b'data: {"token": {"text": "Par", "special": false}}\n\ndata: {"token": {"te'
+        return 200, body, {"Content-Type": "text/event-stream"}
+
+    with FakeEndpoint(responder) as endpoint:
+        with InferenceEndpointAPI(api_url=endpoint.url, api_key="key", parameters={},
+                                  streaming_callback=lambda chunk: None) as llm:
+            with pytest.raises(TransientEndpointError, match="Malformed streaming event"):
+                llm.run("ping")
+
+
+def test_run_async_streams_with_a_callback():
+    """Test that run_async streams when given a callback, and hands cached replies to it too."""
+    def responder(path, payload):
+        events = [b'data: {"token": {"text": "Par", "special": false}}\n\n',
+                  b'data: {"token": {"text": "is", "special": false}, "generated_text": "Paris"}\n\n']
+        return 200, iter(events), {"Content-Type": "text/event-stream"}
+
+    chunks = []
+    with FakeEndpoint(responder) as endpoint:
+        llm = AsyncInferenceEndpointAPI(api_url=endpoint.url, api_key="key", parameters={}, cache=ResponseCache(),
+                                        streaming_callback=chunks.append)
+
+        async def query():
+            async with llm:
+                return [await llm.run_async("ping"), await llm.run_async("ping")]
+
+        assert asyncio.run(query()) == [{"replies": ["Paris"]}] * 2
+    assert [chunk.content for chunk in chunks] == ["Par", "is", "Paris"]
+    assert [request["path"] for request in endpoint.requests] == ["/generate_stream"]
+
+
+def test_run_async_bounds_concurrency():
+    """Test that run_async keeps many prompts in flight, but never more than max_concurrency."""
+    lock = threading.Lock()
+    in_flight = {"now": 0, "peak": 0}
+
+    def slow_responder(path, payload):
+        with lock:
+            in_flight["now"] += 1
+            in_flight["peak"] = max(in_flight["peak"], in_flight["now"])
+        time.sleep(0.1)
+        with lock:
+            in_flight["now"] -= 1
+        return echo_responder(path, payload)
+
+    async def ask_all(llm, prompts):
+        async with llm:
+            return await asyncio.gather(*(llm.run_async(prompt) for prompt in prompts))
+
+    prompts = [f"question {i}" for i in range(20)]
+    with FakeEndpoint(slow_responder) as endpoint:
+        llm = AsyncInferenceEndpointAPI(api_url=endpoint.url, api_key="key", parameters={}, max_concurrency=5)
+        start = time.monotonic()
+        results = asyncio.run(ask_all(llm, prompts))
+        elapsed = time.monotonic() - start
+
+    assert [result["replies"][0] for result in results] == [f"echo: {prompt}" for prompt in prompts]
+    assert in_flight["peak"] == 5
+    assert elapsed < 20 * 0.1, "Requests should overlap instead of running one after another."
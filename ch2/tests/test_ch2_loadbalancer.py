@@ -0,0 +1,91 @@
+import time
+import threading
+from ..scripts.loadbalancer import ReplicaPool
+from ..scripts.huggingfaceendpoints import InferenceEndpointAPI
+from .fake_endpoint import FakeEndpoint
+
+
+def test_least_outstanding_picks_idle_replica():
+    """Test that a new request goes to the replica with the fewest requests in flight."""
+    pool = ReplicaPool(["http://a", "http://b"])
+    first = pool.acquire()
+    second = pool.acquire()
+    assert {first.url, second.url} == {"http://a", "http://b"}
+    pool.release(first, latency=0.1)
+    assert pool.acquire() is first
+
+
+def test_latency_strategy_prefers_fast_replica():
+    """Test that the replica with the lowest moving-average latency is preferred."""
+    pool = ReplicaPool(["http://slow", "http://fast"], strategy="latency")
+    for replica, latency in zip(pool.replicas, (1.0, 0.1)):
+        pool.release(pool.acquire(exclude=[r for r in pool.replicas if r is not replica]), latency=latency)
+    assert [pool.replicas[0].latency, pool.replicas[1].latency] == [1.0, 0.1]
+    assert pool.acquire().url == "http://fast"
+
+
+def test_failing_replica_is_ejected_and_readmitted():
+    """Test ejection after consecutive failures and re-admission after the cooldown once healthy."""
+    healthy = {"http://a": False}
+    pool = ReplicaPool(["http://a", "http://b"], failure_threshold=2, cooldown=0.05,
+                       health_check=lambda url: healthy.get(url, True))
+    a = pool.replicas[0]
+    for _ in range(2):
+        pool.release(pool.acquire(exclude=[pool.replicas[1]]), failed=True)
+    assert a.ejected_until is not None
+    assert all(pool.acquire().url == "http://b" for _ in range(3))
+
+    time.sleep(0.1)
+    pool.acquire()
+    assert a.ejected_until is not None, "An unhealthy replica should stay ejected."
+
+    healthy["http://a"] = True
+    time.sleep(0.1)
+    pool.acquire()
+    assert a.ejected_until is None
+
+
+def test_only_one_caller_probes_an_ejected_replica():
+    """Test that concurrent callers don't all wait on the health check of the same replica."""
+    probes = []
+    probing = threading.Event()
+    proceed = threading.Event()
+
+    def health_check(url):
+        probes.append(url)
+        probing.set()
+        proceed.wait(5)
+        return True
+
+    pool = ReplicaPool(["http://a", "http://b"], failure_threshold=1, cooldown=0.05, health_check=health_check)
+    a = pool.replicas[0]
+    pool.release(pool.acquire(exclude=[pool.replicas[1]]), failed=True)
+    time.sleep(0.1)
+
+    prober = threading.Thread(target=pool.acquire)
+    prober.start()
+    assert probing.wait(5)
+    assert all(pool.acquire().url == "http://b" for _ in range(3)), "Other callers should not wait on the probe."
+    proceed.set()
+    prober.join(5)
+    assert probes == ["http://a"]
+    assert a.ejected_until is None
+
+
+def test_endpoint_spreads_requests_and_skips_dead_replica():
+    """Test that the component balances over replicas and stops sending to one that fails."""
+    def broken(path, payload):
+        return 500, {"error": "boom"}
+
+    with FakeEndpoint() as first, FakeEndpoint() as second, FakeEndpoint(broken) as dead:
+        llm = InferenceEndpointAPI(api_url=[first.url, second.url, dead.url], api_key="key", parameters={},
+                                   replica_cooldown=60)
+        for _ in range(30):
+            try:
+                llm.run("ping")
+            except Exception:
+                pass
+        llm.close()
+
+    assert len(dead.requests) == 3, "The dead replica should be ejected after three failures."
+    assert len(first.requests) > 5 and len(second.requests) > 5
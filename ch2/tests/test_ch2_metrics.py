@@ -0,0 +1,86 @@
+import json
+import urllib.request
+from ..scripts.metrics import EndpointMetrics, MetricsRegistry, start_metrics_server
+from ..scripts.huggingfaceendpoints import InferenceEndpointAPI
+from ..scripts.pipelines import initialize_simple_pipeline
+from ..scripts.retry import RetryPolicy
+from .fake_endpoint import FakeEndpoint, echo_responder
+
+
+def test_registry_renders_prometheus_text():
+    """Test the text exposition format of counters, gauges and histograms."""
+    registry = MetricsRegistry()
+    registry.counter("requests_total", "Requests.", ("status",)).inc(status="200")
+    registry.gauge("in_flight", "In flight.").set(3)
+    histogram = registry.histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+
+    text = registry.render()
+    assert '# TYPE requests_total counter\nrequests_total{status="200"} 1.0' in text
+    assert "in_flight 3.0" in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 2' in text
+    assert "latency_seconds_count 2" in text
+    assert registry.counter("requests_total", "Requests.", ("status",)).value(status="200") == 1.0
+
+
+def test_endpoint_requests_are_recorded():
+    """Test that status, latency, sizes, retries and in-flight requests are recorded."""
+    answers = iter([(503, {"error": "loading"}, {"Retry-After": "0"})])
+
+    def responder(path, payload):
+        return next(answers, None) or echo_responder(path, payload)
+
+    metrics = EndpointMetrics()
+    with FakeEndpoint(responder) as endpoint:
+        policy = RetryPolicy(base_delay=0.01)
+        with InferenceEndpointAPI(endpoint.url, "key", {}, retry_policy=policy, metrics=metrics) as llm:
+            llm.run("ping")
+
+    url = endpoint.url
+    assert metrics.requests.value(endpoint=url, status="503") == 1
+    assert metrics.requests.value(endpoint=url, status="200") == 1
+    assert metrics.retries.value() == 1
+    assert metrics.latency.count(endpoint=url) == 2
+    assert metrics.in_flight.value(endpoint=url) == 0
+    assert metrics.request_bytes.value(endpoint=url) == sum(len(request["raw"]) for request in endpoint.requests)
+    assert metrics.response_bytes.value(endpoint=url) > 0
+
+
+def test_streaming_records_time_to_first_token():
+    """Test that streamed generations record the time to first token and their token rate."""
+    def sse_responder(path, payload):
+        def events():
+            for i, text in enumerate(["Par", "is"]):
+                token = {"id": i, "text": text, "special": False}
+                yield f"data: {json.dumps({'token': token})}\n\n".encode()
+        return 200, events(), {"Content-Type": "text/event-stream"}
+
+    metrics = EndpointMetrics()
+    with FakeEndpoint(sse_responder) as endpoint:
+        with InferenceEndpointAPI(endpoint.url, "key", {}, streaming_callback=lambda chunk: None,
+                                  metrics=metrics) as llm:
+            llm.run("capital?")
+    assert metrics.time_to_first_token.count(endpoint=endpoint.url) == 1
+    assert metrics.requests.value(endpoint=endpoint.url, status="200") == 1
+
+
+def test_metrics_server_and_instrumented_pipeline():
+    """Test that the generators of a pipeline are recorded and served over HTTP."""
+    registry = MetricsRegistry()
+    server = start_metrics_server(registry, port=0)
+    try:
+        with FakeEndpoint() as endpoint:
+            llm = InferenceEndpointAPI(endpoint.url, "key", {}, metrics=EndpointMetrics(registry))
+            pipeline = initialize_simple_pipeline(llm, "llm", "Say {{ word }}", metrics_registry=registry)
+            assert pipeline.run({"prompt_builder": {"word": "hi"}})["llm"]["replies"] == ["echo: Say hi"]
+            llm.close()
+        host, port = server.server_address
+        with urllib.request.urlopen(f"http://{host}:{port}/metrics") as response:
+            text = response.read().decode("utf-8")
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert 'llm_generator_runs_total{component="llm",outcome="ok"} 1.0' in text
+    assert f'llm_endpoint_requests_total{{endpoint="{endpoint.url}",status="200"}} 1.0' in text
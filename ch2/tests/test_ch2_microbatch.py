@@ -0,0 +1,66 @@
+import json
+import threading
+import pytest
+from ..scripts.microbatch import MicroBatcher
+from ..scripts.huggingfaceendpoints import InferenceEndpointAPI
+from .fake_endpoint import FakeEndpoint
+
+
+def run_concurrently(func, args):
+    """Call func with every argument from its own thread, returning the results in order."""
+    results = [None] * len(args)
+
+    def call(index):
+        results[index] = func(args[index])
+
+    threads = [threading.Thread(target=call, args=(index,)) for index in range(len(args))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_prompts_are_merged_into_batches():
+    """Test that prompts submitted together are sent as batches of at most max_batch_size."""
+    batches = []
+
+    def send_batch(prompts):
+        batches.append(list(prompts))
+        return [prompt.upper() for prompt in prompts]
+
+    batcher = MicroBatcher(send_batch, max_batch_size=4, max_wait=0.05)
+    prompts = [f"prompt {i}" for i in range(10)]
+    results = run_concurrently(batcher, prompts)
+    batcher.close()
+
+    assert results == [prompt.upper() for prompt in prompts]
+    assert all(len(batch) <= 4 for batch in batches)
+    assert len(batches) < len(prompts)
+    assert sorted(prompt for batch in batches for prompt in batch) == sorted(prompts)
+
+
+def test_batch_errors_reach_every_caller():
+    """Test that each caller of a failed batch gets the error."""
+    def send_batch(prompts):
+        raise RuntimeError("endpoint down")
+
+    batcher = MicroBatcher(send_batch, max_batch_size=4, max_wait=0.05)
+    futures = [batcher.submit(f"prompt {i}") for i in range(3)]
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result()
+    batcher.close()
+
+
+def test_endpoint_micro_batches_concurrent_runs():
+    """Test that concurrent run calls reach the endpoint as list-valued batched requests."""
+    prompts = [f"question {i}" for i in range(16)]
+    with FakeEndpoint() as endpoint:
+        with InferenceEndpointAPI(api_url=endpoint.url, api_key="key", parameters={}, micro_batch_size=8,
+                                  micro_batch_wait=0.05) as llm:
+            results = run_concurrently(llm.run, prompts)
+
+    assert [result["replies"] for result in results] == [[f"echo: {prompt}"] for prompt in prompts]
+    assert len(endpoint.requests) < len(prompts)
+    assert all(isinstance(json.loads(request["raw"])["inputs"], list) for request in endpoint.requests)
@@ -0,0 +1,119 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from haystack.preview import component
+from ..scripts.errors import TransientEndpointError
+from ..scripts.huggingfaceendpoints import InferenceEndpointAPI
+from ..scripts.pipelines import PipelineCache, ThreadSafePipeline, initialize_simple_pipeline, run_many
+from .fake_endpoint import FakeEndpoint, echo_responder
+from .test_ch2_ratelimit import EchoGenerator
+
+
+@component
+class SlowEchoGenerator:
+    """Generator answering every prompt with itself after a short pause, so that runs overlap."""
+
+    @component.output_types(replies=List[str])
+    def run(self, prompt: str):
+        time.sleep(0.01)
+        return {"replies": [prompt]}
+
+
+@component
+class PickyGenerator:
+    """Generator echoing every prompt, failing on the ones containing 'boom'."""
+
+    @component.output_types(replies=List[str])
+    def run(self, prompt: str):
+        if "boom" in prompt:
+            raise ValueError("boom")
+        return {"replies": [prompt]}
+
+
+def test_cache_returns_the_same_pipeline():
+    """Test that a pipeline is built once per template and generator."""
+    cache = PipelineCache()
+    generator = EchoGenerator()
+    pipeline = cache.get(generator, "echo", "Say {{ word }}")
+    assert cache.get(generator, "echo", "Say {{ word }}") is pipeline
+    assert cache.get(EchoGenerator(), "echo", "Say {{ word }}") is not pipeline
+    assert cache.get(generator, "echo", "Tell {{ word }}") is not pipeline
+    assert isinstance(pipeline, ThreadSafePipeline)
+    assert pipeline.run({"prompt_builder": {"word": "hi"}})["echo"]["replies"] == ["Say hi"]
+    assert cache.stats() == {"hits": 1, "misses": 3, "evictions": 0, "entries": 3}
+
+
+def test_cache_evicts_least_recently_used():
+    """Test that the cache stays bounded and keeps the pipelines used last."""
+    cache = PipelineCache(max_entries=2)
+    generator = EchoGenerator()
+    first = cache.get(generator, "echo", "a {{ word }}")
+    cache.get(generator, "echo", "b {{ word }}")
+    cache.get(generator, "echo", "a {{ word }}")
+    cache.get(generator, "echo", "c {{ word }}")
+    assert cache.get(generator, "echo", "a {{ word }}") is first
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["entries"] == 2
+
+
+def test_invalidate_by_template_or_generator():
+    """Test that invalidation drops the matching pipelines only."""
+    cache = PipelineCache()
+    generator, other = EchoGenerator(), EchoGenerator()
+    cache.get(generator, "echo", "a {{ word }}")
+    cache.get(generator, "echo", "b {{ word }}")
+    pipeline = cache.get(other, "echo", "a {{ word }}")
+    assert cache.invalidate(llm_generator=generator) == 2
+    assert cache.get(other, "echo", "a {{ word }}") is pipeline
+    assert cache.invalidate(prompt_template="a {{ word }}") == 1
+    cache.clear()
+    assert cache.stats()["entries"] == 0
+
+
+def test_cached_pipeline_runs_concurrently():
+    """Test that concurrent runs of one pipeline don't trip over each other's loop counts."""
+    pipeline = PipelineCache().get(SlowEchoGenerator(), "echo", "Say {{ word }}")
+    pipeline.max_loops_allowed = 1
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda i: pipeline.run({"prompt_builder": {"word": str(i)}}), range(32)))
+    assert [result["echo"]["replies"] for result in results] == [[f"Say {i}"] for i in range(32)]
+
+
+def test_run_many_keeps_order_and_collects_errors():
+    """Test that run_many returns outputs in input order, with the failures in place."""
+    pipeline = initialize_simple_pipeline(PickyGenerator(), "picky", "Say {{ word }}")
+    inputs = [{"word": str(i)} for i in range(20)] + [{"word": "boom"}, {"other": "x"}]
+    results = run_many(pipeline, inputs, max_workers=4)
+    assert [result["picky"]["replies"] for result in results[:20]] == [[f"Say {i}"] for i in range(20)]
+    assert isinstance(results[20], ValueError)
+    assert "word" in str(results[21])
+
+
+def test_run_many_sends_batches():
+    """Test that batch-capable generators get the prompts in batches, a failing batch being sent one by one."""
+    def responder(path, payload):
+        inputs = payload["inputs"] if isinstance(payload["inputs"], list) else [payload["inputs"]]
+        if any("boom" in item for item in inputs):
+            return 400, {"error": "boom"}
+        return echo_responder(path, payload)
+
+    with FakeEndpoint(responder) as endpoint:
+        with InferenceEndpointAPI(endpoint.url, "key", {}, batch_size=4) as llm:
+            pipeline = PipelineCache().get(llm, "llm", "Say {{ word }}")
+            words = ["a", "b", "c", "d", "e", "boom", "f"]
+            results = run_many(pipeline, [{"word": word} for word in words])
+    assert [result["llm"]["replies"] for result in results if not isinstance(result, Exception)] == \
+        [[f"echo: Say {word}"] for word in words if word != "boom"]
+    assert isinstance(results[5], Exception)
+    # one batch of 4, the failed batch of 3, then its prompts one by one
+    assert len(endpoint.requests) == 5
+
+
+def test_run_many_does_not_split_batches_on_transient_errors():
+    """Test that a batch failing on a down endpoint is not sent again prompt by prompt."""
+    with FakeEndpoint(lambda path, payload: (503, {"error": "down"})) as endpoint:
+        with InferenceEndpointAPI(endpoint.url, "key", {}, batch_size=4) as llm:
+            pipeline = PipelineCache().get(llm, "llm", "Say {{ word }}")
+            results = run_many(pipeline, [{"word": str(i)} for i in range(8)])
+    assert all(isinstance(result, TransientEndpointError) for result in results)
+    assert len(endpoint.requests) == 2
@@ -0,0 +1,77 @@
+import threading
+import time
+from typing import List
+from haystack.preview import component
+from ..scripts.ratelimit import RateLimiter, estimate_tokens
+from ..scripts.pipelines import initialize_simple_pipeline
+from ..scripts.huggingfaceendpoints import InferenceEndpointAPI
+from .fake_endpoint import FakeEndpoint
+
+
+@component
+class EchoGenerator:
+    """Generator answering every prompt with itself, recording when it was called."""
+
+    def __init__(self):
+        self.calls = []
+
+    @component.output_types(replies=List[str])
+    def run(self, prompt: str):
+        self.calls.append(time.monotonic())
+        return {"replies": [prompt]}
+
+
+def test_estimate_tokens():
+    """Test the token estimate of a prompt and its generation budget."""
+    assert estimate_tokens("a" * 40, {"max_new_tokens": 20}) == 30
+    assert estimate_tokens(["a" * 40, "b" * 40], {"max_length": 100}) == 220
+
+
+def test_requests_per_second_queues_callers():
+    """Test that requests over the rate wait for their turn."""
+    limiter = RateLimiter(requests_per_second=20, request_burst=1)
+    start = time.monotonic()
+    for _ in range(5):
+        limiter.acquire()
+    assert time.monotonic() - start >= 4 / 20 * 0.9
+
+
+def test_tokens_per_minute_queues_callers():
+    """Test that a query over the token budget waits until enough tokens are refilled."""
+    limiter = RateLimiter(tokens_per_minute=600, token_burst=10)
+    assert limiter.reserve(10) == 0
+    assert abs(limiter.reserve(5) - 0.5) < 0.05
+
+
+def test_limiter_is_shared_across_components_and_threads():
+    """Test that two endpoint components sharing a limiter are throttled together."""
+    limiter = RateLimiter(requests_per_second=20, request_burst=1)
+    with FakeEndpoint() as endpoint:
+        llms = [InferenceEndpointAPI(api_url=endpoint.url, api_key="key", parameters={}, rate_limiter=limiter)
+                for _ in range(2)]
+        threads = [threading.Thread(target=llm.run, args=("ping",)) for llm in llms for _ in range(3)]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - start
+        for llm in llms:
+            llm.close()
+
+    assert len(endpoint.requests) == 6
+    assert elapsed >= 5 / 20 * 0.9
+
+
+def test_simple_pipelines_share_a_limiter():
+    """Test that pipelines built with the same limiter are throttled together."""
+    limiter = RateLimiter(requests_per_second=20, request_burst=1)
+    generators = [EchoGenerator(), EchoGenerator()]
+    pipelines = [initialize_simple_pipeline(generator, "echo_generator", "Question: {{question}}",
+                                            rate_limiter=limiter) for generator in generators]
+    for pipeline in pipelines * 2:
+        result = pipeline.run({"prompt_builder": {"question": "ping"}})
+        assert result["echo_generator"]["replies"] == ["Question: ping"]
+
+    calls = sorted(generators[0].calls + generators[1].calls)
+    assert calls[-1] - calls[0] >= 3 / 20 * 0.9
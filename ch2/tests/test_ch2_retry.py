@@ -0,0 +1,99 @@
+import asyncio
+import time
+import pytest
+from ..scripts.errors import PermanentEndpointError, TransientEndpointError, error_from_response
+from ..scripts.retry import RetryPolicy
+from ..scripts.huggingfaceendpoints import InferenceEndpointAPI, AsyncInferenceEndpointAPI
+from .fake_endpoint import FakeEndpoint, echo_responder
+
+
+def failing_responder(failures, status=503, body=None, headers=None):
+    """Fail the first `failures` requests, then answer normally."""
+    calls = {"count": 0}
+
+    def responder(path, payload):
+        calls["count"] += 1
+        if calls["count"] <= failures:
+            return status, body or {"error": "Model is currently loading"}, dict(headers or {})
+        return echo_responder(path, payload)
+    return responder
+
+
+def test_error_classification():
+    """Test that throttling and loading errors are transient and carry how long to wait."""
+    loading = error_from_response(503, '{"error": "Model is currently loading", "estimated_time": 12.5}')
+    assert isinstance(loading, TransientEndpointError)
+    assert loading.retry_after == 12.5
+
+    throttled = error_from_response(429, "slow down", {"Retry-After": "3"})
+    assert isinstance(throttled, TransientEndpointError)
+    assert throttled.retry_after == 3.0
+
+    odd = error_from_response(503, '{"estimated_time": "soon"}', {})
+    assert isinstance(odd, TransientEndpointError)
+    assert odd.retry_after is None
+
+    assert isinstance(error_from_response(400, "bad request"), PermanentEndpointError)
+
+
+def test_delay_is_jittered_capped_and_honors_retry_after():
+    """Test the backoff delay bounds."""
+    policy = RetryPolicy(base_delay=1.0, max_delay=4.0)
+    error = TransientEndpointError("failed")
+    assert all(0 <= policy.compute_delay(10, error) <= 4.0 for _ in range(100))
+    assert policy.compute_delay(0, TransientEndpointError("failed", retry_after=7.0)) >= 7.0
+
+
+def test_transient_failures_are_retried():
+    """Test that the endpoint is queried again until it answers."""
+    with FakeEndpoint(failing_responder(2, headers={"Retry-After": "0"})) as endpoint:
+        policy = RetryPolicy(max_attempts=3, base_delay=0.01)
+        with InferenceEndpointAPI(api_url=endpoint.url, api_key="key", parameters={}, retry_policy=policy) as llm:
+            assert llm.run("ping") == {"replies": ["echo: ping"]}
+    assert len(endpoint.requests) == 3
+
+
+def test_retries_give_up_after_max_attempts():
+    """Test that the last transient failure is raised once attempts run out."""
+    with FakeEndpoint(failing_responder(5, status=429)) as endpoint:
+        policy = RetryPolicy(max_attempts=2, base_delay=0.01)
+        with InferenceEndpointAPI(api_url=endpoint.url, api_key="key", parameters={}, retry_policy=policy) as llm:
+            with pytest.raises(TransientEndpointError) as error:
+                llm.run("ping")
+    assert error.value.status_code == 429
+    assert len(endpoint.requests) == 2
+
+
+def test_time_budget_stops_retries():
+    """Test that no retry is attempted when its delay would overrun the time budget."""
+    with FakeEndpoint(failing_responder(5, headers={"Retry-After": "10"})) as endpoint:
+        policy = RetryPolicy(max_attempts=5, max_elapsed=1.0)
+        with InferenceEndpointAPI(api_url=endpoint.url, api_key="key", parameters={}, retry_policy=policy) as llm:
+            start = time.monotonic()
+            with pytest.raises(TransientEndpointError):
+                llm.run("ping")
+    assert time.monotonic() - start < 1.0
+    assert len(endpoint.requests) == 1
+
+
+def test_permanent_failures_are_not_retried():
+    """Test that a bad request fails on the first attempt."""
+    with FakeEndpoint(failing_responder(5, status=400, body={"error": "bad request"})) as endpoint:
+        with InferenceEndpointAPI(api_url=endpoint.url, api_key="key", parameters={},
+                                  retry_policy=RetryPolicy(base_delay=0.01)) as llm:
+            with pytest.raises(PermanentEndpointError):
+                llm.run("ping")
+    assert len(endpoint.requests) == 1
+
+
+def test_async_transient_failures_are_retried():
+    """Test that run_async retries as well."""
+    async def ask(llm):
+        async with llm:
+            return await llm.run_async("ping")
+
+    with FakeEndpoint(failing_responder(1, headers={"Retry-After": "0"})) as endpoint:
+        llm = AsyncInferenceEndpointAPI(api_url=endpoint.url, api_key="key", parameters={},
+                                        retry_policy=RetryPolicy(base_delay=0.01))
+        assert asyncio.run(ask(llm)) == {"replies": ["echo: ping"]}
+    assert len(endpoint.requests) == 2
@@ -0,0 +1,86 @@
+import time
+import asyncio
+import threading
+import pytest
+from ..scripts.errors import DeadlineExceededError
+from ..scripts.huggingfaceendpoints import InferenceEndpointAPI
+from ..scripts.scheduler import PriorityClass, PriorityScheduler
+from .fake_endpoint import FakeEndpoint
+
+
+def admission_order(scheduler, requests):
+    """Queue `requests` (class names) behind a held slot and return the order they are admitted in."""
+    order = []
+
+    async def request(name):
+        await scheduler.acquire_async(name)
+        order.append(name)
+        scheduler.release(name)
+
+    async def main():
+        scheduler.acquire()
+        tasks = [asyncio.ensure_future(request(name)) for name in requests]
+        await asyncio.sleep(0.01)
+        scheduler.release()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    return order
+
+
+def test_interactive_requests_jump_the_queue():
+    """Test that interactive requests are admitted before batch requests queued earlier."""
+    scheduler = PriorityScheduler(max_concurrency=1)
+    order = admission_order(scheduler, ["batch", "batch", "interactive", "batch", "interactive"])
+    assert order == ["interactive", "interactive", "batch", "batch", "batch"]
+
+
+def test_weighted_fair_queuing_within_a_tier():
+    """Test that classes of the same tier share the slots in proportion to their weight."""
+    scheduler = PriorityScheduler(max_concurrency=1, default_class="a",
+                                  classes={"a": PriorityClass(weight=3.0), "b": PriorityClass(weight=1.0)})
+    order = admission_order(scheduler, ["b"] * 8 + ["a"] * 8)
+    assert order[:8].count("a") == 6, order
+
+
+def test_class_cap_leaves_room_for_others():
+    """Test that a class at its own cap doesn't hold back the other classes."""
+    scheduler = PriorityScheduler(max_concurrency=4)
+    for _ in range(3):
+        scheduler.acquire("batch")
+    with pytest.raises(DeadlineExceededError):
+        scheduler.acquire("batch", deadline=time.time() + 0.05)
+    scheduler.acquire("interactive", deadline=time.time() + 0.05)
+    assert scheduler.stats()["batch"] == {"in_flight": 3, "waiting": 0, "served": 3}
+
+
+def test_batch_fills_idle_capacity_when_released():
+    """Test that a queued batch request runs as soon as a slot frees up."""
+    scheduler = PriorityScheduler(max_concurrency=1)
+    scheduler.acquire("interactive")
+    admitted = threading.Event()
+
+    def worker():
+        with scheduler.slot("batch"):
+            admitted.set()
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    assert not admitted.wait(0.05)
+    scheduler.release("interactive")
+    assert admitted.wait(5)
+    thread.join()
+    assert scheduler.in_flight == 0
+
+
+def test_endpoint_queries_go_through_the_scheduler():
+    """Test that run and run_batch take a slot of their priority class."""
+    scheduler = PriorityScheduler(max_concurrency=2)
+    with FakeEndpoint() as endpoint:
+        with InferenceEndpointAPI(endpoint.url, "key", {}, scheduler=scheduler, batch_size=2) as llm:
+            assert llm.run("ping", priority="interactive")["replies"] == ["echo: ping"]
+            llm.run_batch(["a", "b", "c"], priority="batch")
+    stats = scheduler.stats()
+    assert stats["interactive"]["served"] == 1
+    assert stats["batch"]["served"] == 2
+    assert scheduler.in_flight == 0
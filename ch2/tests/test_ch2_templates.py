@@ -0,0 +1,50 @@
+from haystack.preview.components.builders.prompt_builder import PromptBuilder
+from haystack.preview.dataclasses.chat_message import ChatMessage
+from ..scripts.pipelines import initialize_simple_pipeline
+from ..scripts.templates import CachedPromptBuilder, compile_template, render_batch
+from .test_ch2_ratelimit import EchoGenerator
+
+
+def test_templates_are_compiled_once():
+    """Test that builders with the same template share one compiled template."""
+    source = "Answer {{ question }} using {{ context }}"
+    first, second = CachedPromptBuilder(template=source), CachedPromptBuilder(template=source)
+    assert first.template is second.template
+    assert compile_template(source)[1] == {"question", "context"}
+    assert set(first.__canals_input__) == set(PromptBuilder(template=source).__canals_input__)
+
+
+def test_renders_like_prompt_builder():
+    """Test that static and chat templates render as with PromptBuilder."""
+    source = "{% for d in documents %}{{ d }} {% endfor %}{{ question }}"
+    variables = {"documents": ["a", "b"], "question": "why?"}
+    assert CachedPromptBuilder(template=source).run(**variables) == PromptBuilder(template=source).run(**variables)
+    messages = [ChatMessage.from_system("Be brief."), ChatMessage.from_user("Weather in {{ location }}?")]
+    prompt = CachedPromptBuilder(template_variables=["location"]).run(messages=messages, location="Berlin")["prompt"]
+    assert prompt[-1].content == "Weather in Berlin?"
+    assert prompt[0] is messages[0]
+
+
+def test_render_batch():
+    """Test that one template renders against many variable sets in order."""
+    variables = [{"word": word} for word in ["a", "b", "c"]]
+    assert render_batch("Say {{ word }}", variables) == ["Say a", "Say b", "Say c"]
+    assert CachedPromptBuilder(template="Say {{ word }}").render_batch(variables) == ["Say a", "Say b", "Say c"]
+
+
+def test_simple_pipeline_uses_cached_templates():
+    """Test that pipelines built from the same template share its compiled version."""
+    pipelines = [initialize_simple_pipeline(EchoGenerator(), "echo", "Say {{ word }}") for _ in range(2)]
+    builders = [pipeline.get_component("prompt_builder") for pipeline in pipelines]
+    assert builders[0].template is builders[1].template
+    assert pipelines[0].run({"prompt_builder": {"word": "hi"}})["echo"]["replies"] == ["Say hi"]
+
+
+def test_chat_messages_stay_out_of_the_shared_cache():
+    """Test that user message templates don't take entries from the cache of builder templates."""
+    builder = CachedPromptBuilder(template_variables=["name"])
+    before = compile_template.cache_info()
+    for i in range(10):
+        messages = [ChatMessage.from_user(f"Message {i} for {{{{ name }}}}")]
+        assert builder.run(messages=messages, name="Ada")["prompt"][-1].content == f"Message {i} for Ada"
+    assert compile_template.cache_info() == before
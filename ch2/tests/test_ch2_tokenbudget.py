@@ -0,0 +1,66 @@
+import json
+import pytest
+from ..scripts.huggingfaceendpoints import InferenceEndpointAPI
+from ..scripts.tokenbudget import PromptTooLongError, TokenBudget
+from ..scripts.vllmendpoints import VLLMEndpointAPI
+from .fake_endpoint import FakeEndpoint
+from .test_ch2_vllmendpoints import openai_responder
+
+
+class WhitespaceTokenizer:
+    """One token per word, counting how many texts were encoded."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, text):
+        self.calls += 1
+        return text.split()
+
+    def decode(self, ids):
+        return " ".join(ids)
+
+
+def test_too_long_prompt_is_rejected_before_sending():
+    """Test that the reject policy raises PromptTooLongError without querying the endpoint."""
+    budget = TokenBudget(WhitespaceTokenizer(), context_window=4)
+    with FakeEndpoint() as endpoint:
+        with InferenceEndpointAPI(endpoint.url, "key", {}, token_budget=budget) as llm:
+            with pytest.raises(PromptTooLongError):
+                llm.run("one two three four")
+            with pytest.raises(PromptTooLongError):
+                llm.run_batch(["short", "one two three four five"])
+            assert llm.run("one two three")["replies"] == ["echo: one two three"]
+    assert len(endpoint.requests) == 1
+
+
+def test_truncation_keeps_the_end_of_the_prompt():
+    """Test that the truncate policy drops the start of the prompt and lowers max_new_tokens."""
+    budget = TokenBudget(WhitespaceTokenizer(), context_window=5, policy="truncate", min_new_tokens=2)
+    with FakeEndpoint() as endpoint:
+        with InferenceEndpointAPI(endpoint.url, "key", {"max_new_tokens": 10}, token_budget=budget) as llm:
+            assert llm.run("a b c d e f")["replies"] == ["echo: d e f"]
+            assert llm.parameters == {"max_new_tokens": 10}
+    assert json.loads(endpoint.requests[0]["raw"])["parameters"] == {"max_new_tokens": 2}
+
+
+def test_max_length_and_counts_cache():
+    """Test that max_length narrows the window and that token counts are computed once per prompt."""
+    tokenizer = WhitespaceTokenizer()
+    budget = TokenBudget(tokenizer, context_window=100)
+    prompt, parameters = budget.fit("a b c", {"max_length": 8, "max_new_tokens": 20})
+    assert parameters["max_new_tokens"] == 5
+    unchanged = {"max_new_tokens": 4}
+    assert budget.fit("a b c", unchanged)[1] is unchanged
+    assert tokenizer.calls == 1
+    with pytest.raises(PromptTooLongError):
+        budget.fit(["a", "b c d e f g h i"], {"max_length": 8})
+
+
+def test_vllm_lowers_max_tokens():
+    """Test that VLLMEndpointAPI fits max_tokens to the longest prompt of a batch."""
+    budget = TokenBudget(WhitespaceTokenizer(), context_window=6)
+    with FakeEndpoint(openai_responder) as endpoint:
+        with VLLMEndpointAPI(endpoint.url, "mistral", {"max_tokens": 16}, token_budget=budget) as llm:
+            llm.run_batch(["a", "b c d"])
+    assert json.loads(endpoint.requests[0]["raw"])["max_tokens"] == 3
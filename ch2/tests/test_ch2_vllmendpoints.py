@@ -0,0 +1,133 @@
+import json
+import threading
+import time
+from ..scripts.cache import ResponseCache
+from ..scripts.coalescing import SingleFlight
+from ..scripts.vllmendpoints import VLLMEndpointAPI
+from ..scripts.pipelines import initialize_simple_pipeline
+from .fake_endpoint import FakeEndpoint
+
+
+def openai_responder(path, payload):
+    """Answer like the OpenAI-compatible server of vLLM, with `n` numbered replies per prompt."""
+    n = payload.get("n", 1)
+    if path == "/v1/chat/completions":
+        prompts = [payload["messages"][-1]["content"]]
+    else:
+        prompts = payload["prompt"] if isinstance(payload["prompt"], list) else [payload["prompt"]]
+    texts = [f"{prompt} #{i}" for prompt in prompts for i in range(n)]
+    if payload.get("stream"):
+        def events():
+            for index, text in enumerate(texts):
+                for word in text.split(" "):
+                    choice = {"index": index, "finish_reason": None}
+                    if path == "/v1/chat/completions":
+                        choice["delta"] = {"content": word + " "}
+                    else:
+                        choice["text"] = word + " "
+                    yield f"data: {json.dumps({'model': payload['model'], 'choices': [choice]})}\n\n".encode()
+            yield b"data: [DONE]\n\n"
+        return 200, events(), {"Content-Type": "text/event-stream"}
+    if path == "/v1/chat/completions":
+        choices = [{"index": i, "message": {"role": "assistant", "content": text}} for i, text in enumerate(texts)]
+    else:
+        choices = [{"index": i, "text": text} for i, text in enumerate(texts)]
+    usage = {"prompt_tokens": 3 * len(prompts), "completion_tokens": 2 * len(texts),
+             "total_tokens": 3 * len(prompts) + 2 * len(texts)}
+    # vLLM does not promise to list the choices in order
+    return 200, {"model": payload["model"], "choices": choices[::-1], "usage": usage}
+
+
+def test_run_queries_completions():
+    """Test that a prompt is sent to /v1/completions and the usage is added up."""
+    with FakeEndpoint(openai_responder) as endpoint:
+        with VLLMEndpointAPI(endpoint.url, "mistral", {"max_tokens": 16}) as llm:
+            assert llm.run("Hello")["replies"] == ["Hello #0"]
+            llm.run("Hello")
+            assert llm.usage == {"prompt_tokens": 6, "completion_tokens": 4, "total_tokens": 10}
+    request = endpoint.requests[0]
+    assert request["path"] == "/v1/completions"
+    assert json.loads(request["raw"]) == {"model": "mistral", "max_tokens": 16, "prompt": "Hello"}
+
+
+def test_run_batch_sends_list_prompt_with_n_replies():
+    """Test that run_batch sends list-valued prompts and groups the `n` choices of every prompt."""
+    with FakeEndpoint(openai_responder) as endpoint:
+        with VLLMEndpointAPI(endpoint.url, "mistral", {"n": 2}, batch_size=3) as llm:
+            replies = llm.run_batch(["a", "b", "c", "d"])["replies"]
+    assert replies == [["a #0", "a #1"], ["b #0", "b #1"], ["c #0", "c #1"], ["d #0", "d #1"]]
+    assert [json.loads(request["raw"])["prompt"] for request in endpoint.requests] == [["a", "b", "c"], ["d"]]
+
+
+def test_chat_mode_sends_messages():
+    """Test that chat mode sends a system and a user message to /v1/chat/completions."""
+    with FakeEndpoint(openai_responder) as endpoint:
+        with VLLMEndpointAPI(endpoint.url, "mistral", chat=True, system_prompt="Be brief.") as llm:
+            assert llm.run("Hi")["replies"] == ["Hi #0"]
+            assert llm.run_batch(["a", "b"])["replies"] == [["a #0"], ["b #0"]]
+    payload = json.loads(endpoint.requests[0]["raw"])
+    assert endpoint.requests[0]["path"] == "/v1/chat/completions"
+    assert payload["messages"] == [{"role": "system", "content": "Be brief."}, {"role": "user", "content": "Hi"}]
+
+
+def test_chat_batches_are_sent_concurrently():
+    """Test that the prompts of a chat batch are sent at the same time, at most batch_size of them."""
+    in_flight, peak = [0], [0]
+    lock = threading.Lock()
+
+    def responder(path, payload):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        time.sleep(0.1)
+        with lock:
+            in_flight[0] -= 1
+        return openai_responder(path, payload)
+
+    with FakeEndpoint(responder) as endpoint:
+        with VLLMEndpointAPI(endpoint.url, "mistral", chat=True, batch_size=3) as llm:
+            replies = llm.run_batch(["a", "b", "c", "d", "e", "f"])["replies"]
+    assert replies == [["a #0"], ["b #0"], ["c #0"], ["d #0"], ["e #0"], ["f #0"]]
+    assert peak[0] == 3
+
+
+def test_generators_with_different_requests_share_no_replies():
+    """Test that the cache and the coalescer key on the request body, system prompt and route included."""
+    def responder(path, payload):
+        system = payload["messages"][0]["content"] if "messages" in payload else "plain"
+        return 200, {"model": payload["model"], "choices": [{"index": 0, "text": system,
+                                                             "message": {"content": system}}]}
+
+    cache, coalescer = ResponseCache(), SingleFlight()
+    with FakeEndpoint(responder) as endpoint:
+        settings = {"cache": cache, "coalescer": coalescer}
+        generators = [VLLMEndpointAPI(endpoint.url, "mistral", {"temperature": 0}, chat=True,
+                                      system_prompt="Answer in French", **settings),
+                      VLLMEndpointAPI(endpoint.url, "mistral", {"temperature": 0}, chat=True,
+                                      system_prompt="Answer in Spanish", **settings),
+                      VLLMEndpointAPI(endpoint.url, "mistral", {"temperature": 0}, **settings)]
+        replies = [llm.run("Hi")["replies"] for llm in generators]
+        assert [llm.run("Hi")["replies"] for llm in generators] == replies
+    assert replies == [["Answer in French"], ["Answer in Spanish"], ["plain"]]
+    assert len(endpoint.requests) == 3
+
+
+def test_streaming_completions():
+    """Test that streamed choices are passed to the callback and joined per choice."""
+    chunks = []
+    with FakeEndpoint(openai_responder) as endpoint:
+        with VLLMEndpointAPI(endpoint.url, "mistral", {"n": 2}, streaming_callback=chunks.append) as llm:
+            replies = llm.run("Hello there")["replies"]
+    assert replies == ["Hello there #0 ", "Hello there #1 "]
+    assert [chunk.content for chunk in chunks if chunk.metadata["index"] == 1] == ["Hello ", "there ", "#1 "]
+    assert json.loads(endpoint.requests[0]["raw"])["stream"] is True
+
+
+def test_drops_into_simple_pipeline():
+    """Test that the component can be used as the generator of the simple pipeline."""
+    with FakeEndpoint(openai_responder) as endpoint:
+        llm = VLLMEndpointAPI(endpoint.url, "mistral")
+        pipeline = initialize_simple_pipeline(llm, "vllm_generator", "Say {{ word }}")
+        result = pipeline.run({"prompt_builder": {"word": "hi"}})
+        llm.close()
+    assert result["vllm_generator"]["replies"] == ["Say hi #0"]